@@ -1,7 +1,7 @@
 # lotusrpg/__init__.py
 from flask import Flask, render_template
 from flask_sqlalchemy import SQLAlchemy
-from flask_security import Security, SQLAlchemyUserDatastore
+from flask_security import Security
 from flask_migrate import Migrate
 
 # Initialize extensions
@@ -20,18 +20,58 @@ def create_app(config_class='lotusrpg.config.Config'):
     # Import models here to avoid circular imports
     from lotusrpg.models import User, Role
     
-    # Setup Flask-Security
-    user_datastore = SQLAlchemyUserDatastore(db, User, Role)
+    # Setup Flask-Security, loading session users through the identity cache
+    from lotusrpg.identity import CachedUserDatastore, identity_cache
+    user_datastore = CachedUserDatastore(db, User, Role)
     security.init_app(app, user_datastore)
+    identity_cache.init_app(app)
+    
+    # Signed bearer tokens for clients that log in with mode=token
+    from lotusrpg import tokens
+    tokens.init_app(app, security)
+    
+    # Password hashing pool, using the context Flask-Security just built
+    from lotusrpg.passwords import hasher
+    hasher.init_app(app)
+    
+    # Rate limit buckets, in process or shared through Redis
+    from lotusrpg.ratelimit import limiter
+    limiter.init_app(app)
+    
+    # Dashboard counters, maintained by session listeners
+    from lotusrpg.stats import dashboard_stats
+    dashboard_stats.init_app(app)
     
     # Import and register API blueprint
     from lotusrpg.api import api_bp
     app.register_blueprint(api_bp)
     
+    # Periodic jobs (hot scores, ...) registered by the modules imported above
+    from lotusrpg import tasks
+    tasks.init_app(app)
+    
+    # Load the section title autocomplete index from its serialized form
+    from lotusrpg.rules.autocomplete import title_index
+    title_index.init_app(app)
+    
+    # Register CLI maintenance commands
+    from lotusrpg.commands import forum_cli, rules_cli, stats_cli, users_cli
+    app.cli.add_command(rules_cli)
+    app.cli.add_command(forum_cli)
+    app.cli.add_command(users_cli)
+    app.cli.add_command(stats_cli)
+    
     # Import and initialize WebSocket
     from lotusrpg.websockets import socketio
     socketio.init_app(app, async_mode='threading')
     
+    # Behind reverse proxies, take the client address from X-Forwarded-For.
+    # Wrapped last so socket connections see it too
+    proxies = app.config.get('PROXY_FIX_X_FOR', 0)
+    if proxies:
+        from werkzeug.middleware.proxy_fix import ProxyFix
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=proxies, x_proto=proxies)
+    
     # Note: All API routes are automatically registered through the api_bp blueprint
     # The routes in lotusrpg/api/* are imported by lotusrpg/api/__init__.py
     
@@ -1,11 +1,17 @@
 # lotusrpg/api/admin/routes.py
+from datetime import datetime
 from flask import request
 from flask_security import current_user
-from lotusrpg.models import User, Role, Post, Comment, Section, Content, db
+from lotusrpg.models import User, Role, Post, Comment, db
 from lotusrpg.schemas import user_schema, users_schema, PaginationSchema
 from lotusrpg.api.base import AdminResource, api_response, api_error
 from lotusrpg.api import api
 from lotusrpg.websockets import notify_admin_action
+from lotusrpg.forum import bump_forum, bump_users
+from lotusrpg.forum import counters, queries, reads, threads
+from lotusrpg.passwords import hasher
+from lotusrpg.identity import identity_cache
+from lotusrpg.stats import dashboard_stats
 from marshmallow import Schema, fields
 
 class UserRoleUpdateSchema(Schema):
@@ -14,19 +20,14 @@ class UserRoleUpdateSchema(Schema):
 class AdminDashboardResource(AdminResource):
     def get(self):
         """Get dashboard statistics"""
-        stats = {
-            'total_users': User.query.count(),
-            'total_sections': Section.query.count(),
-            'total_contents': Content.query.count(),
-            'total_posts': Post.query.count(),
-            'total_comments': Comment.query.count(),
-            'active_users': User.query.filter_by(active=True, is_banned=False).count(),
-            'banned_users': User.query.filter_by(is_banned=True).count(),
-            'locked_users': User.query.filter(User.lockout_until.isnot(None)).count()
-        }
-        
-        # Recent activity
-        recent_posts = Post.query.order_by(Post.date_posted.desc()).limit(5).all()
+        counts = dashboard_stats.get()
+        stats = {key: counts[key] for key in (
+            'total_users', 'total_sections', 'total_contents', 'total_posts', 'total_comments',
+            'active_users', 'banned_users', 'locked_users'
+        )}
+        
+        # Recent activity, authors loaded in the same query
+        recent_posts = queries.posts().order_by(Post.date_posted.desc(), Post.id.desc()).limit(5).all()
         recent_users = User.query.order_by(User.id.desc()).limit(5).all()
         
         return api_response(data={
@@ -70,7 +71,7 @@ class UserManagementResource(AdminResource):
         elif status == 'active':
             query = query.filter_by(is_banned=False, active=True)
         elif status == 'locked':
-            query = query.filter(User.lockout_until.isnot(None))
+            query = query.filter(User.lockout_until > datetime.utcnow())
         
         users = query.paginate(
             page=args['page'],
@@ -104,8 +105,7 @@ class UserActionResource(AdminResource):
             message = f'User {user.username} has been unbanned'
             
         elif action == 'unlock':
-            user.failed_login_attempts = 0
-            user.lockout_until = None
+            user.reset_lockout()
             message = f'User {user.username} has been unlocked'
             
         elif action == 'delete':
@@ -113,12 +113,28 @@ class UserActionResource(AdminResource):
             if user.has_role('admin'):
                 return api_error('Cannot delete admin user', 400)
             
-            # Delete user's posts and comments
-            Comment.query.filter_by(user_id=user_id).delete()
+            # Delete user's posts and comments, with the replies under them
+            touched_posts = {post_id for (post_id,) in
+                             db.session.query(Comment.post_id).filter_by(user_id=user_id).distinct()}
+            for post_id in touched_posts:
+                threads.ensure_paths(post_id)
+            comment_ids = [comment_id for comment_id, _post_id in threads.subtree_ids_by_user(user_id)]
+            own_posts = [post_id for (post_id,) in
+                         db.session.query(Post.id).filter_by(user_id=user_id)]
+            if comment_ids:
+                Comment.query.filter(Comment.id.in_(comment_ids)).delete(synchronize_session=False)
+            Comment.query.filter(Comment.post_id.in_(own_posts)).delete(synchronize_session=False)
+            reads.forget(user_id=user_id, post_ids=own_posts)
             Post.query.filter_by(user_id=user_id).delete()
+            touched_posts = sorted(touched_posts.union(own_posts))
+            threads.rebuild(*touched_posts)
             
             username = user.username
+            identity_cache.invalidate(user_id)
             db.session.delete(user)
+            counters.refresh(*touched_posts)
+            bump_forum(*touched_posts)
+            bump_users()
             db.session.commit()
             
             # Notify other admins
@@ -133,6 +149,8 @@ class UserActionResource(AdminResource):
         else:
             return api_error('Invalid action', 400)
         
+        identity_cache.invalidate(user_id)
+        bump_users()
         db.session.commit()
         
         # Notify other admins
@@ -176,6 +194,8 @@ class UserRoleResource(AdminResource):
         new_roles = Role.query.filter(Role.id.in_(data['role_ids'])).all()
         user.roles = new_roles
         
+        identity_cache.invalidate(user_id)
+        bump_users()
         db.session.commit()
         
         # Notify other admins
@@ -191,7 +211,13 @@ class UserRoleResource(AdminResource):
             message='User roles updated successfully'
         )
 
+class PasswordPoolResource(AdminResource):
+    def get(self):
+        """Queue depth and timings of this worker's password hashing pool"""
+        return api_response(data=hasher.stats())
+
 api.add_resource(AdminDashboardResource, '/admin/dashboard')
+api.add_resource(PasswordPoolResource, '/admin/metrics/passwords')
 api.add_resource(UserManagementResource, '/admin/users')
 api.add_resource(UserActionResource, '/admin/users/<int:user_id>/<string:action>')
 api.add_resource(UserRoleResource, '/admin/users/<int:user_id>/roles')
\ No newline at end of file
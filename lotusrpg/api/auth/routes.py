@@ -1,14 +1,25 @@
 # lotusrpg/api/auth/routes.py
+from datetime import datetime, timedelta
 from flask import request, session
 from flask_restful import Resource
 from flask_security import login_user, logout_user, current_user
-from flask_security.utils import verify_password, hash_password
 from lotusrpg.models import User, db
-from lotusrpg.schemas import user_schema, LoginSchema, RegisterSchema
+from lotusrpg.schemas import user_schema, LoginSchema, LogoutSchema, RefreshSchema, RegisterSchema
+from flask_security.utils import get_request_attr
 from lotusrpg.api.base import BaseResource, api_response, api_error
 from lotusrpg.api import api
+from lotusrpg.ratelimit import Limit
+from lotusrpg.passwords import PasswordPoolBusy, hasher
+from lotusrpg import lockouts, tokens
+
+def _busy(e):
+    """503 telling the client when to retry a password operation"""
+    data, code = api_error('Server busy, please try again', 503)
+    return data, code, {'Retry-After': str(e.retry_after)}
 
 class LoginResource(BaseResource):
+    rate_limits = (Limit('10/minute', per='ip'), Limit('100/hour', per='ip'))
+    
     def post(self):
         """Login endpoint"""
         schema = LoginSchema()
@@ -27,21 +38,30 @@ class LoginResource(BaseResource):
         
         if user.is_locked():
             return api_error('Account is temporarily locked', 423)
+        lockouts.clear_expired(user)
+        
+        try:
+            verified = hasher.verify_and_update(user, data['password'])
+        except PasswordPoolBusy as e:
+            return _busy(e)
         
-        if not verify_password(data['password'], user.password):
-            # Increment failed attempts
-            user.failed_login_attempts += 1
-            if user.failed_login_attempts >= 5:
-                from datetime import datetime, timedelta
-                user.lockout_until = datetime.utcnow() + timedelta(minutes=30)
+        if not verified:
+            lockouts.record_failure(user)
             db.session.commit()
             return api_error('Invalid email or password', 401)
         
-        # Successful login
-        user.failed_login_attempts = 0
-        user.lockout_until = None
+        # Successful login; the hash may also have been upgraded
+        user.reset_lockout()
         db.session.commit()
         
+        if data['mode'] == 'token':
+            # Stateless: no session, the client sends the access token as a Bearer header
+            return api_response(
+                data=user_schema.dump(user),
+                message='Login successful',
+                tokens=tokens.issue_pair(user)
+            )
+        
         login_user(user)
         
         return api_response(
@@ -51,11 +71,66 @@ class LoginResource(BaseResource):
 
 class LogoutResource(BaseResource):
     def post(self):
-        """Logout endpoint"""
-        logout_user()
+        """Logout endpoint; token clients have their access and refresh tokens revoked"""
+        claims = get_request_attr('fs_bearer_claims')
+        if claims is None:
+            logout_user()
+            return api_response(message='Logout successful')
+        
+        schema = LogoutSchema()
+        try:
+            data = schema.load(request.get_json(silent=True) or {})
+        except Exception as e:
+            return api_error('Invalid input data', 400)
+        
+        revoked = {claims['jti']: datetime.utcnow() + timedelta(seconds=tokens.ttl(tokens.ACCESS))}
+        if data['refresh_token']:
+            try:
+                refresh_claims, expires_at = tokens.decode(data['refresh_token'], tokens.REFRESH)
+            except tokens.TokenError:
+                refresh_claims = None
+            if refresh_claims and refresh_claims['sub'] == claims['sub']:
+                revoked[refresh_claims['jti']] = expires_at
+        versions = {jti: tokens.revoke(jti, expires_at) for jti, expires_at in revoked.items()}
+        db.session.commit()
+        
+        for jti, version in versions.items():
+            if version is not None:
+                tokens.revocations.revoked(jti, version)
         return api_response(message='Logout successful')
 
+class RefreshResource(BaseResource):
+    rate_limits = (Limit('30/minute', per='ip'),)
+    
+    def post(self):
+        """Exchange a refresh token for a new token pair; the old refresh token is revoked"""
+        schema = RefreshSchema()
+        try:
+            data = schema.load(request.json)
+        except Exception as e:
+            return api_error('Invalid input data', 400)
+        
+        try:
+            claims, expires_at = tokens.decode(data['refresh_token'], tokens.REFRESH)
+        except tokens.TokenError as e:
+            return api_error(str(e), 401)
+        
+        user = tokens.load_user(claims)
+        if user is None:
+            return api_error('Invalid token', 401)
+        
+        version = tokens.revoke(claims['jti'], expires_at)
+        if version is None:
+            db.session.rollback()
+            return api_error('Token revoked', 401)
+        db.session.commit()
+        tokens.revocations.revoked(claims['jti'], version)
+        
+        return api_response(message='Token refreshed', tokens=tokens.issue_pair(user))
+
 class RegisterResource(BaseResource):
+    rate_limits = (Limit('5/hour', per='ip', burst=3),)
+    
     def post(self):
         """Registration endpoint"""
         schema = RegisterSchema()
@@ -71,12 +146,17 @@ class RegisterResource(BaseResource):
         if User.query.filter_by(username=data['username']).first():
             return api_error('Username already taken', 409)
         
+        try:
+            password = hasher.hash(data['password'])
+        except PasswordPoolBusy as e:
+            return _busy(e)
+        
         # Create user
         import uuid
         user = User(
             email=data['email'],
             username=data['username'],
-            password=hash_password(data['password']),
+            password=password,
             fs_uniquifier=str(uuid.uuid4()),
             active=True
         )
@@ -91,6 +171,13 @@ class RegisterResource(BaseResource):
         )
 
 class CurrentUserResource(BaseResource):
+    cache_control = 'private, no-cache'
+    
+    def version_key(self):
+        if not current_user.is_authenticated:
+            return None
+        return current_user.profile_etag(), None
+    
     def get(self):
         """Get current user info"""
         if current_user.is_authenticated:
@@ -100,5 +187,6 @@ class CurrentUserResource(BaseResource):
 # Register routes
 api.add_resource(LoginResource, '/auth/login')
 api.add_resource(LogoutResource, '/auth/logout')
+api.add_resource(RefreshResource, '/auth/refresh')
 api.add_resource(RegisterResource, '/auth/register')
 api.add_resource(CurrentUserResource, '/auth/me')
\ No newline at end of file
@@ -1,26 +1,103 @@
 # lotusrpg/api/base.py
+from flask import Response, request
 from flask_restful import Resource
+from flask_restful.utils import unpack
+from werkzeug.http import http_date, quote_etag
 from flask_security import auth_required, roles_required
+from lotusrpg.ratelimit import limiter
 from functools import wraps
+from datetime import timezone
 import json
 
 class BaseResource(Resource):
-    """Base class for all API resources with common functionality"""
+    """Base class for all API resources with common functionality
+    
+    Read endpoints can opt into conditional GETs by overriding
+    ``version_key``; ``If-None-Match``/``If-Modified-Since`` are then answered
+    with 304 before the handler runs any query or serialization, so GETs
+    with side effects (read markers, ...) must not declare one.
+    
+    ``rate_limits`` lists ``lotusrpg.ratelimit.Limit`` buckets checked before
+    anything else; over the limit the client gets 429 with ``Retry-After``.
+    """
+    
+    # Cache-Control sent with conditional responses
+    cache_control = 'public, max-age=0, must-revalidate'
+    # Vary sent with conditional responses, 304s included, when the body
+    # depends on request headers
+    vary = None
+    
+    rate_limits = ()
+    
+    def version_key(self, *args, **kwargs):
+        """Return a cheap ``(etag, last_modified)`` validator, or None to opt out"""
+        return None
     
     def dispatch_request(self, *args, **kwargs):
+        if self.rate_limits:
+            retry_after = limiter.check(self.rate_limits, request.endpoint, request.method)
+            if retry_after is not None:
+                data, code = api_error('Too many requests', 429, retry_after=retry_after)
+                return data, code, {'Retry-After': str(retry_after)}
+        
+        validator = None
+        if request.method in ('GET', 'HEAD'):
+            validator = self.version_key(*args, **kwargs)
+            if validator is not None and _not_modified(*validator):
+                return self._with_validator(Response(status=304), validator)
+        
         # Add common headers
         response = super().dispatch_request(*args, **kwargs)
-        if hasattr(response, 'headers'):
-            response.headers['Content-Type'] = 'application/json'
+        if isinstance(response, Response):
+            # Streamed responses (e.g. NDJSON bundles) carry their own media type
+            if not response.is_streamed:
+                response.headers['Content-Type'] = 'application/json'
+            if validator is not None and response.status_code == 200:
+                self._with_validator(response, validator)
+        elif validator is not None:
+            data, code, headers = unpack(response)
+            if code == 200:
+                headers = {**headers, **self._validator_headers(validator)}
+            response = data, code, headers
+        return response
+    
+    def _validator_headers(self, validator):
+        etag, last_modified = validator
+        headers = {
+            'ETag': quote_etag(etag),
+            'Cache-Control': self.cache_control
+        }
+        if last_modified is not None:
+            headers['Last-Modified'] = http_date(_as_utc(last_modified))
+        if self.vary:
+            headers['Vary'] = self.vary
+        return headers
+    
+    def _with_validator(self, response, validator):
+        response.headers.update(self._validator_headers(validator))
         return response
 
+def _as_utc(value):
+    """Stored timestamps are naive UTC; HTTP dates are whole seconds"""
+    return value.replace(tzinfo=timezone.utc, microsecond=0)
+
+def _not_modified(etag, last_modified):
+    # If-None-Match takes precedence over If-Modified-Since (RFC 9110)
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    if request.if_modified_since and last_modified is not None:
+        return _as_utc(last_modified) <= request.if_modified_since
+    return False
+
 class AuthenticatedResource(BaseResource):
     """Base class for authenticated endpoints"""
     decorators = [auth_required()]
+    cache_control = 'private, no-cache'
 
 class AdminResource(BaseResource):
     """Base class for admin-only endpoints"""
     decorators = [roles_required('admin')]
+    cache_control = 'private, no-cache'
 
 def api_response(data=None, message=None, status=200, **kwargs):
     """Standardized API response format"""
@@ -35,4 +112,14 @@ def api_response(data=None, message=None, status=200, **kwargs):
 
 def api_error(message, status=400, **kwargs):
     """Standardized error response"""
-    return api_response(message=message, status=status, **kwargs)
\ No newline at end of file
+    return api_response(message=message, status=status, **kwargs)
+
+def raw_api_response(data_json, message=None, status=200):
+    """Standardized API response around an already-serialized ``data`` payload"""
+    envelope = json.dumps({
+        'success': status < 400,
+        'status': status,
+        'message': message,
+    })
+    body = envelope[:-1] + ', "data": ' + data_json + '}'
+    return Response(body, status=status, mimetype='application/json')
\ No newline at end of file
@@ -0,0 +1,74 @@
+# lotusrpg/api/forum/frontpage.py
+"""Write-through cache of the forum front page as ready-to-send bytes"""
+import json
+import threading
+
+from flask import Response, current_app
+
+from lotusrpg import revisions
+from lotusrpg.api.base import raw_api_response
+from lotusrpg.api.pagination import encode_cursor, keyset_paginate
+from lotusrpg.forum import FORUM_KEY, USERS_KEY, queries
+from lotusrpg.schemas import posts_schema
+
+DEFAULT_SIZES = (10, 20, 50)
+
+
+class FrontPageCache:
+    """First page of the newest-first post list for a few ``per_page`` values.
+
+    Forum writes call ``refresh`` after commit so the next reader gets the
+    new page without touching the database. Pages rendered by another worker
+    are noticed through the forum and users revisions and rebuilt on read.
+    """
+
+    def __init__(self):
+        self._pages = {}  # per_page -> (etag, body bytes)
+        self._lock = threading.Lock()
+
+    def sizes(self):
+        return tuple(current_app.config.get('FRONT_PAGE_SIZES', DEFAULT_SIZES))
+
+    def _render(self, *sizes):
+        """Bodies for each of ``sizes`` from a single query and dump of the largest page"""
+        columns = queries.POST_SORTS['recent']
+        posts, pagination = keyset_paginate(queries.posts(), columns, max(sizes))
+        dumped = posts_schema.dump(posts)
+        bodies = {}
+        for per_page in sizes:
+            has_next = len(posts) > per_page or pagination['has_next']
+            page = {
+                'posts': dumped[:per_page],
+                'pagination': {
+                    'per_page': per_page,
+                    'has_next': has_next,
+                    'has_prev': False,
+                    'next': encode_cursor(
+                        'after', [getattr(posts[per_page - 1], column.key) for column in columns]
+                    ) if has_next else None,
+                    'prev': None,
+                },
+            }
+            data_json = json.dumps(page, separators=(',', ':'), default=str)
+            bodies[per_page] = raw_api_response(data_json).get_data()
+        return bodies
+
+    def response(self, per_page):
+        etag, _ = revisions.validator(FORUM_KEY, USERS_KEY)
+        cached = self._pages.get(per_page)
+        if cached is None or cached[0] != etag:
+            with self._lock:
+                cached = self._pages.get(per_page)
+                if cached is None or cached[0] != etag:
+                    cached = (etag, self._render(per_page)[per_page])
+                    self._pages[per_page] = cached
+        return Response(cached[1], mimetype='application/json')
+
+    def refresh(self):
+        """Re-render every cached size; call after a forum write has committed"""
+        etag, _ = revisions.validator(FORUM_KEY, USERS_KEY)
+        with self._lock:
+            self._pages = {per_page: (etag, body) for per_page, body in self._render(*self.sizes()).items()}
+
+
+front_page = FrontPageCache()
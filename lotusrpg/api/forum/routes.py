@@ -5,10 +5,18 @@ from lotusrpg.models import Post, Comment, User, db
 from lotusrpg.schemas import (
     post_schema, posts_schema,
     comment_schema, comments_schema,
-    PaginationSchema
+    CursorPaginationSchema
 )
 from lotusrpg.api.base import BaseResource, AuthenticatedResource, AdminResource, api_response, api_error
+from lotusrpg.api.pagination import CursorError, decode_cursor, encode_cursor, keyset_paginate, total_counts
+from lotusrpg.api.forum.frontpage import front_page
 from lotusrpg.api import api
+from lotusrpg.ratelimit import Limit
+from lotusrpg import revisions
+from lotusrpg.forum import FORUM_KEY, USERS_KEY, bump_forum, post_revision_key
+from lotusrpg.forum import counters, queries, reads, threads
+from lotusrpg.forum.hot import HOT_KEY, initial_score
+from lotusrpg.forum.search import forum_index
 from marshmallow import Schema, fields
 
 class PostCreateSchema(Schema):
@@ -17,75 +25,117 @@ class PostCreateSchema(Schema):
 
 class CommentCreateSchema(Schema):
     content = fields.Str(required=True, validate=lambda x: len(x.strip()) >= 1)
+    parent_id = fields.Int(load_default=None, allow_none=True)
+
+class ReadMarkerSchema(Schema):
+    comment_id = fields.Int(load_default=None, allow_none=True)
 
 class ForumPostsResource(BaseResource):
+    def version_key(self):
+        if request.args.get('sort') == 'hot':
+            return revisions.validator(FORUM_KEY, USERS_KEY, HOT_KEY)
+        return revisions.validator(FORUM_KEY, USERS_KEY)
+    
     def get(self):
         """Get forum posts with pagination"""
-        schema = PaginationSchema()
+        schema = CursorPaginationSchema()
         try:
             args = schema.load(request.args)
         except Exception as e:
             return api_error('Invalid parameters', 400)
         
-        query = Post.query.order_by(Post.date_posted.desc())
+        sort = request.args.get('sort', 'recent')
+        if sort not in queries.POST_SORTS:
+            return api_error('Invalid parameters', 400)
+        
+        # The default first page is served from pre-rendered bytes
+        author = request.args.get('author')
+        if (sort == 'recent' and not (args['cursor'] or args['search'] or author or args['include_total'])
+                and args['per_page'] in front_page.sizes()):
+            return front_page.response(args['per_page'])
+        
+        query = queries.posts()
         
-        # Search functionality
+        # Matched by the forum search index instead of scanning every post
         if args['search']:
-            search_term = f"%{args['search']}%"
-            query = query.filter(
-                Post.title.ilike(search_term) | 
-                Post.content.ilike(search_term)
-            )
+            query = query.filter(Post.id.in_(forum_index.matching_posts(args['search'])))
         
         # Filter by author
-        author = request.args.get('author')
         if author:
-            user = User.query.filter_by(username=author).first()
-            if user:
-                query = query.filter_by(user_id=user.id)
-        
-        posts = query.paginate(
-            page=args['page'],
-            per_page=args['per_page'],
-            error_out=False
-        )
+            query = query.filter(Post.author.has(username=author))
+        
+        try:
+            posts, pagination = keyset_paginate(
+                query, queries.POST_SORTS[sort], args['per_page'], args['cursor']
+            )
+        except CursorError as e:
+            return api_error(str(e), 400)
+        
+        if args['include_total']:
+            pagination['total'] = total_counts.get(
+                ('posts', args['search'], author), (FORUM_KEY,), query
+            )
         
         return api_response(data={
-            'posts': posts_schema.dump(posts.items),
-            'pagination': {
-                'page': posts.page,
-                'pages': posts.pages,
-                'per_page': posts.per_page,
-                'total': posts.total,
-                'has_next': posts.has_next,
-                'has_prev': posts.has_prev
-            }
+            'posts': posts_schema.dump(posts),
+            'pagination': pagination
         })
 
 class PostResource(AuthenticatedResource):
+    # No version_key: every view moves the reader's read marker, which a 304
+    # answered from the validator would skip
+    
     def get(self, post_id):
         """Get a specific post with comments"""
-        post = Post.query.get_or_404(post_id)
+        post = queries.posts().filter(Post.id == post_id).first_or_404()
         
         # Get comments with pagination
-        page = request.args.get('page', 1, type=int)
-        per_page = request.args.get('per_page', 10, type=int)
+        schema = CursorPaginationSchema()
+        try:
+            args = schema.load(request.args)
+        except Exception as e:
+            return api_error('Invalid parameters', 400)
         
-        comments = Comment.query.filter_by(post_id=post_id)\
-                              .order_by(Comment.date_posted.asc())\
-                              .paginate(page=page, per_page=per_page, error_out=False)
+        # Comments come as a page of top-level threads, replies nested
+        if threads.ensure_paths(post_id):
+            db.session.commit()
+        direction, path = 'after', None
+        if args['cursor']:
+            try:
+                direction, (path,) = decode_cursor(args['cursor'], (Comment.path,))
+            except CursorError as e:
+                return api_error(str(e), 400)
+        
+        comments, last_root, first_root = threads.load_threads(
+            post_id, args['per_page'],
+            after=path if direction == 'after' else None,
+            before=path if direction == 'before' else None
+        )
+        pagination = {
+            'per_page': args['per_page'],
+            'has_next': last_root is not None,
+            'has_prev': first_root is not None,
+            'next': encode_cursor('after', [last_root]) if last_root else None,
+            'prev': encode_cursor('before', [first_root]) if first_root else None
+        }
+        
+        if args['include_total']:
+            pagination['total'] = total_counts.get(
+                ('threads', post_id), (post_revision_key(post_id),),
+                Comment.query.filter_by(post_id=post_id, parent_id=None)
+            )
+        
+        # Threads are ordered by path, not id, so a later page can still hold
+        # older comments. Only the last page can raise the high-water mark.
+        if last_root is None:
+            reads.mark_read(current_user.id, post_id, max((comment.id for comment in comments), default=0))
+        else:
+            reads.mark_read(current_user.id, post_id)
         
         return api_response(data={
             'post': post_schema.dump(post),
-            'comments': comments_schema.dump(comments.items),
-            'comments_pagination': {
-                'page': comments.page,
-                'pages': comments.pages,
-                'per_page': comments.per_page,
-                'total': comments.total,
-                'has_next': comments.has_next,
-                'has_prev': comments.has_prev
-            }
+            'comments': threads.nest(comments, comment_schema.dump),
+            'comments_pagination': pagination
         })
     
     def put(self, post_id):
@@ -104,8 +154,12 @@ class PostResource(AuthenticatedResource):
         
         post.title = data['title']
         post.content = data['content']
+        versions = bump_forum(post.id)
         db.session.commit()
         
+        forum_index.post_saved(post, versions)
+        front_page.refresh()
+        
         return api_response(
             data=post_schema.dump(post),
             message='Post updated successfully'
@@ -119,15 +173,22 @@ class PostResource(AuthenticatedResource):
         if not (current_user == post.author or current_user.has_role('admin')):
             return api_error('Permission denied', 403)
         
-        # Delete associated comments
+        # Delete associated comments and read markers
         Comment.query.filter_by(post_id=post_id).delete()
+        reads.forget(post_ids=[post_id])
         
         db.session.delete(post)
+        versions = bump_forum(post_id)
         db.session.commit()
         
+        forum_index.post_deleted(post_id, versions)
+        front_page.refresh()
+        
         return api_response(message='Post deleted successfully')
 
 class PostCreateResource(AuthenticatedResource):
+    rate_limits = (Limit('5/minute', per='user'), Limit('30/hour', per='user'))
+    
     def post(self):
         """Create a new post"""
         schema = PostCreateSchema()
@@ -139,12 +200,19 @@ class PostCreateResource(AuthenticatedResource):
         post = Post(
             title=data['title'],
             content=data['content'],
-            author=current_user
+            author=current_user,
+            hot_score=initial_score()
         )
         
         db.session.add(post)
+        db.session.flush()
+        versions = bump_forum(post.id)
         db.session.commit()
         
+        forum_index.post_saved(post, versions)
+        front_page.refresh()
+        reads.mark_read(current_user.id, post.id)
+        
         return api_response(
             data=post_schema.dump(post),
             message='Post created successfully',
@@ -152,6 +220,24 @@ class PostCreateResource(AuthenticatedResource):
         )
 
 class CommentResource(AuthenticatedResource):
+    rate_limits = (Limit('10/minute', per='user', methods=('POST',)),)
+    
+    def version_key(self, post_id, comment_id=None):
+        return revisions.validator(post_revision_key(post_id), USERS_KEY)
+    
+    def get(self, post_id, comment_id=None):
+        """Get a comment with all of its replies"""
+        if comment_id is None:
+            return api_error('Comment id required', 405)
+        
+        comment = Comment.query.filter_by(id=comment_id, post_id=post_id).first_or_404()
+        if threads.ensure_paths(post_id):
+            db.session.commit()
+        
+        return api_response(data={
+            'thread': threads.nest(threads.load_thread(comment), comment_schema.dump)[0]
+        })
+    
     def post(self, post_id):
         """Add a comment to a post"""
         post = Post.query.get_or_404(post_id)
@@ -165,12 +251,24 @@ class CommentResource(AuthenticatedResource):
         comment = Comment(
             content=data['content'],
             user_id=current_user.id,
-            post_id=post_id
+            post_id=post_id,
+            parent_id=data['parent_id']
         )
         
         db.session.add(comment)
+        try:
+            threads.place(comment)
+        except threads.ThreadError as e:
+            db.session.rollback()
+            return api_error(str(e), 404)
+        counters.comment_added(post_id, comment.date_posted)
+        versions = bump_forum(post_id)
         db.session.commit()
         
+        forum_index.comment_saved(comment, versions)
+        front_page.refresh()
+        reads.mark_read(current_user.id, post_id, comment.id)
+        
         return api_response(
             data=comment_schema.dump(comment),
             message='Comment added successfully',
@@ -192,8 +290,12 @@ class CommentResource(AuthenticatedResource):
             return api_error('Invalid input data', 400)
         
         comment.content = data['content']
+        versions = bump_forum(comment.post_id)
         db.session.commit()
         
+        forum_index.comment_saved(comment, versions)
+        front_page.refresh()
+        
         return api_response(
             data=comment_schema.dump(comment),
             message='Comment updated successfully'
@@ -207,46 +309,105 @@ class CommentResource(AuthenticatedResource):
         if not (current_user.id == comment.user_id or current_user.has_role('admin')):
             return api_error('Permission denied', 403)
         
-        db.session.delete(comment)
+        # Replies go with the comment they answer
+        comment_post_id = comment.post_id
+        deleted_ids = threads.delete_subtree(comment)
+        counters.comment_removed(comment_post_id, len(deleted_ids))
+        versions = bump_forum(comment_post_id)
         db.session.commit()
         
+        forum_index.comments_deleted(deleted_ids, comment_post_id, versions)
+        front_page.refresh()
+        
         return api_response(message='Comment deleted successfully')
 
 class UserPostsResource(BaseResource):
+    def version_key(self, username):
+        return revisions.validator(FORUM_KEY, USERS_KEY)
+    
     def get(self, username):
         """Get posts by a specific user"""
         user = User.query.filter_by(username=username).first_or_404()
         
-        schema = PaginationSchema()
+        schema = CursorPaginationSchema()
         try:
             args = schema.load(request.args)
         except Exception as e:
             return api_error('Invalid parameters', 400)
         
-        posts = Post.query.filter_by(author=user)\
-                         .order_by(Post.date_posted.desc())\
-                         .paginate(
-                             page=args['page'],
-                             per_page=args['per_page'],
-                             error_out=False
-                         )
+        query = queries.posts().filter(Post.user_id == user.id)
+        try:
+            posts, pagination = keyset_paginate(
+                query, (Post.date_posted, Post.id), args['per_page'], args['cursor']
+            )
+        except CursorError as e:
+            return api_error(str(e), 400)
+        
+        if args['include_total']:
+            pagination['total'] = total_counts.get(('user_posts', user.id), (FORUM_KEY,), query)
         
         return api_response(data={
             'user': {
                 'username': user.username,
                 'image_file': user.image_file
             },
-            'posts': posts_schema.dump(posts.items),
-            'pagination': {
-                'page': posts.page,
-                'pages': posts.pages,
-                'per_page': posts.per_page,
-                'total': posts.total,
-                'has_next': posts.has_next,
-                'has_prev': posts.has_prev
-            }
+            'posts': posts_schema.dump(posts),
+            'pagination': pagination
+        })
+
+class ForumSearchResource(BaseResource):
+    def version_key(self):
+        return revisions.validator(FORUM_KEY, USERS_KEY)
+    
+    def get(self):
+        """Ranked full-text search across posts and comments"""
+        query = request.args.get('q', '').strip()
+        if not query:
+            return api_error('Search query required', 400)
+        
+        author = request.args.get('author')
+        limit = max(1, min(request.args.get('limit', 20, type=int), 100))
+        
+        results = forum_index.search(query, author=author, limit=limit)
+        
+        return api_response(data={
+            'results': results,
+            'query': query,
+            'count': len(results)
         })
 
+class ReadMarkerResource(AuthenticatedResource):
+    def post(self, post_id):
+        """Mark a post as read, up to a comment or to its latest one"""
+        Post.query.get_or_404(post_id)
+        
+        schema = ReadMarkerSchema()
+        try:
+            data = schema.load(request.json or {})
+        except Exception as e:
+            return api_error('Invalid input data', 400)
+        
+        comment_id = data['comment_id']
+        if comment_id is None:
+            comment_id = db.session.query(db.func.max(Comment.id)).filter_by(post_id=post_id).scalar()
+        reads.mark_read(current_user.id, post_id, comment_id)
+        
+        return api_response(message='Post marked as read')
+
+class ForumUnreadResource(AuthenticatedResource):
+    def get(self):
+        """Unread comment counts for a page of posts (``post_ids=1,2,3``)"""
+        try:
+            post_ids = [int(post_id) for post_id in request.args.get('post_ids', '').split(',') if post_id]
+        except ValueError:
+            return api_error('Invalid post ids', 400)
+        if len(post_ids) > 100:
+            return api_error('At most 100 post ids', 400)
+        
+        counts = reads.unread_counts(current_user.id, post_ids)
+        
+        return api_response(data={'unread': {str(post_id): count for post_id, count in counts.items()}})
+
 # Register routes
 api.add_resource(ForumPostsResource, '/forum/posts')
 api.add_resource(PostCreateResource, '/forum/posts/create')
@@ -254,4 +415,7 @@ api.add_resource(PostResource, '/forum/posts/<int:post_id>')
 api.add_resource(CommentResource, 
                 '/forum/posts/<int:post_id>/comments',
                 '/forum/posts/<int:post_id>/comments/<int:comment_id>')
+api.add_resource(ReadMarkerResource, '/forum/posts/<int:post_id>/read')
+api.add_resource(ForumUnreadResource, '/forum/unread')
+api.add_resource(ForumSearchResource, '/forum/search')
 api.add_resource(UserPostsResource, '/forum/users/<string:username>/posts')
\ No newline at end of file
@@ -0,0 +1,112 @@
+# lotusrpg/api/pagination.py
+"""Keyset (cursor) pagination and cached exact totals for list endpoints"""
+import base64
+import binascii
+import json
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+from sqlalchemy import tuple_
+
+from lotusrpg import revisions
+
+
+class CursorError(ValueError):
+    """Raised for cursors that were not produced by ``encode_cursor``"""
+
+
+def encode_cursor(direction, values):
+    """Opaque token for a position just ``'after'`` or ``'before'`` a row's sort key"""
+    payload = [direction] + [value.isoformat() if isinstance(value, datetime) else value for value in values]
+    raw = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token, columns):
+    """Return ``(direction, values)`` for a cursor over ``columns``"""
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        direction, *values = json.loads(raw)
+        if direction not in ('after', 'before') or len(values) != len(columns):
+            raise ValueError(token)
+        decoded = []
+        for column, value in zip(columns, values):
+            python_type = column.type.python_type
+            if python_type is datetime:
+                value = datetime.fromisoformat(value)
+            elif not isinstance(value, python_type):
+                raise ValueError(token)
+            decoded.append(value)
+    except (ValueError, TypeError, binascii.Error, UnicodeDecodeError):
+        raise CursorError('Invalid cursor')
+    return direction, decoded
+
+
+def keyset_paginate(query, columns, per_page, cursor=None, descending=True):
+    """Return one page of ``query`` ordered by ``columns`` and its pagination info.
+
+    ``columns`` must end with a unique column (usually the primary key) so
+    the sort key identifies a row. Pages are found with a row-value
+    comparison against the cursor, so any page costs the same as the first
+    and no ``COUNT`` is needed.
+    """
+    direction, values = decode_cursor(cursor, columns) if cursor else ('after', None)
+    backwards = direction == 'before'
+    # Walking backwards flips both the comparison and the sort order
+    ascending = descending == backwards
+
+    if values is not None:
+        key, bound = tuple_(*columns), tuple_(*values)
+        query = query.filter(key > bound if ascending else key < bound)
+    query = query.order_by(None).order_by(
+        *(column.asc() if ascending else column.desc() for column in columns)
+    )
+
+    rows = query.limit(per_page + 1).all()
+    more = len(rows) > per_page
+    rows = rows[:per_page]
+    if backwards:
+        rows.reverse()
+
+    has_next = True if backwards else more
+    has_prev = more if backwards else values is not None
+
+    def sort_key(row):
+        return [getattr(row, column.key) for column in columns]
+
+    return rows, {
+        'per_page': per_page,
+        'has_next': bool(rows) and has_next,
+        'has_prev': bool(rows) and has_prev,
+        'next': encode_cursor('after', sort_key(rows[-1])) if rows and has_next else None,
+        'prev': encode_cursor('before', sort_key(rows[0])) if rows and has_prev else None,
+    }
+
+
+class CountCache:
+    """Exact row counts, reused until a revision they depend on changes"""
+
+    def __init__(self, max_entries=512):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (revision etag, count)
+        self._lock = threading.Lock()
+
+    def get(self, key, revision_keys, query):
+        etag, _ = revisions.validator(*revision_keys)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] == etag:
+                self._entries.move_to_end(key)
+                return entry[1]
+
+        count = query.order_by(None).count()
+        with self._lock:
+            self._entries[key] = (etag, count)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return count
+
+
+total_counts = CountCache()
@@ -1,54 +1,153 @@
 # lotusrpg/api/rules/routes.py
-from flask import request
+from flask import request, Response, stream_with_context
 from flask_restful import Resource
-from lotusrpg.models import Section, Content, db
+from lotusrpg.models import Section, Content, Image, db
 from lotusrpg.schemas import (
     section_schema, sections_schema, 
-    content_schema, contents_schema,
+    content_schema, contents_schema, image_schema,
     SectionCreateSchema, ContentCreateSchema,
-    PaginationSchema
+    SectionBlocksSchema, PaginationSchema
 )
-from lotusrpg.api.base import BaseResource, AuthenticatedResource, AdminResource, api_response, api_error
+from lotusrpg.api.base import BaseResource, AuthenticatedResource, AdminResource, api_response, api_error, raw_api_response
 from lotusrpg.api import api
+from lotusrpg import revisions
+from lotusrpg.rules import RULEBOOKS, bump_rulebooks, revision_key, rulebook_keys, toc_revision_key
+from lotusrpg.rules import blocks, bundle, hierarchy, images, snapshots
+from lotusrpg.rules.autocomplete import title_index
+from lotusrpg.rules.search import rules_index
+from lotusrpg.rules.toc import toc_cache
 from sqlalchemy import or_
+from sqlalchemy.orm import selectinload
+from werkzeug.exceptions import RequestEntityTooLarge
+
+
+def _bump_tocs(*rulebooks):
+    """Bump the table-of-contents revision of each touched rulebook"""
+    return {rulebook: revisions.bump(toc_revision_key(rulebook)) for rulebook in set(rulebooks)}
+
+class RulesResource(BaseResource):
+    """Read endpoints whose output depends only on rulebook content"""
+    
+    def version_key(self, *args, **kwargs):
+        return revisions.validator(*rulebook_keys())
 
 class RulebookChaptersResource(BaseResource):
+    def version_key(self, rulebook):
+        if rulebook not in RULEBOOKS:
+            return None
+        return revisions.validator(toc_revision_key(rulebook))
+    
     def get(self, rulebook):
-        """Get all chapters for a rulebook"""
-        if rulebook not in ['core', 'darkholme']:
+        """Get the table of contents for a rulebook"""
+        if rulebook not in RULEBOOKS:
             return api_error('Invalid rulebook', 400)
         
-        chapters = db.session.query(Section.chapter).filter_by(rulebook=rulebook).distinct().all()
+        version, chapters = toc_cache.get(rulebook)
         
-        chapter_data = []
-        for chapter_tuple in chapters:
-            chapter_name = chapter_tuple[0]
-            sections = Section.query.filter_by(
-                chapter=chapter_name, 
-                rulebook=rulebook
-            ).all()
-            
-            chapter_data.append({
-                'title': chapter_name,
-                'sections': [{
-                    'id': s.id,
-                    'title': s.title,
-                    'slug': s.slug
-                } for s in sections]
-            })
+        # Clients that already hold this version can skip the download
+        if request.args.get('version', type=int) == version:
+            return api_response(data={'rulebook': rulebook, 'version': version, 'changed': False})
         
-        return api_response(data={'chapters': chapter_data})
+        return api_response(data={
+            'rulebook': rulebook,
+            'version': version,
+            'changed': True,
+            'chapters': chapters
+        })
+
+def _accepts_gzip():
+    return request.accept_encodings['gzip'] > 0
+
+class RulebookBundleResource(BaseResource):
+    # The body depends on Accept-Encoding, 304s included
+    vary = 'Accept-Encoding'
+    
+    def version_key(self, rulebook):
+        """Rulebook revision, per ``since`` and content encoding"""
+        if rulebook not in RULEBOOKS:
+            return None
+        
+        version, updated_at = revisions.stamp(revision_key(rulebook))
+        since = request.args.get('since', type=int)
+        return bundle.bundle_etag(rulebook, version, since, _accepts_gzip()), updated_at
+    
+    def get(self, rulebook):
+        """Stream a whole rulebook, or the changes since a version, as NDJSON"""
+        if rulebook not in RULEBOOKS:
+            return api_error('Invalid rulebook', 400)
+        
+        since = request.args.get('since', type=int)
+        version = bundle.latest_version(rulebook)
+        
+        compress = _accepts_gzip()
+        response = Response(
+            stream_with_context(bundle.iter_chunks(bundle.iter_lines(rulebook, version, since), compress)),
+            mimetype='application/x-ndjson'
+        )
+        response.headers['X-Rulebook-Version'] = str(version)
+        if compress:
+            response.headers['Content-Encoding'] = 'gzip'
+        return response
 
 class SectionResource(BaseResource):
+    def version_key(self, slug):
+        return snapshots.stamp(slug)
+    
     def get(self, slug):
         """Get a specific section with contents"""
-        section = Section.query.filter_by(slug=slug).first()
+        snapshot = snapshots.lookup(slug)
+        
+        if snapshot is None:
+            # Sections written before snapshots existed are built on first read
+            section = Section.query.filter_by(slug=slug).first()
+            if not section:
+                return api_error('Section not found', 404)
+            
+            snapshot = snapshots.rebuild(
+                section,
+                {section.rulebook: revisions.current(revision_key(section.rulebook))}
+            )
+            db.session.commit()
+        
+        payload, content_hash = snapshot
+        response = raw_api_response(payload)
+        response.set_etag(content_hash)
+        return response
+
+def _placed_section(slug):
+    """Load a section by slug, backfilling tree paths if it predates them"""
+    section = Section.query.filter_by(slug=slug).first()
+    if section and section.path is None:
+        hierarchy.rebuild_paths()
+        db.session.commit()
+    return section
+
+class SectionBreadcrumbsResource(RulesResource):
+    def get(self, slug):
+        """Get the ancestor chain of a section, root first"""
+        section = _placed_section(slug)
         if not section:
             return api_error('Section not found', 404)
         
-        return api_response(data=section_schema.dump(section))
+        return api_response(data={
+            'section': {'id': section.id, 'title': section.title, 'slug': section.slug},
+            'breadcrumbs': hierarchy.breadcrumbs(section)
+        })
+
+class SectionSubtreeResource(RulesResource):
+    def get(self, slug):
+        """Get a section and all of its descendants as a nested tree"""
+        section = _placed_section(slug)
+        if not section:
+            return api_error('Section not found', 404)
+        
+        max_depth = request.args.get('depth', type=int)
+        if max_depth is not None and max_depth < 0:
+            return api_error('Invalid parameters', 400)
+        
+        return api_response(data={'tree': hierarchy.subtree(section, max_depth)})
 
-class SectionListResource(BaseResource):
+class SectionListResource(RulesResource):
     def get(self):
         """Get sections with pagination and filtering"""
         schema = PaginationSchema()
@@ -57,7 +156,10 @@ class SectionListResource(BaseResource):
         except Exception as e:
             return api_error('Invalid parameters', 400)
         
-        query = Section.query
+        query = Section.query.options(
+            selectinload(Section.contents),
+            selectinload(Section.images).selectinload(Image.variants)
+        )
         
         # Apply filters
         rulebook = request.args.get('rulebook')
@@ -107,8 +209,20 @@ class SectionManagementResource(AdminResource):
         
         section = Section(**data)
         db.session.add(section)
+        try:
+            hierarchy.place(section)
+        except hierarchy.HierarchyError as e:
+            return api_error(str(e), 400)
+        
+        versions = bump_rulebooks(section.rulebook)
+        toc_versions = _bump_tocs(section.rulebook)
+        snapshots.rebuild(section, versions)
         db.session.commit()
         
+        rules_index.section_saved(section, versions)
+        title_index.section_saved(section, toc_versions)
+        toc_cache.invalidate(section.rulebook)
+        
         return api_response(
             data=section_schema.dump(section),
             message='Section created successfully',
@@ -134,12 +248,28 @@ class SectionManagementResource(AdminResource):
         if existing:
             return api_error('Slug already exists', 409)
         
+        # Move the section (and its subtree) if the parent changed
+        old_rulebook = section.rulebook
+        parent_id = data.pop('parent_id', section.parent_id)
+        if parent_id != section.parent_id:
+            try:
+                hierarchy.move(section, parent_id)
+            except hierarchy.HierarchyError as e:
+                return api_error(str(e), 400)
+        
         # Update section
         for key, value in data.items():
             setattr(section, key, value)
         
+        versions = bump_rulebooks(old_rulebook, section.rulebook)
+        toc_versions = _bump_tocs(old_rulebook, section.rulebook)
+        snapshots.rebuild(section, versions)
         db.session.commit()
         
+        rules_index.section_saved(section, versions)
+        title_index.section_saved(section, toc_versions)
+        toc_cache.invalidate(old_rulebook, section.rulebook)
+        
         return api_response(
             data=section_schema.dump(section),
             message='Section updated successfully'
@@ -149,15 +279,23 @@ class SectionManagementResource(AdminResource):
         """Delete a section"""
         section = Section.query.get_or_404(section_id)
         
-        # Delete associated contents first
+        # Delete associated contents first and re-parent any children
         Content.query.filter_by(section_id=section_id).delete()
+        hierarchy.detach_children(section)
         
         db.session.delete(section)
+        versions = bump_rulebooks(section.rulebook)
+        toc_versions = _bump_tocs(section.rulebook)
+        snapshots.remove(section_id, versions)
         db.session.commit()
         
+        rules_index.section_deleted(section_id, versions)
+        title_index.section_deleted(section_id, toc_versions)
+        toc_cache.invalidate(section.rulebook)
+        
         return api_response(message='Section deleted successfully')
 
-class ContentResource(BaseResource):
+class ContentResource(RulesResource):
     def get(self, content_id):
         """Get specific content"""
         content = Content.query.get_or_404(content_id)
@@ -172,10 +310,18 @@ class ContentManagementResource(AdminResource):
         except Exception as e:
             return api_error('Invalid input data', 400)
         
+        section = Section.query.get(data['section_id'])
+        if not section:
+            return api_error('Section not found', 404)
+        
         content = Content(**data)
         db.session.add(content)
+        versions = bump_rulebooks(section.rulebook)
+        snapshots.rebuild(section, versions)
         db.session.commit()
         
+        rules_index.content_saved(content, versions)
+        
         return api_response(
             data=content_schema.dump(content),
             message='Content created successfully',
@@ -192,11 +338,22 @@ class ContentManagementResource(AdminResource):
         except Exception as e:
             return api_error('Invalid input data', 400)
         
+        section = Section.query.get(data['section_id'])
+        if not section:
+            return api_error('Section not found', 404)
+        
+        old_section = content.section
         for key, value in data.items():
             setattr(content, key, value)
         
+        versions = bump_rulebooks(old_section.rulebook, section.rulebook)
+        snapshots.rebuild(section, versions)
+        if old_section.id != section.id:
+            snapshots.rebuild(old_section, versions)
         db.session.commit()
         
+        rules_index.content_saved(content, versions)
+        
         return api_response(
             data=content_schema.dump(content),
             message='Content updated successfully'
@@ -205,35 +362,149 @@ class ContentManagementResource(AdminResource):
     def delete(self, content_id):
         """Delete content"""
         content = Content.query.get_or_404(content_id)
+        section = content.section
+        section_id = section.id
+        
         db.session.delete(content)
+        versions = bump_rulebooks(section.rulebook)
+        snapshots.rebuild(section, versions)
         db.session.commit()
         
+        rules_index.content_deleted(content_id, section_id, versions)
+        
         return api_response(message='Content deleted successfully')
 
-class SearchResource(BaseResource):
+class ImageResource(RulesResource):
+    def get(self, image_id):
+        """Get an image with its responsive variants"""
+        image = Image.query.get_or_404(image_id)
+        return api_response(data=image_schema.dump(image))
+
+class ImageManagementResource(AdminResource):
+    def post(self):
+        """Upload a rulebook image; variants are generated in the background"""
+        # Stop parsing the body as soon as it exceeds the limit
+        request.max_content_length = images.max_bytes() + 64 * 1024
+        try:
+            file = request.files.get('image')
+        except RequestEntityTooLarge:
+            return api_error('Image file too large', 413)
+        if file is None:
+            return api_error('No image file provided', 400)
+        if file.filename == '':
+            return api_error('No file selected', 400)
+        
+        section = Section.query.get(request.form.get('section_id', type=int))
+        if not section:
+            return api_error('Section not found', 404)
+        
+        try:
+            content_hash, file_name, width, height = images.store_original(file.read(), file.filename)
+        except images.ImageError as e:
+            return api_error(str(e), e.status)
+        
+        image = Image(
+            section=section,
+            file_path=file_name,
+            content_hash=content_hash,
+            width=width,
+            height=height,
+            alt_text=request.form.get('alt_text'),
+            class_name=request.form.get('class_name')
+        )
+        db.session.add(image)
+        versions = bump_rulebooks(section.rulebook)
+        snapshots.rebuild(section, versions)
+        db.session.commit()
+        
+        rules_index.sections_touched(versions)
+        images.schedule(image)
+        
+        return api_response(
+            data=image_schema.dump(image),
+            message='Image uploaded successfully',
+            status=201
+        )
+    
+    def delete(self, image_id):
+        """Delete an image, and its files once no other image shares them"""
+        image = Image.query.get_or_404(image_id)
+        section = image.section
+        content_hash = image.content_hash
+        
+        db.session.delete(image)
+        orphaned = images.release(content_hash)
+        versions = {}
+        if section:
+            versions = bump_rulebooks(section.rulebook)
+            snapshots.rebuild(section, versions)
+        db.session.commit()
+        
+        images.unlink(orphaned)
+        if versions:
+            rules_index.sections_touched(versions)
+        
+        return api_response(message='Image deleted successfully')
+
+class SectionContentsResource(AdminResource):
+    def put(self, section_id):
+        """Replace a section's content blocks in one transaction"""
+        section = Section.query.get_or_404(section_id)
+        
+        schema = SectionBlocksSchema()
+        try:
+            data = schema.load(request.json)
+        except Exception as e:
+            return api_error('Invalid input data', 400)
+        
+        try:
+            summary, versions = blocks.replace_section_blocks(section, data['blocks'])
+        except blocks.BlockError as e:
+            db.session.rollback()
+            return api_error(str(e), 400)
+        
+        db.session.commit()
+        
+        if versions:
+            rules_index.section_contents_replaced(section, versions)
+        
+        return api_response(
+            data={
+                'section': section_schema.dump(section),
+                'changes': summary
+            },
+            message='Section contents updated successfully'
+        )
+
+class AutocompleteResource(BaseResource):
+    def version_key(self):
+        return revisions.validator(*(toc_revision_key(rulebook) for rulebook in RULEBOOKS))
+    
     def get(self):
-        """Search across all content"""
+        """Suggest section titles for a (possibly misspelled) partial query"""
         query = request.args.get('q', '').strip()
         if not query:
             return api_error('Search query required', 400)
         
-        # Search in content data
-        search_term = f"%{query}%"
-        contents = Content.query.filter(
-            Content.content_data.cast(db.String).ilike(search_term)
-        ).limit(50).all()
-        
-        results = []
-        for content in contents:
-            section = Section.query.get(content.section_id)
-            if section:
-                results.append({
-                    'section_title': section.title,
-                    'slug': section.slug,
-                    'rulebook': section.rulebook,
-                    'content_type': content.content_type,
-                    'content_preview': str(content.content_data)[:200] + '...'
-                })
+        rulebook = request.args.get('rulebook')
+        limit = max(1, min(request.args.get('limit', 10, type=int), 25))
+        
+        return api_response(data={
+            'suggestions': title_index.suggest(query, limit=limit, rulebook=rulebook),
+            'query': query
+        })
+
+class SearchResource(RulesResource):
+    def get(self):
+        """Ranked full-text search across section titles and content"""
+        query = request.args.get('q', '').strip()
+        if not query:
+            return api_error('Search query required', 400)
+        
+        rulebook = request.args.get('rulebook')
+        limit = max(1, min(request.args.get('limit', 50, type=int), 100))
+        
+        results = rules_index.search(query, rulebook=rulebook, limit=limit)
         
         return api_response(data={
             'results': results,
@@ -243,13 +514,22 @@ class SearchResource(BaseResource):
 
 # Register routes
 api.add_resource(RulebookChaptersResource, '/rules/<string:rulebook>/chapters')
+api.add_resource(RulebookBundleResource, '/rules/<string:rulebook>/bundle')
 api.add_resource(SectionResource, '/rules/sections/<string:slug>')
+api.add_resource(SectionBreadcrumbsResource, '/rules/sections/<string:slug>/breadcrumbs')
+api.add_resource(SectionSubtreeResource, '/rules/sections/<string:slug>/subtree')
 api.add_resource(SectionListResource, '/rules/sections')
 api.add_resource(SectionManagementResource, 
                 '/rules/sections', 
                 '/rules/sections/<int:section_id>')
+api.add_resource(SectionContentsResource, '/rules/sections/<int:section_id>/contents')
 api.add_resource(ContentResource, '/rules/content/<int:content_id>')
 api.add_resource(ContentManagementResource, 
                 '/rules/content', 
                 '/rules/content/<int:content_id>')
+api.add_resource(ImageResource, '/rules/images/<int:image_id>')
+api.add_resource(ImageManagementResource, 
+                '/rules/images', 
+                '/rules/images/<int:image_id>')
+api.add_resource(AutocompleteResource, '/rules/autocomplete')
 api.add_resource(SearchResource, '/rules/search')
\ No newline at end of file
@@ -5,17 +5,22 @@ from lotusrpg.models import User, db
 from lotusrpg.schemas import user_schema
 from lotusrpg.api.base import AuthenticatedResource, api_response, api_error
 from lotusrpg.api import api
+from lotusrpg.forum import bump_users
+from lotusrpg.identity import identity_cache
+from lotusrpg.ratelimit import Limit
+from lotusrpg import avatars
 from marshmallow import Schema, fields
+from werkzeug.exceptions import RequestEntityTooLarge
 import os
-from werkzeug.utils import secure_filename
-from PIL import Image
-import secrets
 
 class UserUpdateSchema(Schema):
     email = fields.Email()
     username = fields.Str(validate=lambda x: len(x.strip()) >= 2)
 
 class UserProfileResource(AuthenticatedResource):
+    def version_key(self):
+        return current_user.profile_etag(), None
+    
     def get(self):
         """Get current user's profile"""
         return api_response(data=user_schema.dump(current_user))
@@ -40,6 +45,8 @@ class UserProfileResource(AuthenticatedResource):
                 return api_error('Username already taken', 409)
             current_user.username = data['username']
         
+        identity_cache.invalidate(current_user.id)
+        bump_users()
         db.session.commit()
         
         return api_response(
@@ -48,53 +55,58 @@ class UserProfileResource(AuthenticatedResource):
         )
 
 class UserAvatarResource(AuthenticatedResource):
+    rate_limits = (Limit('20/hour', per='user', burst=5, methods=['POST']),)
+    
+    def get(self):
+        """Avatar processing status, for clients that poll instead of listening on the socket"""
+        return api_response(data=avatars.describe(current_user))
+    
     def post(self):
-        """Upload user avatar"""
-        if 'avatar' not in request.files:
+        """Upload user avatar; sizes are rendered in the background"""
+        # Stop parsing the body as soon as it exceeds the limit
+        request.max_content_length = avatars.max_bytes() + 64 * 1024
+        try:
+            file = request.files.get('avatar')
+        except RequestEntityTooLarge:
+            return api_error('Avatar file too large', 413)
+        if file is None:
             return api_error('No avatar file provided', 400)
-        
-        file = request.files['avatar']
         if file.filename == '':
             return api_error('No file selected', 400)
         
-        # Validate file type
-        allowed_extensions = {'png', 'jpg', 'jpeg', 'gif'}
-        if not ('.' in file.filename and 
-                file.filename.rsplit('.', 1)[1].lower() in allowed_extensions):
-            return api_error('Invalid file type. Use PNG, JPG, JPEG, or GIF', 400)
-        
-        # Generate unique filename
-        random_hex = secrets.token_hex(8)
-        f_ext = os.path.splitext(file.filename)[1]
-        picture_fn = random_hex + f_ext
+        try:
+            source_hash, upload_path = avatars.receive(file)
+        except avatars.AvatarError as e:
+            return api_error(str(e), e.status)
         
-        # Save path (you'll need to ensure this directory exists)
-        picture_path = os.path.join('lotusrpg/static/profile_pics', picture_fn)
+        previous = current_user.image_file
+        ready = avatars.start(current_user, source_hash)
+        db.session.commit()
         
-        # Resize and save image
-        try:
-            output_size = (125, 125)
-            img = Image.open(file)
-            img.thumbnail(output_size)
-            img.save(picture_path)
-            
-            # Delete old image if not default
-            if current_user.image_file != 'default.png':
-                old_path = os.path.join('lotusrpg/static/profile_pics', current_user.image_file)
-                if os.path.exists(old_path):
-                    os.remove(old_path)
-            
-            # Update user record
-            current_user.image_file = picture_fn
-            db.session.commit()
-            
+        if ready:
+            avatars.unlink([os.path.basename(upload_path)])
+            avatars.unlink(avatars.release_file(previous))
             return api_response(
-                data={'image_file': picture_fn},
+                data=avatars.describe(current_user),
                 message='Avatar updated successfully'
             )
-            
-        except Exception as e:
-            return api_error('Error processing image', 500)
+        
+        future = avatars.schedule(source_hash, upload_path)
+        if future is not None and future.done():
+            # Processed inline (MEDIA_WORKERS = 0) or already finished
+            db.session.refresh(current_user)
+        if current_user.avatar_status == avatars.FAILED:
+            return api_error('Error processing image', 400, data=avatars.describe(current_user))
+        if current_user.avatar_status == avatars.PENDING:
+            return api_response(
+                data=avatars.describe(current_user),
+                message='Avatar is being processed',
+                status=202
+            )
+        return api_response(
+            data=avatars.describe(current_user),
+            message='Avatar updated successfully'
+        )
 
 # Register routes
 api.add_resource(UserProfileResource, '/users/profile')
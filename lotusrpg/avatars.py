@@ -0,0 +1,271 @@
+# lotusrpg/avatars.py
+"""Avatar uploads, resized in the media pool.
+
+An upload is copied to a temporary file in chunks, refused past
+``AVATAR_MAX_BYTES``, and checked from its header alone for being an image
+of at most ``AVATAR_MAX_PIXELS`` pixels. The user's avatar is then marked
+pending and the media pool renders a square WebP for every size in
+``AVATAR_SIZES``, named after the content hash so identical uploads share
+their files. When the files are ready ``image_file`` switches to them and
+the user's sockets get an ``avatar_ready`` (or ``avatar_failed``) event;
+``GET /users/avatar`` reports the same state for clients that poll.
+"""
+import hashlib
+import os
+import re
+import tempfile
+import threading
+
+from flask import current_app
+from PIL import Image as PILImage, UnidentifiedImageError
+from sqlalchemy import or_, select
+
+from lotusrpg import media
+from lotusrpg.forum import bump_users
+from lotusrpg.identity import identity_cache
+from lotusrpg.media import images as encoding
+from lotusrpg.models import User, db
+
+ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
+DEFAULT_SIZES = (64, 128, 256)
+DEFAULT_IMAGE = 'default.png'
+# ``image_file`` names the smallest variant at least this wide, the size of the old thumbnails
+DISPLAY_SIZE = 125
+CHUNK_SIZE = 64 * 1024
+
+PENDING = 'pending'
+FAILED = 'failed'
+READY = 'ready'
+
+_VARIANT = re.compile(r'^([0-9a-f]{64})-\d+\.webp$')
+
+_pending = set()  # content hashes with rendering queued in this process
+_pending_lock = threading.Lock()
+
+
+class AvatarError(ValueError):
+    """Raised for uploads that are not usable avatars"""
+
+    status = 400
+
+
+class AvatarTooLarge(AvatarError):
+    status = 413
+
+
+def folder():
+    return current_app.config.get(
+        'AVATAR_FOLDER',
+        os.path.join(current_app.root_path, 'static', 'profile_pics')
+    )
+
+
+def url(file_name):
+    return current_app.config.get('AVATAR_URL_PREFIX', '/static/profile_pics').rstrip('/') + '/' + file_name
+
+
+def sizes():
+    return tuple(sorted(set(current_app.config.get('AVATAR_SIZES', DEFAULT_SIZES))))
+
+
+def max_bytes():
+    return current_app.config.get('AVATAR_MAX_BYTES', 5 * 1024 * 1024)
+
+
+def max_pixels():
+    return current_app.config.get('AVATAR_MAX_PIXELS', 4096 * 4096)
+
+
+def display_name(source_hash):
+    size = next((size for size in sizes() if size >= DISPLAY_SIZE), sizes()[-1])
+    return encoding.avatar_name(source_hash, size)
+
+
+def _check(path):
+    """Reject files that are not images or have too many pixels, without decoding them"""
+    try:
+        with PILImage.open(path) as img:
+            width, height = img.size
+            img.verify()
+    except PILImage.DecompressionBombError:
+        raise AvatarError('Image dimensions are too large')
+    except (UnidentifiedImageError, OSError, SyntaxError):
+        raise AvatarError('Invalid image file')
+    if width * height > max_pixels():
+        raise AvatarError('Image dimensions are too large')
+
+
+def receive(file):
+    """Copy an uploaded file to a temporary file, hashing it on the way.
+
+    Returns ``(content_hash, upload_path)``; the upload is removed once
+    processed. Raises ``AvatarError``.
+    """
+    ext = file.filename.rsplit('.', 1)[1].lower() if '.' in file.filename else ''
+    if ext not in ALLOWED_EXTENSIONS:
+        raise AvatarError('Invalid file type. Use PNG, JPG, JPEG, GIF or WEBP')
+
+    os.makedirs(folder(), exist_ok=True)
+    limit = max_bytes()
+    digest = hashlib.sha256()
+    received = 0
+    fd, upload_path = tempfile.mkstemp(dir=folder(), suffix='.upload')
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            while True:
+                chunk = file.stream.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                received += len(chunk)
+                if received > limit:
+                    raise AvatarTooLarge(f'Avatar exceeds {limit} bytes')
+                digest.update(chunk)
+                out.write(chunk)
+        _check(upload_path)
+    except Exception:
+        _remove(upload_path)
+        raise
+    return digest.hexdigest(), upload_path
+
+
+def start(user, source_hash):
+    """Point ``user``'s avatar at an upload; the caller commits, then calls ``schedule``.
+
+    Returns True when the files already exist, from an identical upload,
+    and the avatar is switched over at once.
+    """
+    identity_cache.invalidate(user.id)
+    user.avatar_hash = source_hash
+    if all(os.path.exists(os.path.join(folder(), encoding.avatar_name(source_hash, size))) for size in sizes()):
+        user.avatar_status = None
+        user.image_file = display_name(source_hash)
+        bump_users()
+        return True
+    user.avatar_status = PENDING
+    return False
+
+
+def schedule(source_hash, upload_path):
+    """Queue rendering of an upload, unless the same file is already queued in this worker.
+
+    Returns the pool future, or ``None``.
+    """
+    with _pending_lock:
+        queued = source_hash in _pending
+        _pending.add(source_hash)
+    if queued:
+        _remove(upload_path)
+        return None
+
+    def done(results):
+        try:
+            finish(source_hash)
+        finally:
+            settle()
+
+    def failed(exc):
+        try:
+            fail(source_hash, str(exc) if isinstance(exc, ValueError) else 'Error processing image')
+        finally:
+            settle()
+
+    def settle():
+        _remove(upload_path)
+        with _pending_lock:
+            _pending.discard(source_hash)
+
+    return media.submit(
+        encoding.render_avatar,
+        upload_path, folder(), source_hash, sizes(), max_pixels(),
+        on_done=done, on_error=failed,
+    )
+
+
+def _waiting(source_hash):
+    return User.query.filter_by(avatar_hash=source_hash, avatar_status=PENDING).all()
+
+
+def finish(source_hash):
+    """Switch every user waiting on ``source_hash`` to its rendered files"""
+    from lotusrpg.websockets import notify_user
+
+    users = _waiting(source_hash)
+    if not users:
+        # Everyone who uploaded it has moved on
+        unlink(release(source_hash))
+        return
+
+    previous = [user.image_file for user in users]
+    for user in users:
+        user.image_file = display_name(source_hash)
+        user.avatar_status = None
+    identity_cache.invalidate(*(user.id for user in users))
+    bump_users()
+    db.session.commit()
+
+    for file_name in previous:
+        unlink(release_file(file_name))
+    for user in users:
+        notify_user(user.id, 'avatar_ready', describe(user))
+
+
+def fail(source_hash, message):
+    from lotusrpg.websockets import notify_user
+
+    users = _waiting(source_hash)
+    for user in users:
+        user.avatar_status = FAILED
+    if users:
+        identity_cache.invalidate(*(user.id for user in users))
+        db.session.commit()
+    for user in users:
+        notify_user(user.id, 'avatar_failed', {**describe(user), 'message': message})
+
+
+def describe(user):
+    """Avatar state for the API: status, current file and the URL of every size"""
+    match = _VARIANT.match(user.image_file or '')
+    return {
+        'status': user.avatar_status or READY,
+        'image_file': user.image_file,
+        'url': url(user.image_file or DEFAULT_IMAGE),
+        'sizes': {
+            str(size): url(encoding.avatar_name(match.group(1), size)) for size in sizes()
+        } if match else {},
+    }
+
+
+def release(source_hash):
+    """File names of a content hash no user shows or waits on any more"""
+    still_used = db.session.execute(
+        select(User.id).where(or_(
+            User.avatar_hash == source_hash,
+            User.image_file.like(f'{source_hash}-%'),
+        )).limit(1)
+    ).first()
+    if still_used or not os.path.isdir(folder()):
+        return []
+    return [name for name in os.listdir(folder()) if name.startswith(f'{source_hash}-')]
+
+
+def release_file(file_name):
+    """Files to delete now that a user no longer shows ``file_name``; call after commit"""
+    if not file_name or file_name == DEFAULT_IMAGE:
+        return []
+    match = _VARIANT.match(file_name)
+    if match:
+        return release(match.group(1))
+    # Thumbnails from before content hashing belonged to a single user
+    return [file_name]
+
+
+def unlink(file_names):
+    for name in file_names:
+        _remove(os.path.join(folder(), name))
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,218 @@
+# lotusrpg/commands.py
+"""Maintenance commands, available as ``flask <group> <command>``"""
+import json
+import os
+import time
+
+import click
+from flask.cli import AppGroup
+
+from lotusrpg import db
+
+rules_cli = AppGroup('rules', help='Rulebook maintenance commands.')
+forum_cli = AppGroup('forum', help='Forum maintenance commands.')
+users_cli = AppGroup('users', help='User account commands.')
+stats_cli = AppGroup('stats', help='Admin dashboard statistics commands.')
+
+
+@rules_cli.command('rebuild-paths')
+def rebuild_paths_command():
+    """Recompute materialized section paths from parent_id."""
+    from lotusrpg.rules import hierarchy
+
+    updated = hierarchy.rebuild_paths()
+    db.session.commit()
+    click.echo(f'Updated {updated} section paths')
+
+
+@rules_cli.command('backfill-snapshots')
+def backfill_snapshots_command():
+    """Snapshot sections that predate the snapshot table, for bundles and section reads."""
+    from lotusrpg import revisions
+    from lotusrpg.rules import RULEBOOKS, revision_key, snapshots
+
+    created = 0
+    for rulebook in RULEBOOKS:
+        created += snapshots.backfill(rulebook, revisions.current(revision_key(rulebook)))
+    db.session.commit()
+    click.echo(f'Created {created} section snapshots')
+
+
+@rules_cli.command('import-blocks')
+@click.argument('files', nargs=-1, required=True, type=click.Path(exists=True, dir_okay=False))
+@click.option('--slug', help='Target section slug (defaults to each file name without extension).')
+@click.option('--dry-run', is_flag=True, help='Report the changes without saving them.')
+def import_blocks_command(files, slug, dry_run):
+    """Replace section contents from JSON or Markdown files.
+
+    JSON files hold a block list (or {"blocks": [...]}); Markdown files are
+    converted with lotusrpg.rules.blocks.parse_markdown. Each file is applied
+    in its own transaction.
+    """
+    from marshmallow import ValidationError
+    from lotusrpg.models import Section
+    from lotusrpg.rules import blocks
+    from lotusrpg.rules.search import rules_index
+    from lotusrpg.schemas import SectionBlocksSchema
+
+    if slug and len(files) > 1:
+        raise click.UsageError('--slug can only be used with a single file')
+
+    schema = SectionBlocksSchema()
+    failed = False
+    for path in files:
+        target = slug or os.path.splitext(os.path.basename(path))[0]
+        section = Section.query.filter_by(slug=target).first()
+        if section is None:
+            click.echo(f'{path}: no section with slug {target!r}', err=True)
+            failed = True
+            continue
+
+        try:
+            with open(path, encoding='utf-8') as f:
+                if path.lower().endswith(('.md', '.markdown')):
+                    raw = blocks.parse_markdown(f.read())
+                else:
+                    raw = json.load(f)
+            if isinstance(raw, list):
+                raw = {'blocks': raw}
+            data = schema.load(raw)
+            block_list = blocks.match_existing(section, data['blocks'])
+            summary, versions = blocks.replace_section_blocks(section, block_list)
+        except (ValidationError, ValueError, OSError) as e:
+            # ValueError covers BlockError and malformed JSON or UTF-8
+            db.session.rollback()
+            click.echo(f'{path}: {e}', err=True)
+            failed = True
+            continue
+
+        if dry_run:
+            db.session.rollback()
+        else:
+            db.session.commit()
+            if versions:
+                rules_index.section_contents_replaced(section, versions)
+
+        click.echo(
+            f"{path} -> {target}: {summary['inserted']} inserted, {summary['updated']} updated, "
+            f"{summary['deleted']} deleted, {summary['unchanged']} unchanged"
+            + (' (dry run)' if dry_run else '')
+        )
+
+    if failed:
+        raise SystemExit(1)
+
+
+@rules_cli.command('image-variants')
+def image_variants_command():
+    """Generate missing responsive variants for every rulebook image.
+
+    Images stored before variants existed are hashed and measured first.
+    Files shared by several images are processed once.
+    """
+    from concurrent.futures import wait
+    from lotusrpg.models import Image
+    from lotusrpg.rules import images
+
+    hashed = images.backfill_hashes()
+    db.session.commit()
+    if hashed:
+        click.echo(f'Hashed {hashed} existing images')
+
+    futures = [future for future in map(images.schedule, Image.query.all()) if future is not None]
+    done, _ = wait(futures)
+    failed = sum(1 for future in done if future.exception() is not None)
+    click.echo(f'Generated variants for {len(futures) - failed} files' + (f', {failed} failed' if failed else ''))
+    if failed:
+        raise SystemExit(1)
+
+
+@forum_cli.command('reconcile')
+@click.option('--dry-run', is_flag=True, help='Only report posts whose counters have drifted.')
+def reconcile_command(dry_run):
+    """Repair stored comment counts and last-activity times from the comments table."""
+    from lotusrpg.forum import bump_forum, counters
+
+    if dry_run:
+        post_ids = counters.drifted()
+    else:
+        post_ids = counters.reconcile()
+        if post_ids:
+            bump_forum(*post_ids)
+            db.session.commit()
+    click.echo(f"{len(post_ids)} posts {'need repair' if dry_run else 'repaired'}")
+
+
+@forum_cli.command('hot-scores')
+def hot_scores_command():
+    """Recompute hot feed scores now instead of waiting for the background job."""
+    from lotusrpg.forum import hot
+
+    click.echo(f'Updated {hot.refresh_scores()} post scores')
+
+
+@forum_cli.command('rebuild-threads')
+def rebuild_threads_command():
+    """Recompute comment thread paths and reply counts from parent ids."""
+    from lotusrpg.forum import bump_forum, threads
+    from lotusrpg.models import Comment
+
+    changed = threads.rebuild()
+    if changed:
+        bump_forum(*(post_id for (post_id,) in db.session.query(Comment.post_id).distinct()))
+        db.session.commit()
+    click.echo(f'{changed} comments updated')
+
+
+@users_cli.command('import')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--role', 'roles', multiple=True, help='Role given to every imported user (repeatable).')
+@click.option('--batch-size', default=1000, show_default=True, help='Users hashed, inserted and committed together.')
+@click.option('--workers', type=int, help='Password hashing processes (defaults to PASSWORD_WORKERS).')
+@click.option('--dry-run', is_flag=True, help='Validate and de-duplicate without hashing or saving.')
+def import_users_command(path, roles, batch_size, workers, dry_run):
+    """Import user accounts from a CSV or JSON Lines file.
+
+    Records need email, username and either password or password_hash (a
+    hash from a Flask-Security install with the same password salt); roles
+    and active are optional. Users whose email or username already exists
+    are skipped, so an interrupted import can be run again.
+    """
+    from lotusrpg.passwords import hasher
+    from lotusrpg.user_import import UserImportError, UserImporter, read_records
+
+    if workers is not None:
+        hasher.shutdown()
+        hasher.workers = workers
+
+    def report(stats):
+        click.echo(f'{stats.imported} users imported, {stats.read} read ({stats.rate:.0f} users/s)')
+
+    try:
+        importer = UserImporter(
+            batch_size=batch_size,
+            default_roles=roles,
+            dry_run=dry_run,
+            on_error=lambda line_number, message: click.echo(f'{path}:{line_number}: {message}', err=True),
+            on_batch=report,
+        )
+        stats = importer.run(read_records(path))
+    except UserImportError as e:
+        raise click.UsageError(str(e))
+
+    click.echo(
+        f'{stats.imported} imported, {stats.duplicates} duplicates skipped, {stats.invalid} invalid '
+        f'in {time.monotonic() - stats.started:.1f}s ({stats.rate:.0f} users/s)'
+        + (' (dry run)' if dry_run else '')
+    )
+    if stats.invalid:
+        raise SystemExit(1)
+
+
+@stats_cli.command('reconcile')
+def reconcile_stats_command():
+    """Recount the dashboard counters from the tables and repair any that drifted."""
+    from lotusrpg import stats
+
+    drifted = stats.reconcile()
+    click.echo(f"{len(drifted)} counters repaired" + (f": {', '.join(drifted)}" if drifted else ''))
@@ -0,0 +1,37 @@
+# lotusrpg/forum/__init__.py
+"""Forum services shared by the forum API, background jobs and the CLI"""
+
+FORUM_KEY = 'forum'   # any post or comment change
+USERS_KEY = 'users'   # changes to publicly visible user data (names, avatars, removals)
+
+
+def post_revision_key(post_id):
+    """Revision counter key covering one post and its comments"""
+    return f'forum:post:{post_id}'
+
+
+def post_revision_range():
+    """``(low, high)`` bounds of every post revision key; keys compare bytewise"""
+    prefix = post_revision_key('')
+    # ';' is the character after the ':' that ends the prefix
+    return prefix, prefix[:-1] + ';'
+
+
+def bump_forum(*post_ids):
+    """Record a forum write touching ``post_ids``; call before commit.
+
+    Returns a dict mapping ``FORUM_KEY`` and each post's revision key to
+    its new version.
+    """
+    from lotusrpg import revisions
+
+    versions = {key: revisions.bump(key) for key in {post_revision_key(post_id) for post_id in post_ids}}
+    versions[FORUM_KEY] = revisions.bump(FORUM_KEY)
+    return versions
+
+
+def bump_users():
+    """Record a change to public user data shown alongside posts"""
+    from lotusrpg import revisions
+
+    return revisions.bump(USERS_KEY)
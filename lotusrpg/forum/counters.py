@@ -0,0 +1,81 @@
+# lotusrpg/forum/counters.py
+"""Denormalized per-post comment counts and last-activity timestamps.
+
+Every change is a single UPDATE evaluated by the database, so concurrent
+comment writes cannot lose increments.
+"""
+from sqlalchemy import case, func, select, update
+
+from lotusrpg.models import Comment, Post, db
+
+RECONCILE_BATCH = 500
+
+
+def _comment_total():
+    return (
+        select(func.count(Comment.id))
+        .where(Comment.post_id == Post.id)
+        .scalar_subquery()
+    )
+
+
+def _latest_activity():
+    latest_comment = (
+        select(func.max(Comment.date_posted))
+        .where(Comment.post_id == Post.id)
+        .scalar_subquery()
+    )
+    return func.coalesce(latest_comment, Post.date_posted)
+
+
+def comment_added(post_id, posted_at):
+    db.session.execute(
+        update(Post)
+        .where(Post.id == post_id)
+        .values(comment_count=Post.comment_count + 1, last_activity_at=posted_at),
+        execution_options={'synchronize_session': False}
+    )
+
+
+def comment_removed(post_id, count=1):
+    """Call after the comments' DELETE has been flushed"""
+    db.session.execute(
+        update(Post)
+        .where(Post.id == post_id)
+        .values(
+            comment_count=case((Post.comment_count > count, Post.comment_count - count), else_=0),
+            last_activity_at=_latest_activity(),
+        ),
+        execution_options={'synchronize_session': False}
+    )
+
+
+def refresh(*post_ids):
+    """Recount ``post_ids`` from their comments; the caller commits"""
+    if not post_ids:
+        return
+    db.session.execute(
+        update(Post)
+        .where(Post.id.in_(set(post_ids)))
+        .values(comment_count=_comment_total(), last_activity_at=_latest_activity()),
+        execution_options={'synchronize_session': False}
+    )
+
+
+def drifted():
+    """Ids of posts whose stored counters disagree with their comments"""
+    return db.session.execute(
+        select(Post.id).where(
+            (Post.comment_count != _comment_total())
+            | (Post.last_activity_at != _latest_activity())
+        )
+    ).scalars().all()
+
+
+def reconcile():
+    """Repair every drifted post in batches. Returns the ids that were fixed."""
+    post_ids = drifted()
+    for start in range(0, len(post_ids), RECONCILE_BATCH):
+        refresh(*post_ids[start:start + RECONCILE_BATCH])
+        db.session.commit()
+    return post_ids
@@ -0,0 +1,70 @@
+# lotusrpg/forum/hot.py
+"""Materialized "hot" ranking for the forum feed.
+
+Scores combine recent comment velocity with post age and are written to
+``Post.hot_score`` by a periodic job, so the hot feed is a plain index scan.
+"""
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import func, or_, select, update
+
+from lotusrpg import revisions, tasks
+from lotusrpg.models import Comment, Post, db
+
+HOT_KEY = 'forum:hot'  # bumped whenever scores are rewritten
+
+GRAVITY = 1.5           # how fast age drags a post down
+VELOCITY_WINDOW = 24    # hours of comments that count as recent
+TOTAL_WEIGHT = 0.25     # weight of older comments relative to recent ones
+
+
+def hot_score(comment_count, recent_comments, posted_at, now):
+    age_hours = max(0.0, (now - posted_at).total_seconds() / 3600)
+    points = 1 + recent_comments + TOTAL_WEIGHT * max(0, comment_count - recent_comments)
+    return points / (age_hours + 2) ** GRAVITY
+
+
+def initial_score(now=None):
+    """Score of a brand new post, so it ranks before the next refresh"""
+    now = now or datetime.utcnow()
+    return hot_score(0, 0, now, now)
+
+
+@tasks.periodic('hot-scores', 'HOT_SCORE_INTERVAL', 60)
+def refresh_scores(now=None):
+    """Recompute scores for recently active posts and zero the ones that aged out.
+
+    Returns the number of posts updated.
+    """
+    now = now or datetime.utcnow()
+    horizon = now - timedelta(days=current_app.config.get('HOT_SCORE_HORIZON_DAYS', 7))
+
+    recent = (
+        select(Comment.post_id, func.count(Comment.id).label('recent'))
+        .where(Comment.date_posted >= now - timedelta(hours=VELOCITY_WINDOW))
+        .group_by(Comment.post_id)
+        .subquery()
+    )
+    rows = db.session.execute(
+        select(
+            Post.id, Post.date_posted, Post.comment_count, Post.last_activity_at, Post.hot_score,
+            func.coalesce(recent.c.recent, 0).label('recent'),
+        )
+        .outerjoin(recent, recent.c.post_id == Post.id)
+        .where(or_(Post.last_activity_at >= horizon, Post.hot_score > 0))
+    ).all()
+
+    changes = []
+    for row in rows:
+        score = 0.0
+        if row.last_activity_at >= horizon:
+            score = hot_score(row.comment_count, row.recent, row.date_posted, now)
+        if score != row.hot_score:
+            changes.append({'id': row.id, 'hot_score': score})
+
+    if changes:
+        db.session.execute(update(Post), changes)
+        revisions.bump(HOT_KEY)
+    db.session.commit()
+    return len(changes)
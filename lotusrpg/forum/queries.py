@@ -0,0 +1,31 @@
+# lotusrpg/forum/queries.py
+"""Loading plans and sort orders for forum reads.
+
+Each read endpoint builds its query from these so that serializing a page
+never lazy-loads per row: authors come in through the same statement,
+limited to the columns ``AuthorSchema`` exposes.
+"""
+from sqlalchemy.orm import joinedload
+
+from lotusrpg.models import Comment, Post, User
+
+AUTHOR_COLUMNS = (User.id, User.username, User.image_file)
+
+# Sort orders for post listings, as keyset pagination columns
+POST_SORTS = {
+    'recent': (Post.date_posted, Post.id),
+    'activity': (Post.last_activity_at, Post.id),
+    'hot': (Post.hot_score, Post.id),
+}
+
+
+def posts():
+    """Posts with their authors, for list pages and single-post reads"""
+    return Post.query.options(joinedload(Post.author).load_only(*AUTHOR_COLUMNS))
+
+
+def comments(post_id):
+    """Comments of ``post_id`` with their authors"""
+    return Comment.query.filter_by(post_id=post_id).options(
+        joinedload(Comment.user).load_only(*AUTHOR_COLUMNS)
+    )
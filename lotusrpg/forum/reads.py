@@ -0,0 +1,196 @@
+# lotusrpg/forum/reads.py
+"""Per-user read markers for forum posts.
+
+A marker is a high-water mark: the highest comment id a user has seen on a
+post, or 0 once the post itself has been opened. Comments with a higher id
+are unread. Views only raise the marker in an in-process buffer, which a
+per-process background job writes out in one batch every
+``READ_MARKER_FLUSH_INTERVAL`` seconds, so paging through the forum costs no
+writes per request. Markers only ever move forward, which makes the batches
+from several workers safe to apply in any order.
+"""
+import threading
+
+from flask import current_app
+from sqlalchemy import and_, bindparam, func, insert, or_, select, tuple_, update
+from sqlalchemy.exc import IntegrityError
+
+from lotusrpg import tasks
+from lotusrpg.models import Comment, Post, PostRead, db
+
+BATCH_SIZE = 500
+
+
+class ReadMarkerBuffer:
+    """Marker updates not yet written, coalesced per ``(user_id, post_id)``"""
+
+    def __init__(self):
+        self._marks = {}
+        self._lock = threading.Lock()
+
+    def mark(self, user_id, post_id, comment_id):
+        key = (user_id, post_id)
+        with self._lock:
+            if self._marks.get(key, -1) < comment_id:
+                self._marks[key] = comment_id
+
+    def pending(self, user_id, post_ids):
+        with self._lock:
+            return {
+                post_id: self._marks[(user_id, post_id)]
+                for post_id in post_ids if (user_id, post_id) in self._marks
+            }
+
+    def drain(self):
+        with self._lock:
+            marks, self._marks = self._marks, {}
+        return marks
+
+    def restore(self, marks):
+        """Put back marks whose write failed, keeping any newer ones"""
+        for (user_id, post_id), comment_id in marks.items():
+            self.mark(user_id, post_id, comment_id)
+
+    def discard(self, user_id=None, post_ids=()):
+        post_ids = set(post_ids)
+        with self._lock:
+            for key in [key for key in self._marks if key[0] == user_id or key[1] in post_ids]:
+                del self._marks[key]
+
+
+_buffer = ReadMarkerBuffer()
+
+
+def mark_read(user_id, post_id, comment_id=0):
+    """Record that ``user_id`` has seen ``post_id`` up to ``comment_id``.
+
+    Buffered until the next flush; written at once when background tasks
+    are disabled, as nothing would flush the buffer then. Call outside of a
+    pending transaction.
+    """
+    _buffer.mark(user_id, post_id, comment_id or 0)
+    if not current_app.config.get('BACKGROUND_TASKS', True):
+        flush()
+
+
+def markers(user_id, post_ids):
+    """``{post_id: last read comment id}`` for the posts ``user_id`` has opened"""
+    post_ids = list(post_ids)
+    marks = dict(db.session.execute(
+        select(PostRead.post_id, PostRead.last_comment_id)
+        .where(PostRead.user_id == user_id, PostRead.post_id.in_(post_ids))
+    ).all()) if post_ids else {}
+    for post_id, comment_id in _buffer.pending(user_id, post_ids).items():
+        marks[post_id] = max(marks.get(post_id, -1), comment_id)
+    return marks
+
+
+def unread_counts(user_id, post_ids):
+    """Unread comment counts for a page of posts, in at most three queries.
+
+    Returns ``{post_id: {'seen': bool, 'unread': int}}``. Posts the user has
+    never opened count all their comments as unread, straight from
+    ``Post.comment_count``; the rest are counted together in one grouped
+    query over the comments past each marker.
+    """
+    post_ids = list(dict.fromkeys(post_ids))
+    if not post_ids:
+        return {}
+    comment_counts = dict(db.session.execute(
+        select(Post.id, Post.comment_count).where(Post.id.in_(post_ids))
+    ).all())
+    marks = markers(user_id, comment_counts)
+
+    result = {
+        post_id: {'seen': post_id in marks, 'unread': 0 if post_id in marks else count}
+        for post_id, count in comment_counts.items()
+    }
+    to_count = [post_id for post_id in marks if comment_counts[post_id]]
+    if to_count:
+        rows = db.session.execute(
+            select(Comment.post_id, func.count(Comment.id))
+            .where(or_(*(
+                and_(Comment.post_id == post_id, Comment.id > marks[post_id])
+                for post_id in to_count
+            )))
+            .group_by(Comment.post_id)
+        )
+        for post_id, unread in rows:
+            result[post_id]['unread'] = unread
+    return result
+
+
+@tasks.periodic('read-markers', 'READ_MARKER_FLUSH_INTERVAL', 10, per_process=True)
+def flush():
+    """Write buffered markers in batches. Returns the number written."""
+    marks = _buffer.drain()
+    if not marks:
+        return 0
+    try:
+        items = list(marks.items())
+        for start in range(0, len(items), BATCH_SIZE):
+            _write(dict(items[start:start + BATCH_SIZE]))
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        _buffer.restore(marks)
+        raise
+    return len(marks)
+
+
+def _write(marks):
+    existing = set(db.session.execute(
+        select(PostRead.user_id, PostRead.post_id)
+        .where(tuple_(PostRead.user_id, PostRead.post_id).in_(list(marks)))
+    ).all())
+
+    updates = [
+        {'b_user_id': user_id, 'b_post_id': post_id, 'b_comment_id': comment_id}
+        for (user_id, post_id), comment_id in marks.items() if (user_id, post_id) in existing
+    ]
+    if updates:
+        db.session.execute(_advance_stmt(), updates)
+
+    rows = [
+        {'user_id': user_id, 'post_id': post_id, 'last_comment_id': comment_id}
+        for (user_id, post_id), comment_id in marks.items() if (user_id, post_id) not in existing
+    ]
+    if not rows:
+        return
+    try:
+        with db.session.begin_nested():
+            db.session.execute(insert(PostRead), rows)
+    except IntegrityError:
+        # Another worker inserted some of them first, or the post is gone
+        for row in rows:
+            try:
+                with db.session.begin_nested():
+                    db.session.execute(insert(PostRead), [row])
+            except IntegrityError:
+                db.session.execute(_advance_stmt(), [{
+                    'b_user_id': row['user_id'], 'b_post_id': row['post_id'],
+                    'b_comment_id': row['last_comment_id'],
+                }])
+
+
+def _advance_stmt():
+    table = PostRead.__table__
+    return (
+        update(table)
+        .where(
+            table.c.user_id == bindparam('b_user_id'),
+            table.c.post_id == bindparam('b_post_id'),
+            table.c.last_comment_id < bindparam('b_comment_id'),
+        )
+        .values(last_comment_id=bindparam('b_comment_id'))
+    )
+
+
+def forget(user_id=None, post_ids=()):
+    """Delete the markers of a user or of posts being deleted; the caller commits"""
+    _buffer.discard(user_id, post_ids)
+    query = PostRead.query
+    if user_id is not None:
+        query.filter_by(user_id=user_id).delete(synchronize_session=False)
+    if post_ids:
+        query.filter(PostRead.post_id.in_(post_ids)).delete(synchronize_session=False)
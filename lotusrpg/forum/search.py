@@ -0,0 +1,284 @@
+# lotusrpg/forum/search.py
+"""Full-text index over forum posts and comments"""
+import threading
+import time
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import select
+
+from lotusrpg.forum import FORUM_KEY, USERS_KEY, post_revision_key, post_revision_range
+from lotusrpg.models import Comment, Post, Revision, User, db
+from lotusrpg.revisions import RevisionTracker
+from lotusrpg.search import InvertedIndex, highlight
+
+TITLE_WEIGHT = 3
+RECENCY_WEIGHT = 0.5      # how much a brand new match outranks an old one
+RECENCY_HALF_LIFE = 30.0  # days until the recency bonus halves
+AUTHOR_BATCH = 500        # user ids per query when refreshing author names
+
+
+def recency_boost(posted_at, now=None):
+    age_days = max(0.0, ((now or datetime.utcnow()) - posted_at).total_seconds() / 86400)
+    return 1 + RECENCY_WEIGHT * 0.5 ** (age_days / RECENCY_HALF_LIFE)
+
+
+class ForumSearchIndex:
+    """Inverted index of post titles, post bodies and comments.
+
+    Built lazily on the first search and patched in place by the forum
+    write paths, which also record the post revisions their writes produced.
+    Changes made by other workers are caught up incrementally: every write
+    bumps the revision row of each post it touched, so the posts whose row
+    moved past the recorded revision are re-read and re-indexed alone,
+    deleted ones dropped, and renamed authors updated in place. The rows are
+    polled from ``FORUM_SEARCH_CATCH_UP_LAG`` seconds before the latest bump
+    seen, so writes that commit late or come from a worker with a skewed
+    clock are not missed. A full rebuild runs on first use and at most every
+    ``FORUM_SEARCH_REBUILD_INTERVAL`` seconds to reconcile anything else.
+    Only ids and display fields are held per document; snippet text is read
+    back for the returned hits alone.
+    """
+
+    def __init__(self):
+        self._index = InvertedIndex()
+        self._tracker = RevisionTracker(FORUM_KEY, USERS_KEY)
+        self._by_post = {}  # post id -> set of comment doc ids
+        self._post_versions = {}  # post id -> revision the indexed docs reflect
+        self._high_water = None  # latest post revision bump seen
+        self._authors = {}  # user id -> username as indexed
+        self._built_at = None  # monotonic time of the last full rebuild
+        self._lock = threading.RLock()
+
+    def ensure_current(self):
+        with self._lock:
+            if self._tracker.is_current():
+                return
+            built = self._tracker.versions
+            interval = current_app.config.get('FORUM_SEARCH_REBUILD_INTERVAL', 3600)
+            if not built or time.monotonic() - self._built_at >= interval:
+                self.rebuild()
+                return
+            versions = self._tracker.snapshot()
+            if built.get(FORUM_KEY) != versions[FORUM_KEY]:
+                self._catch_up()
+            if built.get(USERS_KEY) != versions[USERS_KEY]:
+                self._refresh_authors()
+            self._tracker.mark_built(versions)
+
+    def rebuild(self):
+        with self._lock:
+            versions = self._tracker.snapshot()
+            post_versions, high_water = self._post_revisions()
+            self._index.clear()
+            self._by_post = {}
+            self._authors = {}
+            self._load()
+            self._post_versions = post_versions
+            self._high_water = high_water
+            self._built_at = time.monotonic()
+            self._tracker.mark_built(versions)
+
+    def _load(self, post_ids=None):
+        """Index the posts ``post_ids`` (all of them if None) with their comments"""
+        posts = (
+            select(Post.id, Post.title, Post.content, Post.date_posted, Post.user_id, User.username)
+            .join(User, Post.user_id == User.id)
+        )
+        comments = (
+            select(
+                Comment.id, Comment.post_id, Comment.content, Comment.date_posted,
+                Comment.user_id, User.username, Post.title,
+            )
+            .join(User, Comment.user_id == User.id)
+            .join(Post, Comment.post_id == Post.id)
+        )
+        if post_ids is not None:
+            posts = posts.where(Post.id.in_(post_ids))
+            comments = comments.where(Comment.post_id.in_(post_ids))
+
+        for row in db.session.execute(posts):
+            self._add_post(row.id, row.title, row.content, row.date_posted, row.user_id, row.username)
+        for row in db.session.execute(comments):
+            self._add_comment(
+                row.id, row.post_id, row.content, row.date_posted,
+                row.user_id, row.username, row.title,
+            )
+
+    def _post_revisions(self, since=None):
+        """``({post_id: version}, latest bump)`` of post revision rows bumped at or after ``since``"""
+        low, high = post_revision_range()
+        query = select(Revision.key, Revision.version, Revision.updated_at).where(
+            Revision.key >= low, Revision.key < high
+        )
+        if since is not None:
+            query = query.where(Revision.updated_at >= since)
+        versions, high_water = {}, None
+        for row in db.session.execute(query):
+            versions[int(row.key.rsplit(':', 1)[1])] = row.version
+            high_water = row.updated_at if high_water is None else max(high_water, row.updated_at)
+        return versions, high_water
+
+    def _catch_up(self):
+        """Re-index the posts other workers changed since the last check"""
+        since = None
+        if self._high_water is not None:
+            since = self._high_water - timedelta(seconds=current_app.config.get('FORUM_SEARCH_CATCH_UP_LAG', 300))
+        changed, high_water = self._post_revisions(since)
+        stale = [post_id for post_id, version in changed.items() if self._post_versions.get(post_id) != version]
+        if stale:
+            for post_id in stale:
+                self._drop_post(post_id)
+            self._load(stale)
+        self._post_versions.update(changed)
+        if high_water is not None and (self._high_water is None or high_water > self._high_water):
+            self._high_water = high_water
+
+    def _refresh_authors(self):
+        """Update the author names shown on hits after users were renamed"""
+        user_ids = list(self._authors)
+        names = {}
+        for start in range(0, len(user_ids), AUTHOR_BATCH):
+            names.update(db.session.execute(
+                select(User.id, User.username).where(User.id.in_(user_ids[start:start + AUTHOR_BATCH]))
+            ).all())
+        renamed = {
+            user_id: names[user_id] for user_id, username in self._authors.items()
+            if user_id in names and names[user_id] != username
+        }
+        if not renamed:
+            return
+        for doc_id, meta in self._index.documents(lambda meta: meta['author_id'] in renamed):
+            self._index.update_meta(doc_id, author=renamed[meta['author_id']])
+        self._authors.update(renamed)
+
+    def _drop_post(self, post_id):
+        self._index.remove(('post', post_id))
+        for doc_id in self._by_post.pop(post_id, ()):
+            self._index.remove(doc_id)
+
+    def _add_post(self, post_id, title, content, date_posted, user_id, username):
+        self._index.add(('post', post_id), [(title, TITLE_WEIGHT), (content, 1)], {
+            'type': 'post',
+            'post_id': post_id,
+            'comment_id': None,
+            'title': title,
+            'author_id': user_id,
+            'author': username,
+            'date_posted': date_posted,
+        })
+        self._authors[user_id] = username
+
+    def _add_comment(self, comment_id, post_id, content, date_posted, user_id, username, title):
+        doc_id = ('comment', comment_id)
+        self._index.add(doc_id, [(content, 1)], {
+            'type': 'comment',
+            'post_id': post_id,
+            'comment_id': comment_id,
+            'title': title,
+            'author_id': user_id,
+            'author': username,
+            'date_posted': date_posted,
+        })
+        self._by_post.setdefault(post_id, set()).add(doc_id)
+        self._authors[user_id] = username
+
+    # Incremental maintenance, called by the forum write paths after commit.
+    # ``versions`` is the dict returned by ``bump_forum``.
+
+    def post_saved(self, post, versions):
+        with self._lock:
+            self._add_post(post.id, post.title, post.content, post.date_posted, post.user_id, post.author.username)
+            for doc_id in self._by_post.get(post.id, ()):
+                self._index.update_meta(doc_id, title=post.title)
+            self._advance(post.id, versions)
+
+    def post_deleted(self, post_id, versions):
+        with self._lock:
+            self._drop_post(post_id)
+            self._post_versions[post_id] = versions[post_revision_key(post_id)]
+            self._tracker.advance(FORUM_KEY, versions[FORUM_KEY])
+
+    def comment_saved(self, comment, versions):
+        with self._lock:
+            self._add_comment(
+                comment.id, comment.post_id, comment.content, comment.date_posted,
+                comment.user_id, comment.user.username, comment.post.title,
+            )
+            self._advance(comment.post_id, versions)
+
+    def comments_deleted(self, comment_ids, post_id, versions):
+        """Drop a deleted comment and its replies"""
+        with self._lock:
+            for comment_id in comment_ids:
+                doc_id = ('comment', comment_id)
+                self._index.remove(doc_id)
+                self._by_post.get(post_id, set()).discard(doc_id)
+            self._advance(post_id, versions)
+
+    def _advance(self, post_id, versions):
+        """Record a local write so catching up does not re-index it.
+
+        If another worker changed the post in between, the post keeps its
+        older revision and is re-read on the next catch up.
+        """
+        version = versions[post_revision_key(post_id)]
+        if self._post_versions.get(post_id, 0) == version - 1:
+            self._post_versions[post_id] = version
+        self._tracker.advance(FORUM_KEY, versions[FORUM_KEY])
+
+    def matching_posts(self, query):
+        """Ids of the posts whose title or body contains every query word"""
+        self.ensure_current()
+        return {doc_id[1] for doc_id in self._index.matching(query) if doc_id[0] == 'post'}
+
+    def search(self, query, author=None, limit=20):
+        """Rank posts and comments by BM25 relevance with a recency bonus.
+
+        ``author`` filters by username. Each hit carries an HTML-escaped
+        snippet with the matching words wrapped in ``<mark>``.
+        """
+        self.ensure_current()
+        predicate = None
+        if author:
+            author = author.lower()
+            predicate = lambda meta: meta['author'].lower() == author
+        now = datetime.utcnow()
+        hits = self._index.search(
+            query, limit=limit, predicate=predicate,
+            boost=lambda meta: recency_boost(meta['date_posted'], now),
+        )
+        texts = self._texts([meta for _score, _doc_id, meta in hits])
+
+        results = []
+        for score, doc_id, meta in hits:
+            text = texts.get(doc_id)
+            if text is None:
+                # Deleted by another worker since the index was checked
+                continue
+            results.append({
+                'type': meta['type'],
+                'post_id': meta['post_id'],
+                'comment_id': meta['comment_id'],
+                'title': meta['title'],
+                'author': {'id': meta['author_id'], 'username': meta['author']},
+                'date_posted': meta['date_posted'].isoformat(),
+                'snippet': highlight(text, query),
+                'score': round(score, 4),
+            })
+        return results
+
+    def _texts(self, metas):
+        post_ids = [meta['post_id'] for meta in metas if meta['type'] == 'post']
+        comment_ids = [meta['comment_id'] for meta in metas if meta['type'] == 'comment']
+        texts = {}
+        if post_ids:
+            for row in db.session.execute(select(Post.id, Post.content).where(Post.id.in_(post_ids))):
+                texts[('post', row.id)] = row.content
+        if comment_ids:
+            for row in db.session.execute(select(Comment.id, Comment.content).where(Comment.id.in_(comment_ids))):
+                texts[('comment', row.id)] = row.content
+        return texts
+
+
+forum_index = ForumSearchIndex()
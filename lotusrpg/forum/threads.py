@@ -0,0 +1,213 @@
+# lotusrpg/forum/threads.py
+"""Threaded comments on top of ``Comment.path``.
+
+Replies carry their ancestors' ids in ``path`` (see lotusrpg.tree), so a
+thread, or a page of top-level threads with all their replies, is one range
+scan of the ``(post_id, path)`` index. ``reply_count`` holds the size of each
+comment's subtree and is adjusted on every insert and delete.
+"""
+import threading
+from collections import OrderedDict
+
+from sqlalchemy import String, and_, delete, func, select, update
+from sqlalchemy.orm import aliased
+
+from lotusrpg import tree
+from lotusrpg.forum import queries
+from lotusrpg.models import Comment, db
+
+# Posts known to have no comments without a path, least recently used first.
+# Forgetting one only costs a re-check, so the set is simply capped.
+VERIFIED_POSTS_MAX = 10000
+_verified_posts = OrderedDict()
+_verified_lock = threading.Lock()
+
+
+class ThreadError(ValueError):
+    """Raised for replies that cannot be attached where requested"""
+
+
+def place(comment):
+    """Set the path of a new comment and count it in its ancestors; flushes for the id"""
+    parent = None
+    if comment.parent_id is not None:
+        parent = db.session.get(Comment, comment.parent_id)
+        if parent is None or parent.post_id != comment.post_id:
+            raise ThreadError('Parent comment not found')
+        ensure_paths(comment.post_id)
+
+    db.session.flush()
+    comment.path = tree.child_path(parent.path if parent else None, comment.id)
+    ancestors = tree.ancestor_ids(comment.path)
+    if ancestors:
+        db.session.execute(
+            update(Comment)
+            .where(Comment.id.in_(ancestors))
+            .values(reply_count=Comment.reply_count + 1),
+            execution_options={'synchronize_session': False}
+        )
+
+
+def delete_subtree(comment):
+    """Delete ``comment`` with all its replies. Returns the deleted ids."""
+    ensure_paths(comment.post_id)
+    ids = db.session.execute(
+        select(Comment.id).where(
+            Comment.post_id == comment.post_id,
+            tree.within(Comment.path, comment.path),
+        )
+    ).scalars().all()
+
+    ancestors = tree.ancestor_ids(comment.path)
+    if ancestors:
+        db.session.execute(
+            update(Comment)
+            .where(Comment.id.in_(ancestors))
+            .values(reply_count=Comment.reply_count - len(ids)),
+            execution_options={'synchronize_session': False}
+        )
+    db.session.execute(
+        delete(Comment).where(Comment.id.in_(ids)),
+        execution_options={'synchronize_session': False}
+    )
+    db.session.expunge(comment)
+    return ids
+
+
+def subtree_ids_by_user(user_id):
+    """Ids of every comment written by ``user_id`` and of all replies beneath them"""
+    authored = aliased(Comment)
+    high = func.substr(authored.path, 1, func.length(authored.path) - 1, type_=String) + '0'
+    return db.session.execute(
+        select(Comment.id, Comment.post_id).join(authored, and_(
+            authored.user_id == user_id,
+            Comment.post_id == authored.post_id,
+            Comment.path >= authored.path,
+            Comment.path < high,
+        )).distinct()
+    ).all()
+
+
+def ensure_paths(post_id):
+    """Backfill paths for comments on ``post_id`` that predate threading.
+
+    Returns True if anything changed; the caller commits.
+    """
+    with _verified_lock:
+        if post_id in _verified_posts:
+            _verified_posts.move_to_end(post_id)
+            return False
+    missing = db.session.execute(
+        select(Comment.id).where(Comment.post_id == post_id, Comment.path.is_(None)).limit(1)
+    ).first()
+    if missing:
+        rebuild(post_id)
+    with _verified_lock:
+        _verified_posts[post_id] = True
+        while len(_verified_posts) > VERIFIED_POSTS_MAX:
+            _verified_posts.popitem(last=False)
+    return bool(missing)
+
+
+def rebuild(*post_ids):
+    """Recompute paths and reply counts from ``parent_id`` (all posts if none given).
+
+    Returns the number of comments changed; the caller commits.
+    """
+    query = select(Comment.id, Comment.post_id, Comment.parent_id, Comment.path, Comment.reply_count)
+    if post_ids:
+        query = query.where(Comment.post_id.in_(post_ids))
+    rows = db.session.execute(query).all()
+
+    by_post = {}
+    for row in rows:
+        by_post.setdefault(row.post_id, []).append(row)
+
+    changes = []
+    for post_rows in by_post.values():
+        paths = tree.resolve_paths({row.id: row.parent_id for row in post_rows})
+        counts = tree.descendant_counts(paths.values())
+        for row in post_rows:
+            path = paths[row.id]
+            if row.path != path or row.reply_count != counts[path]:
+                changes.append({'id': row.id, 'path': path, 'reply_count': counts[path]})
+
+    if changes:
+        db.session.execute(update(Comment), changes)
+        db.session.expire_all()
+    return len(changes)
+
+
+def load_threads(post_id, per_page, after=None, before=None):
+    """A page of top-level threads of ``post_id`` with all their replies.
+
+    ``after`` is the path of the last top-level comment already shown, or
+    ``before`` that of the first one, to page backwards. One statement: a
+    range scan from the page boundary up to the root that starts the next
+    (or ends the previous) page, found by a correlated subquery. Returns the
+    comments in thread order, the root path to continue after (None on the
+    last page) and the root path to go back before (None on the first page).
+    """
+    roots = select(Comment.path).where(Comment.post_id == post_id, Comment.parent_id.is_(None))
+    if before is not None:
+        boundary = (
+            roots.where(Comment.path < before)
+            .order_by(Comment.path.desc())
+            .offset(per_page)
+            .limit(1)
+            .scalar_subquery()
+        )
+        # Everything past the subtree of the root just before this page
+        subtree_end = func.substr(boundary, 1, func.length(boundary) - 1, type_=String) + '0'
+        bounds = (Comment.path >= func.coalesce(subtree_end, ''), Comment.path < before)
+    else:
+        start = tree.subtree_range(after)[1] if after else ''
+        boundary = (
+            roots.where(Comment.path >= start)
+            .order_by(Comment.path)
+            .offset(per_page)
+            .limit(1)
+            .scalar_subquery()
+        )
+        bounds = (Comment.path >= start, Comment.path < func.coalesce(boundary, '~'))
+    rows = (
+        queries.comments(post_id)
+        .add_columns(boundary.label('boundary'))
+        .filter(*bounds)
+        .order_by(Comment.path)
+        .all()
+    )
+    comments = [comment for comment, _boundary in rows]
+    page_roots = [comment.path for comment in comments if comment.parent_id is None]
+    if not page_roots:
+        return comments, None, None
+    more = rows[0].boundary is not None
+    if before is not None:
+        return comments, page_roots[-1], page_roots[0] if more else None
+    return comments, page_roots[-1] if more else None, page_roots[0] if after else None
+
+
+def load_thread(comment):
+    """``comment`` and all of its replies, in thread order, in one range query"""
+    return (
+        queries.comments(comment.post_id)
+        .filter(tree.within(Comment.path, comment.path))
+        .order_by(Comment.path)
+        .all()
+    )
+
+
+def nest(comments, dump):
+    """Arrange path-ordered ``comments`` into trees of ``dump(comment)`` dicts"""
+    nodes = {}
+    roots = []
+    base_depth = None
+    for comment in comments:
+        depth = tree.depth(comment.path)
+        if base_depth is None:
+            base_depth = depth
+        node = {**dump(comment), 'depth': depth - base_depth, 'replies': []}
+        parent = nodes.get(tree.parent_path(comment.path))
+        (parent['replies'] if parent else roots).append(node)
+        nodes[comment.path] = node
+    return roots
@@ -0,0 +1,115 @@
+# lotusrpg/identity.py
+"""Per-process cache of the users behind authenticated sessions.
+
+Flask-Security loads ``current_user`` by ``fs_uniquifier`` on every request.
+The cache keeps a detached snapshot of each recently seen user with their
+roles loaded, and attaches it to the request's session with
+``merge(load=False)``, which issues no SQL. The result is an ordinary
+persistent ``User``: relationships lazy-load and changes flush as usual.
+
+Entries expire after ``IDENTITY_CACHE_TTL`` seconds and whenever the
+``identities`` revision moves. Write paths that change a user's account
+state, profile or roles call ``invalidate`` before committing. Their own
+process drops the entry once the commit succeeds, and other workers notice
+the revision within ``REVISION_CHECK_INTERVAL``.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from flask_security import SQLAlchemyUserDatastore
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session, selectinload
+
+from lotusrpg import revisions
+from lotusrpg.models import User, db
+
+IDENTITY_KEY = 'identities'
+
+
+class IdentityCache:
+    def __init__(self):
+        self.ttl = 60
+        self.max_entries = 1024
+        self.enabled = True
+        self._entries = OrderedDict()  # fs_uniquifier -> (user snapshot, role names, version, loaded at)
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.ttl = app.config.get('IDENTITY_CACHE_TTL', 60)
+        self.max_entries = app.config.get('IDENTITY_CACHE_SIZE', 1024)
+        self.enabled = self.ttl > 0
+
+    def load(self, fs_uniquifier):
+        """The user for a session, attached to ``db.session``; None if there is none"""
+        version = revisions.current(IDENTITY_KEY)
+        with self._lock:
+            entry = self._entries.get(fs_uniquifier)
+            if entry and entry[2] == version and time.monotonic() - entry[3] < self.ttl:
+                self._entries.move_to_end(fs_uniquifier)
+            else:
+                entry = None
+
+        if entry is None:
+            entry = self._fetch(fs_uniquifier, version)
+            if entry is None:
+                return None
+            with self._lock:
+                self._entries[fs_uniquifier] = entry
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+
+        snapshot, role_names = entry[0], entry[1]
+        user = db.session.merge(snapshot, load=False)
+        user._role_names = role_names
+        return user
+
+    def _fetch(self, fs_uniquifier, version):
+        # A private session, so the snapshot is never tied to a request's session
+        with Session(db.engine, expire_on_commit=False) as session:
+            user = session.execute(
+                select(User).options(selectinload(User.roles)).where(User.fs_uniquifier == fs_uniquifier)
+            ).scalar_one_or_none()
+            if user is None:
+                return None
+            session.expunge_all()
+        return user, frozenset(role.name for role in user.roles), version, time.monotonic()
+
+    def invalidate(self, *user_ids):
+        """Forget ``user_ids`` everywhere once the current transaction commits; call before commit"""
+        revisions.bump(IDENTITY_KEY)
+        db.session.info.setdefault('invalidated_identities', set()).update(user_ids)
+
+    def discard(self, user_ids):
+        with self._lock:
+            stale = [key for key, entry in self._entries.items() if entry[0].id in user_ids]
+            for key in stale:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+identity_cache = IdentityCache()
+
+
+@event.listens_for(Session, 'after_commit')
+def _drop_invalidated(session):
+    user_ids = session.info.pop('invalidated_identities', None)
+    if user_ids:
+        identity_cache.discard(user_ids)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_invalidations(session):
+    session.info.pop('invalidated_identities', None)
+
+
+class CachedUserDatastore(SQLAlchemyUserDatastore):
+    """Serves Flask-Security's session user loader from the identity cache"""
+
+    def find_user(self, case_insensitive=False, **kwargs):
+        if identity_cache.enabled and list(kwargs) == ['fs_uniquifier']:
+            return identity_cache.load(kwargs['fs_uniquifier'])
+        return super().find_user(case_insensitive, **kwargs)
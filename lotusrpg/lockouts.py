@@ -0,0 +1,50 @@
+# lotusrpg/lockouts.py
+"""Login lockouts after repeated failed passwords.
+
+``User.is_locked`` only compares ``lockout_until`` with the clock, so reads
+never write. Expired lockouts are cleared when the user next logs in, and
+in bulk by a periodic sweep so the admin views stay tidy.
+"""
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import select, update
+
+from lotusrpg import tasks
+from lotusrpg.identity import identity_cache
+from lotusrpg.models import User, db
+
+
+def record_failure(user):
+    """Count a failed password and lock the account past the threshold; the caller commits"""
+    user.failed_login_attempts = (user.failed_login_attempts or 0) + 1
+    if user.failed_login_attempts >= current_app.config.get('LOCKOUT_THRESHOLD', 5):
+        minutes = current_app.config.get('LOCKOUT_MINUTES', 30)
+        user.lockout_until = datetime.utcnow() + timedelta(minutes=minutes)
+        identity_cache.invalidate(user.id)
+
+
+def clear_expired(user):
+    """Start ``user`` from a clean slate if their lockout has run out; the caller commits"""
+    if user.lockout_until is not None and not user.is_locked():
+        user.reset_lockout()
+
+
+@tasks.periodic('lockout-sweep', 'LOCKOUT_SWEEP_INTERVAL', 300)
+def sweep():
+    """Clear every expired lockout. Returns the number cleared."""
+    # Selected first (MySQL has no UPDATE ... RETURNING) so only these
+    # users' cached identities are dropped
+    expired = User.lockout_until <= datetime.utcnow()
+    user_ids = db.session.execute(select(User.id).where(expired)).scalars().all()
+    if not user_ids:
+        return 0
+    db.session.execute(
+        update(User)
+        .where(User.id.in_(user_ids), expired)
+        .values(failed_login_attempts=0, lockout_until=None),
+        execution_options={'synchronize_session': False}
+    )
+    identity_cache.invalidate(*user_ids)
+    db.session.commit()
+    return len(user_ids)
@@ -0,0 +1,120 @@
+# lotusrpg/media/__init__.py
+"""Process pool for CPU-bound image work, kept off the request threads"""
+import atexit
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from flask import current_app
+
+logger = logging.getLogger(__name__)
+
+# Threads running the on_done/on_error callbacks, which do database work
+CALLBACK_THREADS = 2
+
+_lock = threading.Lock()
+_executor = None
+_callbacks = None
+
+
+def _pool():
+    global _executor
+    with _lock:
+        if _executor is None:
+            # Spawned workers never inherit the server's threads or sockets
+            _executor = ProcessPoolExecutor(
+                max_workers=current_app.config.get('MEDIA_WORKERS', 2),
+                mp_context=multiprocessing.get_context('spawn'),
+            )
+            atexit.register(shutdown)
+        return _executor
+
+
+def _callback_pool():
+    global _callbacks
+    with _lock:
+        if _callbacks is None:
+            _callbacks = ThreadPoolExecutor(max_workers=CALLBACK_THREADS, thread_name_prefix='media-callback')
+        return _callbacks
+
+
+def shutdown():
+    global _executor
+    with _lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+
+
+def submit(fn, *args, on_done=None, on_error=None):
+    """Run ``fn(*args)`` in the media pool.
+
+    ``on_done(result)`` or ``on_error(exc)`` is then called with an app
+    context for the current app, on a callback thread rather than the
+    pool's own result-handling thread. ``fn`` must be importable by the worker
+    processes. The returned future resolves to ``fn``'s result once the
+    callback has finished. With ``MEDIA_WORKERS = 0`` everything runs
+    inline, which is handy for tests and single-process development servers.
+    """
+    app = current_app._get_current_object()
+    completed = Future()
+
+    def finish(future):
+        with app.app_context():
+            try:
+                result = future.result()
+            except Exception as e:
+                logger.exception('Media task %s failed', fn.__name__)
+                if on_error:
+                    on_error(e)
+                completed.set_exception(e)
+                return
+            try:
+                if on_done:
+                    on_done(result)
+            except Exception as e:
+                logger.exception('Media task %s callback failed', fn.__name__)
+                completed.set_exception(e)
+            else:
+                completed.set_result(result)
+
+    if current_app.config.get('MEDIA_WORKERS', 2) == 0:
+        inline = Future()
+        try:
+            inline.set_result(fn(*args))
+        except Exception as e:
+            inline.set_exception(e)
+        finish(inline)
+    else:
+        try:
+            future = _pool().submit(fn, *args)
+        except BrokenProcessPool:
+            # A worker died (e.g. killed for memory); start a fresh pool
+            shutdown()
+            future = _pool().submit(fn, *args)
+        callbacks = _callback_pool()
+        future.add_done_callback(lambda future: callbacks.submit(finish, future))
+    return completed
+
+
+def image_folder():
+    """Directory holding rulebook image originals and their variants"""
+    return current_app.config.get(
+        'IMAGE_FOLDER',
+        os.path.join(current_app.root_path, 'static', 'rule_images')
+    )
+
+
+def image_url(file_name):
+    return current_app.config.get('IMAGE_URL_PREFIX', '/static/rule_images').rstrip('/') + '/' + file_name
+
+
+def srcset(variants, fmt):
+    """``srcset`` attribute value for the ``fmt`` variants of an image"""
+    return ', '.join(
+        f'{image_url(variant.file_name)} {variant.width}w'
+        for variant in variants if variant.format == fmt
+    )
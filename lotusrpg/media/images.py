@@ -0,0 +1,101 @@
+# lotusrpg/media/images.py
+"""Image encoding helpers. Everything here runs inside the media worker
+processes, so it only depends on Pillow and the filesystem."""
+import hashlib
+import os
+
+from PIL import Image, ImageOps, features
+
+# Pillow plugin id and encoder options per output format
+ENCODERS = {
+    'avif': ('AVIF', {'quality': 60}),
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+}
+
+
+def available_formats(formats):
+    """The subset of ``formats`` this Pillow build can encode"""
+    return [fmt for fmt in formats if fmt in ENCODERS and features.check(fmt)]
+
+
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def variant_name(source_hash, width, fmt):
+    return f'{source_hash}-{width}w.{fmt}'
+
+
+def target_widths(original_width, widths):
+    """Requested widths, with anything wider than the original clamped to it"""
+    return sorted({min(width, original_width) for width in widths})
+
+
+def _prepare(img):
+    img = ImageOps.exif_transpose(img)
+    if img.mode not in ('RGB', 'RGBA'):
+        img = img.convert('RGBA' if 'A' in img.getbands() or 'transparency' in img.info else 'RGB')
+    return img
+
+
+def render_variants(source_path, out_dir, source_hash, widths, formats):
+    """Write every (width, format) variant of ``source_path`` that is missing.
+
+    Files are named after ``source_hash``, so an existing file is already
+    the right output and is reused as is. Returns one dict per variant.
+    """
+    results = []
+    with Image.open(source_path) as original:
+        img = _prepare(original)
+        for width in target_widths(img.width, widths):
+            height = max(1, round(img.height * width / img.width))
+            resized = None
+            for fmt in formats:
+                file_name = variant_name(source_hash, width, fmt)
+                path = os.path.join(out_dir, file_name)
+                if not os.path.exists(path):
+                    if resized is None:
+                        resized = img if width == img.width else img.resize((width, height), Image.LANCZOS)
+                    plugin, options = ENCODERS[fmt]
+                    tmp_path = f'{path}.{os.getpid()}.tmp'
+                    resized.save(tmp_path, plugin, **options)
+                    os.replace(tmp_path, path)
+                results.append({
+                    'format': fmt,
+                    'width': width,
+                    'height': height,
+                    'file_name': file_name,
+                    'file_size': os.path.getsize(path),
+                })
+    return results
+
+
+def avatar_name(source_hash, size):
+    return f'{source_hash}-{size}.webp'
+
+
+def render_avatar(source_path, out_dir, source_hash, sizes, max_pixels):
+    """Write a square WebP avatar of ``source_path`` for every size in ``sizes``.
+
+    The pixel count is checked from the header before anything is decoded,
+    so a small file claiming huge dimensions is rejected instead of filling
+    memory. Returns one dict per size.
+    """
+    results = []
+    with Image.open(source_path) as original:
+        if original.width * original.height > max_pixels:
+            raise ValueError(f'Image has more than {max_pixels} pixels')
+        # JPEGs can be decoded at a reduced scale that still covers the largest size
+        original.draft('RGB', (max(sizes), max(sizes)))
+        img = _prepare(original)
+        for size in sorted(set(sizes)):
+            file_name = avatar_name(source_hash, size)
+            path = os.path.join(out_dir, file_name)
+            if not os.path.exists(path):
+                square = ImageOps.fit(img, (size, size), Image.LANCZOS)
+                plugin, options = ENCODERS['webp']
+                tmp_path = f'{path}.{os.getpid()}.tmp'
+                square.save(tmp_path, plugin, **options)
+                os.replace(tmp_path, path)
+            results.append({'size': size, 'file_name': file_name, 'file_size': os.path.getsize(path)})
+    return results
@@ -1,8 +1,27 @@
 from flask import current_app as app
 from lotusrpg import db
 from datetime import datetime, timedelta
+import hashlib
 from flask_security import UserMixin, RoleMixin
 
+def binary_string(length):
+    """String column type that compares bytewise, for keys queried by prefix range.
+
+    PostgreSQL and MySQL default to linguistic collations that ignore
+    punctuation such as separators, so the column is declared binary there;
+    SQLite compares bytewise already.
+    """
+    return (
+        db.String(length)
+        .with_variant(db.String(length, collation='C'), 'postgresql')
+        .with_variant(db.String(length, collation='utf8mb4_bin'), 'mysql', 'mariadb')
+    )
+
+
+def path_type():
+    """Column type for materialized paths (see lotusrpg.tree), whose subtree ranges need bytewise ordering"""
+    return binary_string(1024)
+
 # Association table for many-to-many relationship between users and roles
 roles_users = db.Table(
     'roles_users',
@@ -27,7 +46,11 @@ class User(db.Model, UserMixin):
     active = db.Column(db.Boolean(), default=True)
     fs_uniquifier = db.Column(db.String(255), unique=True, nullable=False)
     confirmed_at = db.Column(db.DateTime())
-    image_file = db.Column(db.String(20), nullable=False, default='default.png')
+    image_file = db.Column(db.String(100), nullable=False, default='default.png')
+    # Content hash of the latest avatar upload and its processing state:
+    # None once processed, 'pending' while queued, 'failed' if it was unusable
+    avatar_hash = db.Column(db.String(64), nullable=True)
+    avatar_status = db.Column(db.String(10), nullable=True)
     is_banned = db.Column(db.Boolean(), default=False)
 
     # Tracking columns
@@ -37,7 +60,7 @@ class User(db.Model, UserMixin):
     current_login_ip = db.Column(db.String(100))
     login_count = db.Column(db.Integer, default=0)
     failed_login_attempts = db.Column(db.Integer, default=0)
-    lockout_until = db.Column(db.DateTime, nullable=True)
+    lockout_until = db.Column(db.DateTime, nullable=True, index=True)
 
     roles = db.relationship('Role', secondary=roles_users, backref=db.backref('users', lazy='dynamic'))
     posts = db.relationship('Post', backref='author', lazy=True)
@@ -45,25 +68,45 @@ class User(db.Model, UserMixin):
     def __repr__(self):
         return f"User('{self.username}', '{self.email}', '{self.active}')"
 
-    def is_locked(self):
-        """Check if the user account is temporarily locked"""
-        if self.lockout_until and self.lockout_until > datetime.utcnow():
-            return True
-        # Reset lockout if time has expired
-        if self.lockout_until and self.lockout_until <= datetime.utcnow():
-            self.reset_lockout()
-        return False
+    def is_locked(self, now=None):
+        """Check if the user account is temporarily locked.
+
+        Pure check: expired lockouts are cleared at the next login or by
+        the periodic sweep in lotusrpg.lockouts.
+        """
+        return self.lockout_until is not None and self.lockout_until > (now or datetime.utcnow())
+
+    def has_role(self, role):
+        """Role check against the role set precomputed by the identity cache, when there is one"""
+        role_names = getattr(self, '_role_names', None)
+        if role_names is None:
+            return super().has_role(role)
+        return (role if isinstance(role, str) else role.name) in role_names
 
     def reset_lockout(self):
-        """Reset failed login attempts after lockout period expires"""
+        """Reset failed login attempts and any lockout; the caller commits"""
         self.failed_login_attempts = 0
         self.lockout_until = None
-        db.session.commit()
 
     def is_active(self):
         """Override UserMixin is_active to check for locks and bans"""
         return self.active and not self.is_banned and not self.is_locked()
 
+    def profile_etag(self):
+        """Fingerprint of everything the profile endpoints serialize, built from loaded state"""
+        state = [
+            getattr(self, column.key) for column in self.__table__.columns
+            if column.key not in ('password', 'fs_uniquifier')
+        ]
+        state.append(self.is_locked())
+        state.append(sorted(role.name for role in self.roles))
+        return hashlib.sha1(repr(state).encode('utf-8')).hexdigest()
+
+
+def _posted_at(context):
+    """Default for ``last_activity_at``: the post's own timestamp"""
+    return context.get_current_parameters().get('date_posted') or datetime.utcnow()
+
     
 class Post(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -71,8 +114,20 @@ class Post(db.Model):
     date_posted = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     content = db.Column(db.Text, nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    # Maintained by lotusrpg.forum.counters; repair with `flask forum reconcile`
+    comment_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    last_activity_at = db.Column(db.DateTime, nullable=False, default=_posted_at)
+    hot_score = db.Column(db.Float, nullable=False, default=0.0, server_default='0')  # see lotusrpg.forum.hot
     comments = db.relationship('Comment', backref='post', lazy=True)  # Add this relationship
 
+    # Keyset pagination sorts on (date_posted, id)
+    __table_args__ = (
+        db.Index('ix_post_date_posted_id', 'date_posted', 'id'),
+        db.Index('ix_post_user_id_date_posted_id', 'user_id', 'date_posted', 'id'),
+        db.Index('ix_post_last_activity_at_id', 'last_activity_at', 'id'),
+        db.Index('ix_post_hot_score_id', 'hot_score', 'id'),
+    )
+
     def __repr__(self):
         return f"Post('{self.title}', '{self.date_posted}')"
     
@@ -82,18 +137,37 @@ class Comment(db.Model):
     date_posted = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     post_id = db.Column(db.Integer, db.ForeignKey('post.id'), nullable=False)
+    parent_id = db.Column(db.Integer, db.ForeignKey('comment.id'), nullable=True)
+    path = db.Column(path_type(), nullable=True)  # materialized path, see lotusrpg.tree
+    reply_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # all descendants
 
     user = db.relationship('User', backref='comments', lazy=True)
 
+    # Threads of a post are contiguous ranges of this index
+    __table_args__ = (
+        db.Index('ix_comment_post_id_path', 'post_id', 'path'),
+    )
+
     def __repr__(self):
         return f"Comment('{self.content}', User ID: {self.user_id}, Post ID: {self.post_id})"
 
 
+class PostRead(db.Model):
+    """How far a user has read a post: the highest comment id seen (see lotusrpg.forum.reads)"""
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    post_id = db.Column(db.Integer, db.ForeignKey('post.id'), primary_key=True)
+    last_comment_id = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"PostRead(User ID: {self.user_id}, Post ID: {self.post_id}, Comment ID: {self.last_comment_id})"
+
+
 class Section(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(255), nullable=False)
     slug = db.Column(db.String(255), unique=True, nullable=False)
     parent_id = db.Column(db.Integer, db.ForeignKey('section.id'), nullable=True)
+    path = db.Column(path_type(), nullable=True, index=True)  # materialized path, see lotusrpg.tree
     chapter = db.Column(db.String(255), nullable=False) 
     rulebook = db.Column(db.String(50), nullable=False, default='core')  # 'core' or 'darkholme'
 
@@ -113,7 +187,7 @@ class Content(db.Model):
     content_data = db.Column(db.JSON, nullable=False)
     style_class = db.Column(db.String(255), nullable=True)
 
-    section = db.relationship('Section', backref='contents')
+    section = db.relationship('Section', backref=db.backref('contents', order_by='Content.content_order'))
 
     def __repr__(self):
         return f"Content('{self.content_type}', Order: {self.content_order}, Section ID: {self.section_id})"
@@ -125,8 +199,90 @@ class Image(db.Model):
     alt_text = db.Column(db.String(255), nullable=True)
     class_name = db.Column(db.String(255), nullable=True) 
     section_id = db.Column(db.Integer, db.ForeignKey('section.id')) 
+    content_hash = db.Column(db.String(64), nullable=True, index=True)  # sha256 of the original file
+    width = db.Column(db.Integer, nullable=True)
+    height = db.Column(db.Integer, nullable=True)
+    # 'failed' if variant generation failed; otherwise the variants say pending or ready
+    variant_status = db.Column(db.String(10), nullable=True)
 
     section = db.relationship('Section', back_populates='images') 
+    # Variants belong to the file content, so identical uploads share them
+    variants = db.relationship(
+        'ImageVariant',
+        primaryjoin='foreign(ImageVariant.source_hash) == Image.content_hash',
+        order_by='(ImageVariant.format, ImageVariant.width)',
+        viewonly=True,
+    )
 
     def __repr__(self):
         return f"Image('{self.file_path}', Alt Text: '{self.alt_text}', Class: '{self.class_name}')"
+
+
+class ImageVariant(db.Model):
+    """A resized, re-encoded copy of an original image, named after its source hash"""
+    id = db.Column(db.Integer, primary_key=True)
+    source_hash = db.Column(db.String(64), nullable=False, index=True)
+    format = db.Column(db.String(10), nullable=False)  # 'avif' or 'webp'
+    width = db.Column(db.Integer, nullable=False)
+    height = db.Column(db.Integer, nullable=False)
+    file_name = db.Column(db.String(255), nullable=False)
+    file_size = db.Column(db.Integer, nullable=False)
+
+    __table_args__ = (db.UniqueConstraint('source_hash', 'format', 'width'),)
+
+    def __repr__(self):
+        return f"ImageVariant('{self.file_name}', {self.format}, {self.width}w)"
+
+
+class SectionSnapshot(db.Model):
+    """Pre-serialized JSON for a section, rebuilt whenever it or its contents change.
+
+    Rows are keyed by (section, rulebook) and kept as tombstones when a section
+    is deleted or moves to another rulebook, so offline readers can sync the
+    removal.
+    """
+    section_id = db.Column(db.Integer, primary_key=True)
+    rulebook = db.Column(db.String(50), primary_key=True)
+    slug = db.Column(db.String(255), nullable=False, index=True)
+    version = db.Column(db.Integer, nullable=False, index=True)  # rulebook revision at last change
+    content_hash = db.Column(db.String(64), nullable=False)
+    payload = db.Column(db.Text, nullable=False)
+    deleted = db.Column(db.Boolean, nullable=False, default=False)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"SectionSnapshot('{self.slug}', Version: {self.version}, Deleted: {self.deleted})"
+
+
+class Revision(db.Model):
+    """Monotonic change counter for a named slice of data (e.g. 'rules:core')"""
+    key = db.Column(binary_string(100), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        # Rows bumped recently within a key range, e.g. every forum post
+        db.Index('ix_revision_key_updated_at', 'key', 'updated_at'),
+    )
+
+    def __repr__(self):
+        return f"Revision('{self.key}', Version: {self.version})"
+
+
+class RevokedToken(db.Model):
+    """Id of a signed API token revoked before it expired (see lotusrpg.tokens)"""
+    id = db.Column(db.Integer, primary_key=True)
+    jti = db.Column(db.String(32), unique=True, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+    def __repr__(self):
+        return f"RevokedToken('{self.jti}', Expires: {self.expires_at})"
+
+
+class StatCounter(db.Model):
+    """Running row count for the admin dashboard (see lotusrpg.stats)"""
+    key = db.Column(db.String(50), primary_key=True)
+    value = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"StatCounter('{self.key}', {self.value})"
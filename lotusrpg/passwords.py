@@ -0,0 +1,254 @@
+# lotusrpg/passwords.py
+"""Password hashing and verification in a bounded process pool.
+
+bcrypt is deliberately slow, and under the ``threading`` async mode a burst
+of logins would otherwise keep every request thread busy hashing. Here the
+request thread only waits on a pool future. Hashes stay compatible with
+Flask-Security's own ``hash_password``/``verify_password``: the same passlib
+context and the same HMAC pre-hash are used, just in another process.
+
+At most ``PASSWORD_QUEUE_LIMIT`` operations may be queued or running;
+beyond that ``PasswordPoolBusy`` is raised so the caller can answer 503
+instead of piling up threads.
+"""
+import atexit
+import logging
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache
+from itertools import repeat
+
+from flask_security.utils import config_value, get_hmac
+from passlib.context import CryptContext
+
+logger = logging.getLogger(__name__)
+
+
+class PasswordPoolBusy(RuntimeError):
+    """Raised when too many password operations are already queued"""
+
+    retry_after = 1
+
+
+# Worker side. Only passlib is needed, and the context is rebuilt from its
+# serialized settings once per worker process.
+
+@lru_cache(maxsize=4)
+def _context(settings):
+    return CryptContext.from_string(settings)
+
+
+def _hash(settings, secret):
+    return _context(settings).hash(secret)
+
+
+def _verify(settings, secret, password_hash, rounds):
+    """Return ``(verified, needs_rehash)``"""
+    context = _context(settings)
+    if not context.verify(secret, password_hash):
+        return False, False
+    return True, _needs_rehash(context, password_hash, rounds)
+
+
+def _needs_rehash(context, password_hash, rounds):
+    if context.needs_update(password_hash):
+        return True
+    if rounds is None:
+        return False
+    # passlib only flags hashes outside min/max rounds; any cost change counts here
+    parsed = context.handler(context.identify(password_hash)).from_string(password_hash)
+    return getattr(parsed, 'rounds', rounds) != rounds
+
+
+class PasswordHasher:
+    def __init__(self):
+        self.settings = None
+        self.rounds = None
+        self.scheme = None
+        self.single_hash = {'plaintext'}
+        self.workers = 2
+        self.queue_limit = 16
+        self.timeout = 30
+        self._executor = None
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._metrics = {
+            'completed': 0, 'failed': 0, 'rejected': 0, 'rehashed': 0,
+            'max_in_flight': 0, 'total_ms': 0.0,
+        }
+
+    def init_app(self, app):
+        """Capture the password context of Flask-Security; call after ``security.init_app``"""
+        self.scheme = config_value('PASSWORD_HASH', app=app)
+        options = config_value('PASSWORD_HASH_OPTIONS', app=app, default={}).get(self.scheme, {})
+        self.rounds = options.get('rounds')
+
+        settings = app.extensions['security'].pwd_context.to_dict()
+        # Hash with the configured cost by default rather than per call
+        settings.update({f'{self.scheme}__{key}': value for key, value in options.items()})
+        self.settings = CryptContext(**settings).to_string()
+        self.single_hash = config_value('PASSWORD_SINGLE_HASH', app=app) or {'plaintext'}
+
+        self.workers = app.config.get('PASSWORD_WORKERS', 2)
+        self.queue_limit = app.config.get('PASSWORD_QUEUE_LIMIT', max(1, self.workers) * 8)
+        self.timeout = app.config.get('PASSWORD_TIMEOUT', 30)
+
+    # Pool management
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                )
+                atexit.register(self.shutdown)
+            return self._executor
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+    def _reset(self, pool):
+        """Drop a pool whose worker died, unless another thread already replaced it"""
+        with self._lock:
+            if self._executor is pool:
+                self._executor = None
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def _submit(self, fn, *args):
+        pool = self._pool()
+        try:
+            return pool, pool.submit(fn, *args)
+        except BrokenProcessPool:
+            # A worker died; start a fresh pool
+            self._reset(pool)
+            pool = self._pool()
+            return pool, pool.submit(fn, *args)
+
+    def _release(self, future=None):
+        with self._lock:
+            self._in_flight -= 1
+
+    def _run(self, fn, *args):
+        with self._lock:
+            if self._in_flight >= self.queue_limit:
+                self._metrics['rejected'] += 1
+                raise PasswordPoolBusy('Too many password operations in progress')
+            self._in_flight += 1
+            self._metrics['max_in_flight'] = max(self._metrics['max_in_flight'], self._in_flight)
+
+        started = time.monotonic()
+        failed = True
+        submitted = False
+        try:
+            if self.workers == 0:
+                result = fn(*args)
+            else:
+                pool, future = self._submit(fn, *args)
+                # A timed-out task cannot be stopped once running, so it keeps
+                # its place in the queue limit until it actually finishes
+                future.add_done_callback(self._release)
+                submitted = True
+                try:
+                    result = future.result(timeout=self.timeout)
+                except FutureTimeout:
+                    future.cancel()
+                    raise PasswordPoolBusy('Password operation timed out')
+                except BrokenProcessPool:
+                    # A worker died mid-task; the next operation starts a fresh pool
+                    self._reset(pool)
+                    raise PasswordPoolBusy('Password worker crashed')
+            failed = False
+            return result
+        finally:
+            with self._lock:
+                if not submitted:
+                    self._in_flight -= 1
+                self._metrics['failed' if failed else 'completed'] += 1
+                self._metrics['total_ms'] += (time.monotonic() - started) * 1000
+
+    def stats(self):
+        """Queue depth and throughput counters for this process"""
+        with self._lock:
+            metrics = dict(self._metrics)
+            in_flight = self._in_flight
+        done = metrics['completed'] + metrics['failed']
+        return {
+            'workers': self.workers,
+            'queue_limit': self.queue_limit,
+            'in_flight': in_flight,
+            'max_in_flight': metrics['max_in_flight'],
+            'completed': metrics['completed'],
+            'failed': metrics['failed'],
+            'rejected': metrics['rejected'],
+            'rehashed': metrics['rehashed'],
+            'avg_ms': round(metrics['total_ms'] / done, 1) if done else None,
+        }
+
+    # Public API
+
+    def _secret(self, password, scheme):
+        """The HMAC pre-hash of Flask-Security's ``use_double_hash``"""
+        if self.single_hash is True or scheme in self.single_hash:
+            return password
+        return get_hmac(password).decode('ascii')
+
+    def hash(self, password):
+        """Hash a new password like ``flask_security.utils.hash_password``"""
+        return self._run(_hash, self.settings, self._secret(password, self.scheme))
+
+    def hash_many(self, passwords, chunksize=8):
+        """Hash a batch of passwords across every pool worker, in order.
+
+        For bulk jobs such as ``flask users import``: the queue limit meant
+        for request threads does not apply.
+        """
+        secrets = [self._secret(password, self.scheme) for password in passwords]
+        if self.workers == 0:
+            return [_hash(self.settings, secret) for secret in secrets]
+        try:
+            pool = self._pool()
+            return list(pool.map(_hash, repeat(self.settings), secrets, chunksize=chunksize))
+        except BrokenProcessPool:
+            self.shutdown()
+            raise
+
+    def identify(self, password_hash):
+        """The passlib scheme of a stored hash, or None if it is not one this app accepts"""
+        return _context(self.settings).identify(password_hash, required=False)
+
+    def verify(self, password, password_hash):
+        """Return ``(verified, needs_rehash)`` for ``password`` against a stored hash"""
+        if not password_hash:
+            return False, False
+        scheme = self.identify(password_hash)
+        if scheme is None:
+            return False, False
+        rounds = self.rounds if scheme == self.scheme else None
+        return self._run(_verify, self.settings, self._secret(password, scheme), password_hash, rounds)
+
+    def verify_and_update(self, user, password):
+        """Verify ``user``'s password, rehashing it when the configured hash or cost changed.
+
+        The new hash is set on ``user``; the caller commits. Rehashing is
+        skipped, not failed, when the pool is busy.
+        """
+        verified, needs_rehash = self.verify(password, user.password)
+        if verified and needs_rehash:
+            try:
+                user.password = self.hash(password)
+            except PasswordPoolBusy:
+                logger.info('Skipped rehashing the password of user %s, pool busy', user.id)
+            else:
+                with self._lock:
+                    self._metrics['rehashed'] += 1
+        return verified
+
+
+hasher = PasswordHasher()
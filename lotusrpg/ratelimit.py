@@ -0,0 +1,209 @@
+# lotusrpg/ratelimit.py
+"""Token-bucket rate limiting for API resources and socket events.
+
+Resources declare ``rate_limits`` (see ``BaseResource``) and socket handlers
+use ``@limit_socket``. Each ``Limit`` is a bucket per client IP or per user
+that holds up to ``burst`` tokens and refills at ``count`` per ``period``;
+a request takes one token from every bucket that applies to it, or none
+when any of them is empty. Buckets live in this process by default, or
+in Redis when ``RATELIMIT_STORAGE_URL`` points at one so that all workers
+share them.
+
+Clients are told apart by ``request.remote_addr``. Behind a reverse proxy
+that is the proxy's address, so set ``PROXY_FIX_X_FOR`` to the number of
+proxies in front of the app to read it from ``X-Forwarded-For`` instead.
+"""
+import math
+import re
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import request
+from flask_security import current_user
+
+PERIODS = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400}
+_SPEC = re.compile(r'^\s*(\d+)\s*/\s*(second|minute|hour|day)s?\s*$')
+
+
+class Limit:
+    """``count`` requests per ``period`` for each client IP or user.
+
+    ``spec`` reads like ``'10/minute'``. ``burst`` defaults to ``count``,
+    so a quiet client can spend a whole period's allowance at once.
+    ``per='user'`` falls back to the IP for anonymous requests. ``methods``
+    restricts a resource limit to some HTTP methods.
+    """
+
+    def __init__(self, spec, per='ip', burst=None, methods=None, scope=None):
+        match = _SPEC.match(spec)
+        if not match:
+            raise ValueError(f'Invalid rate limit {spec!r}')
+        if per not in ('ip', 'user'):
+            raise ValueError(f'Invalid rate limit key {per!r}')
+        count, period = int(match.group(1)), PERIODS[match.group(2)]
+        self.spec = spec
+        self.per = per
+        self.rate = count / period
+        self.burst = burst or count
+        self.methods = {method.upper() for method in methods} if methods else None
+        self.scope = scope
+
+    def applies_to(self, method):
+        return self.methods is None or method in self.methods
+
+    def key(self, scope):
+        if self.per == 'user' and current_user.is_authenticated:
+            client = f'user:{current_user.id}'
+        else:
+            client = f'ip:{request.remote_addr}'
+        return f'{self.scope or scope}:{self.spec}:{client}'
+
+    def __repr__(self):
+        return f'Limit({self.spec!r}, per={self.per!r})'
+
+
+class MemoryStore:
+    """Buckets held by this process, least recently used dropped beyond ``max_entries``.
+
+    A dropped bucket comes back full, so eviction can only ever be lenient.
+    """
+
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self._buckets = OrderedDict()  # key -> (tokens, monotonic time)
+        self._lock = threading.Lock()
+
+    def take(self, buckets):
+        """Take a token from each ``(key, rate, burst)`` bucket, or from none of them.
+
+        Returns ``(allowed, seconds until every bucket has a token)``.
+        """
+        now = time.monotonic()
+        with self._lock:
+            levels = []
+            for key, rate, burst in buckets:
+                tokens, updated = self._buckets.get(key, (burst, now))
+                levels.append(min(burst, tokens + (now - updated) * rate))
+            allowed = all(tokens >= 1 for tokens in levels)
+            wait = 0.0
+            for (key, rate, burst), tokens in zip(buckets, levels):
+                if allowed:
+                    tokens -= 1
+                elif tokens < 1:
+                    wait = max(wait, (1 - tokens) / rate)
+                self._buckets[key] = (tokens, now)
+                self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_entries:
+                self._buckets.popitem(last=False)
+        return allowed, wait
+
+    def reset(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+class RedisStore:
+    """Buckets shared by every worker, updated atomically by a Lua script"""
+
+    # ARGV holds a rate and a burst for each key in KEYS
+    SCRIPT = """
+    local now = redis.call('TIME')
+    now = tonumber(now[1]) + tonumber(now[2]) / 1000000
+    local levels = {}
+    local allowed = 1
+    for i, key in ipairs(KEYS) do
+        local rate, burst = tonumber(ARGV[2 * i - 1]), tonumber(ARGV[2 * i])
+        local bucket = redis.call('HMGET', key, 'tokens', 'updated')
+        local tokens = tonumber(bucket[1]) or burst
+        local updated = tonumber(bucket[2]) or now
+        levels[i] = math.min(burst, tokens + math.max(0, now - updated) * rate)
+        if levels[i] < 1 then
+            allowed = 0
+        end
+    end
+    local wait = 0
+    for i, key in ipairs(KEYS) do
+        local rate, burst = tonumber(ARGV[2 * i - 1]), tonumber(ARGV[2 * i])
+        local tokens = levels[i]
+        if allowed == 1 then
+            tokens = tokens - 1
+        elseif tokens < 1 then
+            wait = math.max(wait, (1 - tokens) / rate)
+        end
+        redis.call('HSET', key, 'tokens', tostring(tokens), 'updated', tostring(now))
+        redis.call('EXPIRE', key, math.ceil(burst / rate) + 1)
+    end
+    return {allowed, tostring(wait)}
+    """
+
+    def __init__(self, url, prefix='lotusrpg:ratelimit:'):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError('RATELIMIT_STORAGE_URL points at Redis but the redis package is not installed')
+        self.prefix = prefix
+        self._client = redis.Redis.from_url(url)
+        self._take = self._client.register_script(self.SCRIPT)
+
+    def take(self, buckets):
+        allowed, wait = self._take(
+            keys=[self.prefix + key for key, rate, burst in buckets],
+            args=[value for key, rate, burst in buckets for value in (rate, burst)],
+        )
+        return bool(int(allowed)), float(wait)
+
+    def reset(self):
+        for key in self._client.scan_iter(f'{self.prefix}*'):
+            self._client.delete(key)
+
+
+class RateLimiter:
+    def __init__(self):
+        self.store = MemoryStore()
+        self.enabled = True
+
+    def init_app(self, app):
+        self.enabled = app.config.get('RATELIMIT_ENABLED', True)
+        url = app.config.get('RATELIMIT_STORAGE_URL', 'memory://')
+        if url.startswith(('redis://', 'rediss://', 'unix://')):
+            self.store = RedisStore(url)
+        else:
+            self.store = MemoryStore(app.config.get('RATELIMIT_MAX_BUCKETS', 10000))
+
+    def check(self, limits, scope, method=None):
+        """Take a token from every applicable bucket, or from none when one is empty.
+
+        Returns None when the request may proceed, or the number of whole
+        seconds to wait before retrying.
+        """
+        if not self.enabled:
+            return None
+        buckets = [
+            (limit.key(scope), limit.rate, limit.burst)
+            for limit in limits if method is None or limit.applies_to(method)
+        ]
+        if not buckets:
+            return None
+        allowed, wait = self.store.take(buckets)
+        return None if allowed else max(1, math.ceil(wait))
+
+
+limiter = RateLimiter()
+
+
+def limit_socket(*limits):
+    """Rate limit a socket event handler; over the limit the client gets an ``error`` event"""
+    def decorator(f):
+        @wraps(f)
+        def wrapped(*args, **kwargs):
+            from flask_socketio import emit
+
+            retry_after = limiter.check(limits, f'socket:{f.__name__}')
+            if retry_after is not None:
+                emit('error', {'message': 'Too many requests', 'retry_after': retry_after})
+                return
+            return f(*args, **kwargs)
+        return wrapped
+    return decorator
@@ -0,0 +1,144 @@
+# lotusrpg/revisions.py
+"""Shared revision counters for in-process caches.
+
+Every write path bumps the revision of the data it touched inside its own
+transaction. Per-process structures (search indexes, cached payloads) record
+the revisions they were built from and rebuild themselves when another worker
+has moved a counter past them.
+
+A bump only becomes visible to ``current``/``stamp`` once its transaction
+commits, so no cache is ever marked built at a version that may still be
+rolled back.
+"""
+import threading
+import time
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import event, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from lotusrpg.models import Revision, db
+
+_lock = threading.Lock()
+_seen = {}  # key -> (version, updated_at, monotonic time it was read)
+
+
+def _remember(key, version, updated_at):
+    with _lock:
+        hit = _seen.get(key)
+        if hit and hit[0] > version:
+            # A newer version was already read; keep it
+            return
+        _seen[key] = (version, updated_at, time.monotonic())
+
+
+def stamp(key):
+    """Return ``(version, updated_at)`` for ``key``; ``(0, None)`` if it never changed.
+
+    Reads are memoized for ``REVISION_CHECK_INTERVAL`` seconds so hot read
+    paths cost at most one primary-key lookup per interval.
+    """
+    interval = current_app.config.get('REVISION_CHECK_INTERVAL', 1.0)
+    with _lock:
+        hit = _seen.get(key)
+    if hit and time.monotonic() - hit[2] < interval:
+        return hit[0], hit[1]
+
+    row = db.session.execute(
+        select(Revision.version, Revision.updated_at).where(Revision.key == key)
+    ).first()
+    version, updated_at = (row.version, row.updated_at) if row else (0, None)
+    _remember(key, version, updated_at)
+    return version, updated_at
+
+
+def current(key):
+    """Return the latest known version of ``key``"""
+    return stamp(key)[0]
+
+
+def bump(key):
+    """Increment ``key`` in the current transaction and return the new version.
+
+    The version is returned at once, for trackers to ``advance`` after
+    commit, but other readers only see it after the commit.
+    """
+    now = datetime.utcnow()
+    stmt = (
+        update(Revision)
+        .where(Revision.key == key)
+        .values(version=Revision.version + 1, updated_at=now)
+        .returning(Revision.version)
+    )
+    version = db.session.execute(stmt).scalar()
+    if version is None:
+        try:
+            with db.session.begin_nested():
+                db.session.add(Revision(key=key, version=1, updated_at=now))
+            version = 1
+        except IntegrityError:
+            # Another worker created the row first
+            version = db.session.execute(stmt).scalar()
+
+    # Published by _publish_bumps once the transaction commits
+    db.session.info.setdefault('pending_revisions', {})[key] = (version, now)
+    return version
+
+
+@event.listens_for(Session, 'after_commit')
+def _publish_bumps(session):
+    for key, (version, updated_at) in session.info.pop('pending_revisions', {}).items():
+        _remember(key, version, updated_at)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_bumps(session):
+    session.info.pop('pending_revisions', None)
+
+
+def validator(*keys):
+    """Conditional-request validator ``(etag, last_modified)`` covering ``keys``"""
+    stamps = [stamp(key) for key in keys]
+    etag = '.'.join(str(version) for version, _ in stamps)
+    modified = [updated_at for _, updated_at in stamps if updated_at]
+    return etag, max(modified) if modified else None
+
+
+class RevisionTracker:
+    """Remembers which revisions an in-process structure reflects"""
+
+    def __init__(self, *keys):
+        self.keys = keys
+        self._versions = {}
+
+    def snapshot(self):
+        """Read current versions; call *before* loading the data they cover"""
+        return {key: current(key) for key in self.keys}
+
+    @property
+    def versions(self):
+        return dict(self._versions)
+
+    def mark_built(self, versions):
+        self._versions = dict(versions)
+
+    def is_current(self):
+        if not self._versions:
+            return False
+        return all(self._versions.get(key) == current(key) for key in self.keys)
+
+    def advance(self, key, version):
+        """Record a local write that produced ``version``.
+
+        If the structure had missed an intermediate change, the key is
+        forgotten so the next read triggers a rebuild.
+        """
+        if self._versions.get(key) == version - 1:
+            self._versions[key] = version
+        else:
+            self._versions.pop(key, None)
+
+    def reset(self):
+        self._versions = {}
@@ -0,0 +1,29 @@
+# lotusrpg/rules/__init__.py
+"""Rulebook services shared by the rules API and the CLI"""
+
+RULEBOOKS = ('core', 'darkholme')
+
+
+def revision_key(rulebook):
+    """Revision counter key covering one rulebook's sections and contents"""
+    return f'rules:{rulebook}'
+
+
+def toc_revision_key(rulebook):
+    """Revision counter key covering only a rulebook's table of contents"""
+    return f'rules:{rulebook}:toc'
+
+
+def rulebook_keys():
+    """Revision keys of every rulebook, for endpoints spanning all of them"""
+    return [revision_key(rulebook) for rulebook in RULEBOOKS]
+
+
+def bump_rulebooks(*rulebooks):
+    """Bump the revision of each touched rulebook; call before commit.
+
+    Returns a dict mapping each rulebook to its new version.
+    """
+    from lotusrpg import revisions
+
+    return {rulebook: revisions.bump(revision_key(rulebook)) for rulebook in set(rulebooks)}
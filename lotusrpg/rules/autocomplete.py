@@ -0,0 +1,194 @@
+# lotusrpg/rules/autocomplete.py
+"""Typo-tolerant section title suggestions backed by an in-memory trigram index"""
+import heapq
+import json
+import logging
+import os
+import re
+import threading
+import zlib
+
+from sqlalchemy import select
+
+from lotusrpg.models import Section, db
+from lotusrpg.revisions import RevisionTracker
+from lotusrpg.rules import RULEBOOKS, toc_revision_key
+
+logger = logging.getLogger(__name__)
+
+_NON_WORD = re.compile(r'[^a-z0-9]+')
+
+MIN_SCORE = 0.25
+PREFIX_BONUS = 0.5
+
+
+def normalize(text):
+    return _NON_WORD.sub(' ', text.lower()).strip()
+
+
+def trigrams(text):
+    """Trigrams of each word, padded so word starts and ends carry weight"""
+    grams = set()
+    for word in normalize(text).split():
+        padded = f'  {word} '
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+class TitleIndex:
+    """Trigram index over section titles and slugs.
+
+    Loaded at startup from a compact zlib-compressed JSON file, checked
+    against the TOC revisions on first use, and patched in place by section
+    writes.
+    """
+
+    def __init__(self):
+        self._grams = {}   # trigram -> set of section ids
+        self._docs = {}    # section id -> (title, slug, rulebook, words, trigram set)
+        self._tracker = RevisionTracker(*(toc_revision_key(r) for r in RULEBOOKS))
+        self._lock = threading.RLock()
+        self.path = None
+
+    def init_app(self, app):
+        self.path = app.config.get(
+            'AUTOCOMPLETE_INDEX_PATH',
+            os.path.join(app.instance_path, 'autocomplete.idx')
+        )
+        self.load()
+
+    # Building
+
+    def _add(self, section_id, title, slug, rulebook):
+        self._remove(section_id)
+        grams = trigrams(title) | trigrams(slug)
+        words = tuple(normalize(f'{title} {slug}').split())
+        self._docs[section_id] = (title, slug, rulebook, words, grams)
+        for gram in grams:
+            self._grams.setdefault(gram, set()).add(section_id)
+
+    def _remove(self, section_id):
+        doc = self._docs.pop(section_id, None)
+        if doc is None:
+            return
+        for gram in doc[4]:
+            ids = self._grams[gram]
+            ids.discard(section_id)
+            if not ids:
+                del self._grams[gram]
+
+    def _load_rows(self, rows, versions):
+        self._grams = {}
+        self._docs = {}
+        for section_id, title, slug, rulebook in rows:
+            self._add(section_id, title, slug, rulebook)
+        self._tracker.mark_built(versions)
+
+    def rebuild(self):
+        with self._lock:
+            versions = self._tracker.snapshot()
+            rows = db.session.execute(
+                select(Section.id, Section.title, Section.slug, Section.rulebook)
+            ).all()
+            self._load_rows(rows, versions)
+            self.save()
+
+    def ensure_current(self):
+        with self._lock:
+            if not self._tracker.is_current():
+                self.rebuild()
+
+    # Compact serialized form
+
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            data = {
+                'versions': self._tracker.versions,
+                'sections': [[section_id, doc[0], doc[1], doc[2]] for section_id, doc in self._docs.items()],
+            }
+        blob = zlib.compress(json.dumps(data, separators=(',', ':')).encode('utf-8'))
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = f'{self.path}.{os.getpid()}.tmp'
+            with open(tmp_path, 'wb') as f:
+                f.write(blob)
+            os.replace(tmp_path, self.path)
+        except OSError:
+            logger.warning('Could not write autocomplete index to %s', self.path, exc_info=True)
+
+    def load(self):
+        """Load the serialized index if present; it is validated on first use"""
+        if not self.path or not os.path.exists(self.path):
+            return False
+        try:
+            with open(self.path, 'rb') as f:
+                data = json.loads(zlib.decompress(f.read()))
+        except (OSError, ValueError, zlib.error):
+            logger.warning('Ignoring unreadable autocomplete index %s', self.path, exc_info=True)
+            return False
+        with self._lock:
+            self._load_rows(data['sections'], data['versions'])
+        return True
+
+    # Incremental maintenance, called by section writes after commit
+
+    def section_saved(self, section, versions):
+        with self._lock:
+            self._add(section.id, section.title, section.slug, section.rulebook)
+            self._advance(versions)
+        self.save()
+
+    def section_deleted(self, section_id, versions):
+        with self._lock:
+            self._remove(section_id)
+            self._advance(versions)
+        self.save()
+
+    def _advance(self, versions):
+        for rulebook, version in versions.items():
+            self._tracker.advance(toc_revision_key(rulebook), version)
+
+    # Querying
+
+    def suggest(self, query, limit=10, rulebook=None):
+        """Rank sections by trigram similarity to ``query``, with a bonus for word prefixes"""
+        self.ensure_current()
+
+        needle = normalize(query)
+        query_grams = trigrams(needle)
+        if not query_grams:
+            return []
+        last_word = needle.split()[-1]
+
+        with self._lock:
+            shared = {}
+            for gram in query_grams:
+                for section_id in self._grams.get(gram, ()):
+                    shared[section_id] = shared.get(section_id, 0) + 1
+
+            scored = []
+            for section_id, count in shared.items():
+                title, slug, section_rulebook, words, grams = self._docs[section_id]
+                if rulebook and section_rulebook != rulebook:
+                    continue
+                coverage = count / len(query_grams)
+                jaccard = count / (len(query_grams) + len(grams) - count)
+                score = 0.6 * coverage + 0.4 * jaccard
+                if any(word.startswith(last_word) for word in words):
+                    score += PREFIX_BONUS
+                if score >= MIN_SCORE:
+                    scored.append((score, section_id))
+
+            best = heapq.nlargest(limit, scored)
+            return [{
+                'id': section_id,
+                'title': self._docs[section_id][0],
+                'slug': self._docs[section_id][1],
+                'rulebook': self._docs[section_id][2],
+                'score': round(score, 3),
+            } for score, section_id in best]
+
+
+title_index = TitleIndex()
@@ -0,0 +1,223 @@
+# lotusrpg/rules/blocks.py
+"""Whole-section content replacement, shared by the bulk API and the CLI importer"""
+import json
+import re
+
+from sqlalchemy import delete, insert, select, update
+
+from lotusrpg.models import Content, db
+from lotusrpg.rules import bump_rulebooks
+from lotusrpg.rules import snapshots
+
+
+class BlockError(ValueError):
+    """Raised when a block list cannot be applied to a section"""
+
+
+def apply_blocks(section, blocks):
+    """Make ``section``'s content rows match ``blocks`` exactly.
+
+    ``blocks`` is the ordered list loaded by ``SectionBlocksSchema``. Blocks
+    with an ``id`` update that row, blocks without one are inserted, and rows
+    not mentioned are deleted; ``content_order`` follows list position.
+    Everything runs as set-based statements in the caller's transaction.
+    Returns a summary of the changes.
+    """
+    existing = {
+        row.id: row for row in db.session.execute(
+            select(
+                Content.id, Content.content_type, Content.content_order,
+                Content.content_data, Content.style_class,
+            ).where(Content.section_id == section.id)
+        )
+    }
+
+    seen = set()
+    inserts, updates = [], []
+    for order, block in enumerate(blocks, start=1):
+        values = {
+            'content_type': block['content_type'],
+            'content_order': order,
+            'content_data': block['content_data'],
+            'style_class': block.get('style_class'),
+        }
+        block_id = block.get('id')
+        if block_id is None:
+            inserts.append({'section_id': section.id, **values})
+            continue
+
+        if block_id not in existing:
+            raise BlockError(f'Content {block_id} does not belong to this section')
+        if block_id in seen:
+            raise BlockError(f'Content {block_id} appears more than once')
+        seen.add(block_id)
+
+        row = existing[block_id]
+        if any(getattr(row, key) != value for key, value in values.items()):
+            updates.append({'id': block_id, **values})
+
+    removed = [content_id for content_id in existing if content_id not in seen]
+
+    if removed:
+        db.session.execute(
+            delete(Content).where(Content.id.in_(removed)),
+            execution_options={'synchronize_session': False}
+        )
+    if updates:
+        db.session.execute(update(Content), updates)
+    if inserts:
+        db.session.execute(insert(Content), inserts)
+
+    db.session.expire(section, ['contents'])
+    return {
+        'inserted': len(inserts),
+        'updated': len(updates),
+        'deleted': len(removed),
+        'unchanged': len(seen) - len(updates),
+    }
+
+
+def match_existing(section, blocks):
+    """Give id-less ``blocks`` the id of an unclaimed existing row with identical content.
+
+    Used for imports from files that carry no ids, so unchanged paragraphs
+    keep their rows and only real edits are written.
+    """
+    def key(content_type, data):
+        return content_type, json.dumps(data, sort_keys=True)
+
+    available = {}
+    for row in db.session.execute(
+        select(Content.id, Content.content_type, Content.content_data)
+        .where(Content.section_id == section.id)
+        .order_by(Content.content_order)
+    ):
+        available.setdefault(key(row.content_type, row.content_data), []).append(row.id)
+
+    claimed = {block['id'] for block in blocks if block.get('id') is not None}
+    for block in blocks:
+        if block.get('id') is not None:
+            continue
+        candidates = available.get(key(block['content_type'], block['content_data']), [])
+        while candidates:
+            content_id = candidates.pop(0)
+            if content_id not in claimed:
+                block['id'] = content_id
+                claimed.add(content_id)
+                break
+    return blocks
+
+
+def replace_section_blocks(section, blocks):
+    """Apply ``blocks`` and refresh the section's snapshot; the caller commits.
+
+    Returns ``(summary, versions)``; ``versions`` is what the search index
+    needs once the transaction has committed.
+    """
+    summary = apply_blocks(section, blocks)
+    versions = {}
+    if summary['inserted'] or summary['updated'] or summary['deleted']:
+        versions = bump_rulebooks(section.rulebook)
+        snapshots.rebuild(section, versions)
+    return summary, versions
+
+
+_LIST_ITEM = re.compile(r'^\s*(?:[-*+]|\d+[.)])\s+(.*)$')
+_IMAGE = re.compile(r'^!\[(.*?)\]\((\S+?)(?:\s+"(.*)")?\)$')
+
+
+def _split_row(line):
+    return [cell.strip() for cell in line.strip().strip('|').split('|')]
+
+
+def parse_markdown(text):
+    """Turn a Markdown document into blocks for ``apply_blocks``.
+
+    Supported: ``#`` headings, ``##``+ subheadings, paragraphs, bullet and
+    numbered lists, pipe tables (first row is the header) and standalone
+    images. A ``{.class}`` suffix on a heading or paragraph sets its
+    ``style_class``. Raises ``BlockError`` for a table without any rows.
+    """
+    blocks = []
+    paragraph, items, table = [], [], []
+    table_start = None
+
+    def with_style(content_type, body):
+        style = None
+        match = re.search(r'\s*\{\.([\w .-]+)\}\s*$', body)
+        if match:
+            style = match.group(1).replace(' .', ' ')
+            body = body[:match.start()]
+        return {'content_type': content_type, 'content_data': {'text': body.strip()}, 'style_class': style}
+
+    def flush():
+        if paragraph:
+            blocks.append(with_style('paragraph', ' '.join(paragraph)))
+            paragraph.clear()
+        if items:
+            blocks.append({'content_type': 'list', 'content_data': {'items': list(items)}, 'style_class': None})
+            items.clear()
+        if table:
+            rows = [_split_row(line) for line in table
+                    if not re.fullmatch(r'\|?[\s:|-]+\|?', line.strip())]
+            if not rows:
+                raise BlockError(f'Line {table_start}: table has only separator rows')
+            blocks.append({
+                'content_type': 'table',
+                'content_data': {'headers': rows[0], 'rows': rows[1:]},
+                'style_class': None,
+            })
+            table.clear()
+
+    for line_number, raw in enumerate(text.splitlines(), start=1):
+        line = raw.rstrip()
+        stripped = line.strip()
+
+        if not stripped:
+            flush()
+            continue
+
+        if stripped.startswith('|'):
+            if paragraph or items:
+                flush()
+            if not table:
+                table_start = line_number
+            table.append(stripped)
+            continue
+        if table:
+            flush()
+
+        heading = re.match(r'^(#{1,6})\s+(.*)$', stripped)
+        if heading:
+            flush()
+            content_type = 'heading' if len(heading.group(1)) == 1 else 'subheading'
+            blocks.append(with_style(content_type, heading.group(2)))
+            continue
+
+        image = _IMAGE.match(stripped)
+        if image:
+            flush()
+            data = {'src': image.group(2), 'alt': image.group(1)}
+            if image.group(3):
+                data['caption'] = image.group(3)
+            blocks.append({'content_type': 'image', 'content_data': data, 'style_class': None})
+            continue
+
+        item = _LIST_ITEM.match(line)
+        if item:
+            if paragraph:
+                flush()
+            items.append(item.group(1).strip())
+            continue
+
+        if items and raw[:1].isspace():
+            # Continuation of the previous list item
+            items[-1] += ' ' + stripped
+            continue
+
+        if items:
+            flush()
+        paragraph.append(stripped)
+
+    flush()
+    return blocks
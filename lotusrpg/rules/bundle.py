@@ -0,0 +1,103 @@
+# lotusrpg/rules/bundle.py
+"""Whole-rulebook NDJSON bundles built from section snapshots"""
+import json
+import zlib
+
+from sqlalchemy import func, select
+
+from lotusrpg.models import SectionSnapshot, db
+
+STREAM_BATCH = 200       # snapshot rows fetched per cursor round trip
+FLUSH_BYTES = 64 * 1024  # uncompressed bytes buffered before yielding
+
+
+def _snapshot_query(columns, rulebook, since):
+    query = select(*columns).where(SectionSnapshot.rulebook == rulebook)
+    if since is None:
+        query = query.where(SectionSnapshot.deleted.is_(False))
+    else:
+        query = query.where(SectionSnapshot.version > since)
+    return query.order_by(SectionSnapshot.section_id)
+
+
+def bundle_etag(rulebook, version, since=None, compress=True):
+    """Validator of a bundle at rulebook revision ``version``.
+
+    Every write to the rulebook bumps its revision in the transaction that
+    rebuilds the snapshots, so the counter alone identifies the content.
+    The gzip and identity encodings are different bodies and get different
+    tags.
+    """
+    encoding = 'gzip' if compress else 'identity'
+    return f'{rulebook}-{version}-{"all" if since is None else since}-{encoding}'
+
+
+def latest_version(rulebook):
+    """Highest snapshot version of ``rulebook``, tombstones included.
+
+    Read from the table rather than the memoized revision: rows streamed
+    afterwards are at least this new, so a client that stores it as its
+    next ``since`` never skips a change.
+    """
+    return db.session.execute(
+        select(func.max(SectionSnapshot.version)).where(SectionSnapshot.rulebook == rulebook)
+    ).scalar() or 0
+
+
+def iter_lines(rulebook, version, since=None):
+    """Yield the bundle as NDJSON lines through a server-side cursor.
+
+    The first line describes the bundle; each further line is either a
+    section payload or, for ``since`` bundles, a deletion marker.
+    """
+    yield json.dumps({
+        'type': 'bundle',
+        'rulebook': rulebook,
+        'version': version,
+        'since': since,
+    }) + '\n'
+
+    rows = db.session.execute(
+        _snapshot_query(
+            [
+                SectionSnapshot.section_id, SectionSnapshot.slug, SectionSnapshot.version,
+                SectionSnapshot.deleted, SectionSnapshot.payload,
+            ],
+            rulebook, since,
+        ).execution_options(stream_results=True, yield_per=STREAM_BATCH)
+    )
+    for row in rows:
+        if row.deleted:
+            yield json.dumps({
+                'type': 'deleted',
+                'section_id': row.section_id,
+                'slug': row.slug,
+                'version': row.version,
+            }) + '\n'
+        else:
+            yield f'{{"type":"section","version":{row.version},"section":{row.payload}}}\n'
+
+
+def iter_chunks(lines, compress=True):
+    """Batch ``lines`` into byte chunks, gzip-compressed if ``compress``"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+    buffer = []
+    size = 0
+
+    for line in lines:
+        data = line.encode('utf-8')
+        buffer.append(data)
+        size += len(data)
+        if size >= FLUSH_BYTES:
+            chunk = b''.join(buffer)
+            buffer, size = [], 0
+            if compressor:
+                chunk = compressor.compress(chunk)
+            if chunk:
+                yield chunk
+
+    chunk = b''.join(buffer)
+    if compressor:
+        chunk = compressor.compress(chunk) + compressor.flush()
+    if chunk:
+        yield chunk
@@ -0,0 +1,142 @@
+# lotusrpg/rules/hierarchy.py
+"""Section tree maintenance and queries on top of ``Section.path``"""
+from sqlalchemy import func, literal, select, update
+
+from lotusrpg.models import Section, db
+from lotusrpg import tree
+
+
+class HierarchyError(ValueError):
+    """Raised for parent assignments that would break the tree"""
+
+
+def place(section):
+    """Set the path of a newly added section; flushes to obtain its id"""
+    parent = None
+    if section.parent_id is not None:
+        parent = db.session.get(Section, section.parent_id)
+        if parent is None:
+            raise HierarchyError('Parent section not found')
+        ensure_path(parent)
+
+    db.session.flush()
+    section.path = tree.child_path(parent.path if parent else None, section.id)
+
+
+def _rewrite_prefix(old_prefix, new_prefix):
+    """Replace ``old_prefix`` with ``new_prefix`` on a whole subtree in one statement"""
+    db.session.execute(
+        update(Section)
+        .where(tree.within(Section.path, old_prefix))
+        .values(path=literal(new_prefix) + func.substr(Section.path, len(old_prefix) + 1)),
+        execution_options={'synchronize_session': False}
+    )
+
+
+def move(section, new_parent_id):
+    """Re-parent ``section``, carrying its whole subtree along"""
+    ensure_path(section)
+    parent = None
+    if new_parent_id is not None:
+        parent = db.session.get(Section, new_parent_id)
+        if parent is None:
+            raise HierarchyError('Parent section not found')
+        ensure_path(parent)
+        if parent.path.startswith(section.path):
+            raise HierarchyError('A section cannot be moved under itself')
+
+    old_path = section.path
+    new_path = tree.child_path(parent.path if parent else None, section.id)
+    section.parent_id = new_parent_id
+    if new_path != old_path:
+        db.session.flush()
+        _rewrite_prefix(old_path, new_path)
+        db.session.expire_all()
+
+
+def detach_children(section):
+    """Hand a section's children to its own parent before it is deleted"""
+    ensure_path(section)
+    parent_path = tree.parent_path(section.path)
+    children = db.session.execute(
+        select(Section.id, Section.path).where(Section.parent_id == section.id)
+    ).all()
+
+    db.session.execute(
+        update(Section)
+        .where(Section.parent_id == section.id)
+        .values(parent_id=section.parent_id),
+        execution_options={'synchronize_session': False}
+    )
+    for child in children:
+        _rewrite_prefix(child.path, tree.child_path(parent_path, child.id))
+    db.session.expire_all()
+
+
+def ensure_path(section):
+    """Backfill paths when ``section`` predates materialized paths"""
+    if section.path is None:
+        rebuild_paths()
+
+
+def rebuild_paths():
+    """Recompute every section path from ``parent_id``. Returns the number updated."""
+    rows = db.session.execute(select(Section.id, Section.parent_id, Section.path)).all()
+    current = {row.id: row.path for row in rows}
+    paths = tree.resolve_paths({row.id: row.parent_id for row in rows})
+
+    changes = []
+    for node_id, path in paths.items():
+        if current[node_id] != path:
+            changes.append({'id': node_id, 'path': path})
+
+    if changes:
+        db.session.execute(update(Section), changes)
+        db.session.expire_all()
+    return len(changes)
+
+
+def breadcrumbs(section):
+    """Ancestors of ``section`` from the root down, in one primary-key query"""
+    ensure_path(section)
+    ids = tree.ancestor_ids(section.path)
+    if not ids:
+        return []
+    rows = db.session.execute(
+        select(Section.id, Section.title, Section.slug, Section.path).where(Section.id.in_(ids))
+    ).all()
+    rows.sort(key=lambda row: len(row.path))
+    return [{'id': row.id, 'title': row.title, 'slug': row.slug} for row in rows]
+
+
+def subtree(section, max_depth=None):
+    """``section`` and all its descendants as a nested dict, in one range query"""
+    ensure_path(section)
+    query = (
+        select(Section.id, Section.title, Section.slug, Section.chapter, Section.path)
+        .where(tree.within(Section.path, section.path))
+        .order_by(Section.path)
+    )
+    base_depth = tree.depth(section.path)
+    if max_depth is not None:
+        query = query.where(
+            func.length(Section.path) <= len(section.path) + max_depth * (tree.SEGMENT_WIDTH + 1)
+        )
+
+    nodes = {}
+    root = None
+    for row in db.session.execute(query):
+        node = {
+            'id': row.id,
+            'title': row.title,
+            'slug': row.slug,
+            'chapter': row.chapter,
+            'depth': tree.depth(row.path) - base_depth,
+            'children': [],
+        }
+        nodes[row.path] = node
+        if root is None:
+            root = node
+        else:
+            nodes[tree.parent_path(row.path)]['children'].append(node)
+    return root
@@ -0,0 +1,256 @@
+# lotusrpg/rules/images.py
+"""Rulebook illustrations: content-addressed storage and responsive variants"""
+import io
+import os
+import threading
+
+from flask import current_app
+from PIL import Image as PILImage, UnidentifiedImageError
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.exc import IntegrityError
+
+from lotusrpg import media
+from lotusrpg.media import images as encoding
+from lotusrpg.models import Image, ImageVariant, Section, db
+from lotusrpg.rules import bump_rulebooks
+from lotusrpg.rules import snapshots
+
+ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
+DEFAULT_WIDTHS = (320, 640, 960, 1280, 1920)
+DEFAULT_FORMATS = ('avif', 'webp')
+
+FAILED = 'failed'
+
+# EXIF orientations that swap width and height
+_ROTATED = {5, 6, 7, 8}
+
+_pending = set()  # source hashes with generation queued in this process
+_pending_lock = threading.Lock()
+
+
+class ImageError(ValueError):
+    """Raised for uploads that are not usable images"""
+
+    status = 400
+
+
+class ImageTooLarge(ImageError):
+    status = 413
+
+
+def max_bytes():
+    return current_app.config.get('IMAGE_MAX_BYTES', 20 * 1024 * 1024)
+
+
+def variant_formats():
+    """The configured variant formats this Pillow build can encode"""
+    return encoding.available_formats(current_app.config.get('IMAGE_VARIANT_FORMATS', DEFAULT_FORMATS))
+
+
+def source_path(image):
+    if os.path.isabs(image.file_path):
+        return image.file_path
+    return os.path.join(media.image_folder(), image.file_path)
+
+
+def _measure(data):
+    """Validate ``data`` as an image and return its displayed ``(width, height)``"""
+    try:
+        with PILImage.open(io.BytesIO(data)) as img:
+            img.verify()
+        with PILImage.open(io.BytesIO(data)) as img:
+            width, height = img.size
+            if img.getexif().get(0x0112) in _ROTATED:
+                width, height = height, width
+    except PILImage.DecompressionBombError:
+        raise ImageError('Image dimensions are too large')
+    except (UnidentifiedImageError, OSError, SyntaxError):
+        raise ImageError('Invalid image file')
+    return width, height
+
+
+def store_original(data, filename):
+    """Save uploaded bytes under their content hash.
+
+    Returns ``(content_hash, file_name, width, height)``. Re-uploading the
+    same file reuses the stored copy.
+    """
+    ext = filename.rsplit('.', 1)[1].lower() if '.' in filename else ''
+    if ext not in ALLOWED_EXTENSIONS:
+        raise ImageError('Invalid file type. Use PNG, JPG, JPEG, GIF or WEBP')
+    if len(data) > max_bytes():
+        raise ImageTooLarge(f'Image exceeds {max_bytes()} bytes')
+    width, height = _measure(data)
+
+    source_hash = encoding.content_hash(data)
+    file_name = f'{source_hash}.{ext}'
+    folder = media.image_folder()
+    path = os.path.join(folder, file_name)
+    if not os.path.exists(path):
+        os.makedirs(folder, exist_ok=True)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    return source_hash, file_name, width, height
+
+
+def schedule(image):
+    """Queue variant generation for ``image``'s file.
+
+    Nothing is queued when the file already has variants (from this or any
+    identical upload), is already being processed in this worker, or no
+    variant format can be encoded. Returns the pool future, or ``None``.
+    """
+    source_hash = image.content_hash
+    formats = variant_formats()
+    if source_hash is None or not formats:
+        return None
+    if db.session.execute(
+        select(ImageVariant.id).where(ImageVariant.source_hash == source_hash).limit(1)
+    ).first():
+        return None
+
+    with _pending_lock:
+        if source_hash in _pending:
+            return None
+        _pending.add(source_hash)
+
+    def done(results):
+        try:
+            record_variants(source_hash, results)
+        finally:
+            with _pending_lock:
+                _pending.discard(source_hash)
+
+    def failed(exc):
+        try:
+            mark_failed(source_hash)
+        finally:
+            with _pending_lock:
+                _pending.discard(source_hash)
+
+    widths = tuple(current_app.config.get('IMAGE_VARIANT_WIDTHS', DEFAULT_WIDTHS))
+    return media.submit(
+        encoding.render_variants,
+        source_path(image), media.image_folder(), source_hash, widths, formats,
+        on_done=done, on_error=failed,
+    )
+
+
+def record_variants(source_hash, results):
+    """Store generated variants and refresh the snapshots of sections showing them"""
+    from lotusrpg.rules.search import rules_index
+
+    existing = set(db.session.execute(
+        select(ImageVariant.format, ImageVariant.width).where(ImageVariant.source_hash == source_hash)
+    ).all())
+    rows = [
+        {'source_hash': source_hash, **result} for result in results
+        if (result['format'], result['width']) not in existing
+    ]
+    if not rows:
+        return
+
+    try:
+        db.session.execute(insert(ImageVariant), rows)
+        # A retry after a failed attempt succeeded
+        _set_status(source_hash, None)
+        versions = _refresh_sections(source_hash)
+        db.session.commit()
+    except IntegrityError:
+        # Another worker recorded the same variants first
+        db.session.rollback()
+        return
+
+    if versions:
+        rules_index.sections_touched(versions)
+
+
+def mark_failed(source_hash):
+    """Report the images of a file whose variants could not be generated as failed.
+
+    ``flask rules image-variants`` retries them.
+    """
+    from lotusrpg.rules.search import rules_index
+
+    _set_status(source_hash, FAILED)
+    versions = _refresh_sections(source_hash)
+    db.session.commit()
+    if versions:
+        rules_index.sections_touched(versions)
+
+
+def _set_status(source_hash, status):
+    db.session.execute(
+        update(Image)
+        .where(Image.content_hash == source_hash, Image.variant_status.is_distinct_from(status))
+        .values(variant_status=status),
+        execution_options={'synchronize_session': False}
+    )
+
+
+def _refresh_sections(source_hash):
+    """Rebuild the snapshots of sections showing the file; returns the bumped rulebook versions"""
+    sections = db.session.execute(
+        select(Section).where(Section.id.in_(
+            select(Image.section_id).where(Image.content_hash == source_hash)
+        ))
+    ).scalars().all()
+    versions = {}
+    if sections:
+        versions = bump_rulebooks(*(section.rulebook for section in sections))
+        for section in sections:
+            snapshots.rebuild(section, versions)
+    return versions
+
+
+def release(source_hash):
+    """Drop the variants of a file no image uses any more; the caller commits.
+
+    Returns the file names to delete once the transaction has committed.
+    """
+    if source_hash is None:
+        return []
+    still_used = db.session.execute(
+        select(Image.id).where(Image.content_hash == source_hash).limit(1)
+    ).first()
+    if still_used:
+        return []
+
+    names = db.session.execute(
+        select(ImageVariant.file_name).where(ImageVariant.source_hash == source_hash)
+    ).scalars().all()
+    db.session.execute(delete(ImageVariant).where(ImageVariant.source_hash == source_hash))
+    # The original keeps its upload's extension, one of ALLOWED_EXTENSIONS
+    folder = media.image_folder()
+    originals = [
+        f'{source_hash}.{ext}' for ext in sorted(ALLOWED_EXTENSIONS)
+        if os.path.exists(os.path.join(folder, f'{source_hash}.{ext}'))
+    ]
+    return list(names) + originals
+
+
+def unlink(file_names):
+    folder = media.image_folder()
+    for name in file_names:
+        try:
+            os.remove(os.path.join(folder, name))
+        except FileNotFoundError:
+            pass
+
+
+def backfill_hashes():
+    """Hash and measure images stored before variants existed. Returns the number updated."""
+    updated = 0
+    for image in Image.query.filter(Image.content_hash.is_(None)):
+        try:
+            with open(source_path(image), 'rb') as f:
+                data = f.read()
+            image.width, image.height = _measure(data)
+        except (OSError, ImageError):
+            continue
+        image.content_hash = encoding.content_hash(data)
+        updated += 1
+    return updated
+
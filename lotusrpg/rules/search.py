@@ -0,0 +1,192 @@
+# lotusrpg/rules/search.py
+"""Full-text index over rulebook sections and their content blocks"""
+import threading
+
+from sqlalchemy import select
+
+from lotusrpg.models import Section, Content, db
+from lotusrpg.rules import RULEBOOKS, revision_key
+from lotusrpg.revisions import RevisionTracker
+from lotusrpg.search import InvertedIndex
+
+# Keys in content_data that hold URLs or styling rather than readable text
+_NON_TEXT_KEYS = frozenset({'src', 'href', 'url', 'class', 'class_name', 'style', 'id'})
+
+TITLE_WEIGHT = 3
+PREVIEW_LENGTH = 200
+
+
+def extract_text(data):
+    """Collect the readable strings from a ``Content.content_data`` blob"""
+    parts = []
+
+    def walk(value):
+        if isinstance(value, str):
+            parts.append(value)
+        elif isinstance(value, dict):
+            for key, item in value.items():
+                if key not in _NON_TEXT_KEYS:
+                    walk(item)
+        elif isinstance(value, (list, tuple)):
+            for item in value:
+                walk(item)
+
+    walk(data)
+    return ' '.join(parts)
+
+
+def _preview(text):
+    if len(text) <= PREVIEW_LENGTH:
+        return text
+    return text[:PREVIEW_LENGTH] + '...'
+
+
+class RulesSearchIndex:
+    """Inverted index of section titles and content blocks.
+
+    Built lazily on the first search, patched in place by the admin write
+    paths, and rebuilt when another worker has changed a rulebook.
+    """
+
+    def __init__(self):
+        self._index = InvertedIndex()
+        self._tracker = RevisionTracker(*(revision_key(r) for r in RULEBOOKS))
+        self._by_section = {}  # section id -> set of content doc ids
+        self._lock = threading.RLock()
+
+    def ensure_current(self):
+        with self._lock:
+            if not self._tracker.is_current():
+                self.rebuild()
+
+    def rebuild(self):
+        with self._lock:
+            versions = self._tracker.snapshot()
+            self._index.clear()
+            self._by_section = {}
+
+            for section in db.session.execute(
+                select(Section.id, Section.title, Section.slug, Section.rulebook)
+            ):
+                self._add_title(section)
+
+            rows = db.session.execute(
+                select(
+                    Content.id, Content.section_id, Content.content_type, Content.content_data,
+                    Section.title, Section.slug, Section.rulebook,
+                ).join(Section, Content.section_id == Section.id)
+            )
+            for row in rows:
+                self._add_content(
+                    row.id, row.section_id, row.content_type, row.content_data,
+                    row.title, row.slug, row.rulebook,
+                )
+
+            self._tracker.mark_built(versions)
+
+    def _add_title(self, section):
+        self._index.add(
+            ('section', section.id),
+            [(section.title, TITLE_WEIGHT), (section.slug.replace('-', ' '), 1)],
+            {
+                'section_id': section.id,
+                'section_title': section.title,
+                'slug': section.slug,
+                'rulebook': section.rulebook,
+                'content_type': 'section',
+                'content_preview': section.title,
+            },
+        )
+
+    def _add_content(self, content_id, section_id, content_type, content_data, title, slug, rulebook):
+        text = extract_text(content_data)
+        doc_id = ('content', content_id)
+        self._index.add(doc_id, [(text, 1)], {
+            'section_id': section_id,
+            'content_id': content_id,
+            'section_title': title,
+            'slug': slug,
+            'rulebook': rulebook,
+            'content_type': content_type,
+            'content_preview': _preview(text),
+        })
+        self._by_section.setdefault(section_id, set()).add(doc_id)
+
+    def _advance(self, versions):
+        for rulebook, version in versions.items():
+            self._tracker.advance(revision_key(rulebook), version)
+
+    # Incremental maintenance, called by the admin write paths after commit.
+    # ``versions`` maps each rulebook the write touched to its new revision.
+
+    def section_saved(self, section, versions):
+        with self._lock:
+            self._add_title(section)
+            for doc_id in self._by_section.get(section.id, ()):
+                self._index.update_meta(
+                    doc_id,
+                    section_title=section.title,
+                    slug=section.slug,
+                    rulebook=section.rulebook,
+                )
+            self._advance(versions)
+
+    def section_deleted(self, section_id, versions):
+        with self._lock:
+            self._index.remove(('section', section_id))
+            for doc_id in self._by_section.pop(section_id, ()):
+                self._index.remove(doc_id)
+            self._advance(versions)
+
+    def content_saved(self, content, versions):
+        section = content.section
+        with self._lock:
+            old = ('content', content.id)
+            for doc_ids in self._by_section.values():
+                doc_ids.discard(old)
+            self._add_content(
+                content.id, content.section_id, content.content_type, content.content_data,
+                section.title, section.slug, section.rulebook,
+            )
+            self._advance(versions)
+
+    def content_deleted(self, content_id, section_id, versions):
+        with self._lock:
+            doc_id = ('content', content_id)
+            self._index.remove(doc_id)
+            self._by_section.get(section_id, set()).discard(doc_id)
+            self._advance(versions)
+
+    def sections_touched(self, versions):
+        """Record a write that changed no indexed text, such as new image variants"""
+        with self._lock:
+            self._advance(versions)
+
+    def section_contents_replaced(self, section, versions):
+        """Re-index every content block of ``section`` after a bulk edit"""
+        rows = db.session.execute(
+            select(Content.id, Content.content_type, Content.content_data)
+            .where(Content.section_id == section.id)
+        ).all()
+        with self._lock:
+            for doc_id in self._by_section.pop(section.id, ()):
+                self._index.remove(doc_id)
+            for row in rows:
+                self._add_content(
+                    row.id, section.id, row.content_type, row.content_data,
+                    section.title, section.slug, section.rulebook,
+                )
+            self._advance(versions)
+
+    def search(self, query, rulebook=None, limit=50):
+        self.ensure_current()
+        predicate = None
+        if rulebook:
+            predicate = lambda meta: meta['rulebook'] == rulebook
+        return [
+            {**meta, 'score': round(score, 4)}
+            for score, _doc_id, meta in self._index.search(query, limit=limit, predicate=predicate)
+        ]
+
+
+rules_index = RulesSearchIndex()
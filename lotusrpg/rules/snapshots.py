@@ -0,0 +1,110 @@
+# lotusrpg/rules/snapshots.py
+"""Pre-serialized section payloads for the public section and bundle endpoints"""
+import hashlib
+import json
+from datetime import datetime
+
+from sqlalchemy import select, update
+
+from lotusrpg.models import Section, SectionSnapshot, db
+from lotusrpg import revisions
+from lotusrpg.rules import revision_key
+from lotusrpg.schemas import section_schema
+
+
+def render_section(section):
+    """Serialize ``section`` with its contents and images to compact JSON text"""
+    db.session.flush()
+    db.session.expire(section, ['contents', 'images'])
+    return json.dumps(section_schema.dump(section), separators=(',', ':'), default=str)
+
+
+def _tombstone(section_id, versions, exclude_rulebook=None):
+    """Mark the live snapshots of ``section_id`` deleted, except in ``exclude_rulebook``"""
+    query = select(SectionSnapshot.rulebook).where(
+        SectionSnapshot.section_id == section_id,
+        SectionSnapshot.deleted.is_(False),
+    )
+    if exclude_rulebook:
+        query = query.where(SectionSnapshot.rulebook != exclude_rulebook)
+
+    for rulebook in db.session.execute(query).scalars().all():
+        if rulebook not in versions:
+            versions[rulebook] = revisions.bump(revision_key(rulebook))
+        db.session.execute(
+            update(SectionSnapshot)
+            .where(SectionSnapshot.section_id == section_id, SectionSnapshot.rulebook == rulebook)
+            .values(
+                deleted=True,
+                payload='',
+                content_hash='',
+                version=versions[rulebook],
+                updated_at=datetime.utcnow(),
+            )
+        )
+
+
+def rebuild(section, versions):
+    """Store a fresh snapshot of ``section`` in the current transaction.
+
+    ``versions`` maps each rulebook touched by the triggering write to its new
+    revision. If the section moved between rulebooks, its snapshot in the old
+    rulebook becomes a tombstone. Returns the stored ``(payload, content_hash)``.
+    """
+    payload = render_section(section)
+    content_hash = hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    _tombstone(section.id, versions, exclude_rulebook=section.rulebook)
+
+    snapshot = db.session.get(SectionSnapshot, (section.id, section.rulebook))
+    if snapshot is None:
+        snapshot = SectionSnapshot(section_id=section.id, rulebook=section.rulebook)
+        db.session.add(snapshot)
+
+    snapshot.slug = section.slug
+    snapshot.version = versions[section.rulebook]
+    snapshot.content_hash = content_hash
+    snapshot.payload = payload
+    snapshot.deleted = False
+    snapshot.updated_at = datetime.utcnow()
+
+    return payload, content_hash
+
+
+def remove(section_id, versions):
+    """Turn a deleted section's snapshots into tombstones"""
+    _tombstone(section_id, versions)
+
+
+def lookup(slug):
+    """Return ``(payload, content_hash)`` for ``slug`` without loading any ORM objects"""
+    row = db.session.execute(
+        select(SectionSnapshot.payload, SectionSnapshot.content_hash)
+        .where(SectionSnapshot.slug == slug, SectionSnapshot.deleted.is_(False))
+    ).first()
+    if row is None:
+        return None
+    return row.payload, row.content_hash
+
+
+def stamp(slug):
+    """Return ``(content_hash, updated_at)`` for ``slug`` from the narrow snapshot columns"""
+    row = db.session.execute(
+        select(SectionSnapshot.content_hash, SectionSnapshot.updated_at)
+        .where(SectionSnapshot.slug == slug, SectionSnapshot.deleted.is_(False))
+    ).first()
+    if row is None:
+        return None
+    return row.content_hash, row.updated_at
+
+
+def backfill(rulebook, version):
+    """Snapshot any sections of ``rulebook`` that predate the snapshot table"""
+    missing = Section.query.outerjoin(
+        SectionSnapshot,
+        (SectionSnapshot.section_id == Section.id) & (SectionSnapshot.rulebook == Section.rulebook),
+    ).filter(Section.rulebook == rulebook, SectionSnapshot.section_id.is_(None)).all()
+
+    for section in missing:
+        rebuild(section, {rulebook: version})
+    return len(missing)
@@ -0,0 +1,61 @@
+# lotusrpg/rules/toc.py
+"""Materialized table of contents per rulebook"""
+import threading
+
+from sqlalchemy import select
+
+from lotusrpg.models import Section, db
+from lotusrpg import revisions
+from lotusrpg.rules import toc_revision_key
+
+
+def build_toc(rulebook):
+    """Build a rulebook's chapter list with one ordered query.
+
+    Chapters appear in the order their first section was created and sections
+    keep creation order within a chapter, which matches how the books are
+    authored.
+    """
+    rows = db.session.execute(
+        select(Section.id, Section.title, Section.slug, Section.chapter)
+        .where(Section.rulebook == rulebook)
+        .order_by(Section.id)
+    )
+
+    chapters = {}
+    for row in rows:
+        chapter = chapters.get(row.chapter)
+        if chapter is None:
+            chapter = chapters[row.chapter] = {'title': row.chapter, 'sections': []}
+        chapter['sections'].append({'id': row.id, 'title': row.title, 'slug': row.slug})
+
+    return list(chapters.values())
+
+
+class TocCache:
+    """Caches each rulebook's TOC together with the revision it reflects"""
+
+    def __init__(self):
+        self._entries = {}  # rulebook -> (version, chapters)
+        self._lock = threading.Lock()
+
+    def get(self, rulebook):
+        """Return ``(version, chapters)`` for ``rulebook``"""
+        version = revisions.current(toc_revision_key(rulebook))
+        with self._lock:
+            entry = self._entries.get(rulebook)
+        if entry and entry[0] == version:
+            return entry
+
+        entry = (version, build_toc(rulebook))
+        with self._lock:
+            self._entries[rulebook] = entry
+        return entry
+
+    def invalidate(self, *rulebooks):
+        with self._lock:
+            for rulebook in rulebooks:
+                self._entries.pop(rulebook, None)
+
+
+toc_cache = TocCache()
@@ -1,7 +1,8 @@
 # lotusrpg/schemas/__init__.py
-from marshmallow import Schema, fields, post_load, validates, ValidationError
+from marshmallow import EXCLUDE, Schema, fields, post_load, validates, validates_schema, ValidationError
 from marshmallow_sqlalchemy import SQLAlchemyAutoSchema
-from lotusrpg.models import User, Section, Content, Post, Comment
+from lotusrpg.models import User, Section, Content, Image, ImageVariant, Post, Comment
+from lotusrpg import media
 
 class UserSchema(SQLAlchemyAutoSchema):
     class Meta:
@@ -26,29 +27,69 @@ class ContentSchema(SQLAlchemyAutoSchema):
     # Handle JSON content_data properly
     content_data = fields.Raw()
 
+class ImageVariantSchema(SQLAlchemyAutoSchema):
+    class Meta:
+        model = ImageVariant
+        fields = ('format', 'width', 'height', 'file_size', 'url')
+        
+    url = fields.Method('get_url')
+    
+    def get_url(self, obj):
+        return media.image_url(obj.file_name)
+
+class ImageSchema(SQLAlchemyAutoSchema):
+    class Meta:
+        model = Image
+        load_instance = True
+        exclude = ('content_hash', 'variant_status')
+        
+    url = fields.Method('get_url')
+    status = fields.Method('get_status')
+    variants = fields.Nested(ImageVariantSchema, many=True, dump_only=True)
+    srcset = fields.Method('get_srcset')
+    
+    def get_url(self, obj):
+        return media.image_url(obj.file_path)
+    
+    def get_status(self, obj):
+        from lotusrpg.rules.images import FAILED, variant_formats
+
+        # Without an encodable format no variants will ever be generated
+        if obj.variants or not variant_formats():
+            return 'ready'
+        return FAILED if obj.variant_status == FAILED else 'pending'
+    
+    def get_srcset(self, obj):
+        formats = sorted({variant.format for variant in obj.variants})
+        return {fmt: media.srcset(obj.variants, fmt) for fmt in formats}
+
 class SectionSchema(SQLAlchemyAutoSchema):
     class Meta:
         model = Section
         load_instance = True
+        exclude = ('path',)
         
     contents = fields.Nested(ContentSchema, many=True, dump_only=True)
+    images = fields.Nested(ImageSchema, many=True, dump_only=True)
     content_count = fields.Method('get_content_count')
     
     def get_content_count(self, obj):
         return len(obj.contents)
 
+class AuthorSchema(Schema):
+    """Public projection of a user shown next to forum posts and comments"""
+    id = fields.Int()
+    username = fields.Str()
+    image_file = fields.Str()
+
 class PostSchema(SQLAlchemyAutoSchema):
     class Meta:
         model = Post
         load_instance = True
         
-    author = fields.Nested(UserSchema, dump_only=True)
-    comment_count = fields.Method('get_comment_count')
+    author = fields.Nested(AuthorSchema, dump_only=True)
     excerpt = fields.Method('get_excerpt')
     
-    def get_comment_count(self, obj):
-        return len(obj.comments)
-    
     def get_excerpt(self, obj, length=200):
         if len(obj.content) <= length:
             return obj.content
@@ -58,19 +99,45 @@ class CommentSchema(SQLAlchemyAutoSchema):
     class Meta:
         model = Comment
         load_instance = True
+        exclude = ('path',)
         
-    user = fields.Nested(UserSchema, dump_only=True)
+    parent_id = fields.Int(dump_only=True, allow_none=True)
+    user = fields.Nested(AuthorSchema, dump_only=True)
 
 # Request/Response Schemas
 class LoginSchema(Schema):
     email = fields.Email(required=True)
     password = fields.Str(required=True, validate=lambda x: len(x) >= 6)
+    mode = fields.Str(load_default='session', validate=lambda x: x in ('session', 'token'))
+
+class RefreshSchema(Schema):
+    refresh_token = fields.Str(required=True)
+
+class LogoutSchema(Schema):
+    refresh_token = fields.Str(load_default=None)
 
 class RegisterSchema(Schema):
     username = fields.Str(required=True, validate=lambda x: len(x) >= 2)
     email = fields.Email(required=True)
     password = fields.Str(required=True, validate=lambda x: len(x) >= 6)
 
+class UserImportSchema(Schema):
+    """One record of ``flask users import``"""
+    class Meta:
+        unknown = EXCLUDE
+    
+    username = fields.Str(required=True, validate=lambda x: 2 <= len(x) <= 20)
+    email = fields.Email(required=True, validate=lambda x: len(x) <= 120)
+    password = fields.Str(validate=lambda x: len(x) >= 6)
+    password_hash = fields.Str()
+    roles = fields.List(fields.Str(), load_default=list)
+    active = fields.Bool(load_default=True)
+    
+    @validates_schema
+    def validate_password(self, data, **kwargs):
+        if ('password' in data) == ('password_hash' in data):
+            raise ValidationError('Give either password or password_hash', 'password')
+
 class SectionCreateSchema(Schema):
     title = fields.Str(required=True)
     slug = fields.Str(required=True)
@@ -85,12 +152,31 @@ class ContentCreateSchema(Schema):
     content_data = fields.Raw(required=True)
     style_class = fields.Str(allow_none=True)
 
+class ContentBlockSchema(Schema):
+    """One block of a section's ordered content list; ``id`` marks an existing row"""
+    id = fields.Int(load_default=None, allow_none=True)
+    content_type = fields.Str(required=True, validate=lambda x: x in Content.content_type.type.enums)
+    content_data = fields.Raw(required=True)
+    style_class = fields.Str(load_default=None, allow_none=True)
+
+class SectionBlocksSchema(Schema):
+    blocks = fields.List(fields.Nested(ContentBlockSchema), required=True)
+
 # Pagination Schema - FIXED
 class PaginationSchema(Schema):
     page = fields.Int(load_default=1, validate=lambda x: x > 0)
     per_page = fields.Int(load_default=10, validate=lambda x: 1 <= x <= 100)
     search = fields.Str(load_default=None, allow_none=True)
 
+class CursorPaginationSchema(Schema):
+    class Meta:
+        unknown = EXCLUDE
+        
+    cursor = fields.Str(load_default=None, allow_none=True)
+    per_page = fields.Int(load_default=10, validate=lambda x: 1 <= x <= 100)
+    search = fields.Str(load_default=None, allow_none=True)
+    include_total = fields.Bool(load_default=False)
+
 # Initialize schemas
 user_schema = UserSchema()
 users_schema = UserSchema(many=True)
@@ -98,6 +184,7 @@ section_schema = SectionSchema()
 sections_schema = SectionSchema(many=True)
 content_schema = ContentSchema()
 contents_schema = ContentSchema(many=True)
+image_schema = ImageSchema()
 post_schema = PostSchema()
 posts_schema = PostSchema(many=True)
 comment_schema = CommentSchema()
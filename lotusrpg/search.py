@@ -0,0 +1,327 @@
+# lotusrpg/search.py
+"""Small in-process full-text engine: tokenizer, stemmer and a BM25 inverted index"""
+import bisect
+import heapq
+import html
+import math
+import re
+import threading
+from collections import Counter
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+STOPWORDS = frozenset({
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'for', 'from', 'in',
+    'is', 'it', 'its', 'of', 'on', 'or', 'that', 'the', 'this', 'to', 'with',
+})
+
+
+def _is_consonant(word, i):
+    ch = word[i]
+    if ch in 'aeiou':
+        return False
+    if ch == 'y':
+        return i == 0 or not _is_consonant(word, i - 1)
+    return True
+
+
+def _measure(word):
+    """Porter's m: the number of vowel-consonant sequences in ``word``"""
+    m = 0
+    prev_vowel = False
+    for i in range(len(word)):
+        vowel = not _is_consonant(word, i)
+        if prev_vowel and not vowel:
+            m += 1
+        prev_vowel = vowel
+    return m
+
+
+def _has_vowel(word):
+    return any(not _is_consonant(word, i) for i in range(len(word)))
+
+
+def _ends_double_consonant(word):
+    return len(word) >= 2 and word[-1] == word[-2] and _is_consonant(word, len(word) - 1)
+
+
+def _ends_cvc(word):
+    return (
+        len(word) >= 3
+        and _is_consonant(word, len(word) - 3)
+        and not _is_consonant(word, len(word) - 2)
+        and _is_consonant(word, len(word) - 1)
+        and word[-1] not in 'wxy'
+    )
+
+
+def stem(word):
+    """Porter stemmer, step 1 only (plurals, -ed/-ing, trailing y).
+
+    Later Porter steps conflate too aggressively for rule names, so they are
+    deliberately left out.
+    """
+    if len(word) <= 3 or word.isdigit():
+        return word
+
+    # Step 1a
+    if word.endswith('sses'):
+        word = word[:-2]
+    elif word.endswith('ies'):
+        word = word[:-2]
+    elif word.endswith('s') and not word.endswith('ss'):
+        word = word[:-1]
+
+    # Step 1b
+    trimmed = False
+    if word.endswith('eed'):
+        if _measure(word[:-3]) > 0:
+            word = word[:-1]
+    elif word.endswith('ed') and _has_vowel(word[:-2]):
+        word = word[:-2]
+        trimmed = True
+    elif word.endswith('ing') and _has_vowel(word[:-3]):
+        word = word[:-3]
+        trimmed = True
+
+    if trimmed:
+        if word.endswith(('at', 'bl', 'iz')):
+            word += 'e'
+        elif _ends_double_consonant(word) and word[-1] not in 'lsz':
+            word = word[:-1]
+        elif _measure(word) == 1 and _ends_cvc(word):
+            word += 'e'
+
+    # Step 1c
+    if word.endswith('y') and _has_vowel(word[:-1]):
+        word = word[:-1] + 'i'
+
+    return word
+
+
+def tokenize(text):
+    """Lowercase, split and stem ``text``, dropping stopwords"""
+    return [stem(token) for token in _TOKEN_RE.findall(text.lower()) if token not in STOPWORDS]
+
+
+class InvertedIndex:
+    """Thread-safe inverted index with BM25 ranking and incremental updates.
+
+    Documents are identified by any hashable id and carry a metadata dict that
+    is returned with each hit, so callers never need a second lookup.
+    """
+
+    def __init__(self, k1=1.2, b=0.75, max_prefix_terms=20):
+        self.k1 = k1
+        self.b = b
+        self.max_prefix_terms = max_prefix_terms
+        self._postings = {}     # term -> {doc_id: weighted term frequency}
+        self._doc_terms = {}    # doc_id -> Counter of its terms
+        self._doc_len = {}      # doc_id -> weighted document length
+        self._meta = {}         # doc_id -> metadata
+        self._terms = []        # sorted vocabulary, for prefix expansion
+        self._total_len = 0.0
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._doc_len)
+
+    def __contains__(self, doc_id):
+        return doc_id in self._doc_len
+
+    def clear(self):
+        with self._lock:
+            self._postings.clear()
+            self._doc_terms.clear()
+            self._doc_len.clear()
+            self._meta.clear()
+            self._terms.clear()
+            self._total_len = 0.0
+
+    def add(self, doc_id, fields, meta=None):
+        """Index (or re-index) a document.
+
+        ``fields`` is an iterable of ``(text, weight)`` pairs; a term found in a
+        field of weight 2 counts twice towards the document's term frequency.
+        """
+        terms = Counter()
+        for text, weight in fields:
+            for term in tokenize(text or ''):
+                terms[term] += weight
+
+        with self._lock:
+            self._remove(doc_id)
+            for term, tf in terms.items():
+                postings = self._postings.get(term)
+                if postings is None:
+                    postings = self._postings[term] = {}
+                    bisect.insort(self._terms, term)
+                postings[doc_id] = tf
+            length = float(sum(terms.values()))
+            self._doc_terms[doc_id] = terms
+            self._doc_len[doc_id] = length
+            self._meta[doc_id] = meta or {}
+            self._total_len += length
+
+    def remove(self, doc_id):
+        with self._lock:
+            self._remove(doc_id)
+
+    def _remove(self, doc_id):
+        terms = self._doc_terms.pop(doc_id, None)
+        if terms is None:
+            return
+        for term in terms:
+            postings = self._postings[term]
+            del postings[doc_id]
+            if not postings:
+                del self._postings[term]
+                i = bisect.bisect_left(self._terms, term)
+                del self._terms[i]
+        self._total_len -= self._doc_len.pop(doc_id)
+        self._meta.pop(doc_id, None)
+
+    def documents(self, predicate=None):
+        """``(doc_id, meta)`` of every document, or of those whose metadata ``predicate`` accepts"""
+        with self._lock:
+            return [
+                (doc_id, meta) for doc_id, meta in self._meta.items()
+                if predicate is None or predicate(meta)
+            ]
+
+    def update_meta(self, doc_id, **values):
+        with self._lock:
+            if doc_id in self._meta:
+                self._meta[doc_id] = {**self._meta[doc_id], **values}
+
+    def _expand_prefix(self, prefix):
+        i = bisect.bisect_left(self._terms, prefix)
+        expanded = []
+        while i < len(self._terms) and self._terms[i].startswith(prefix):
+            expanded.append(self._terms[i])
+            if len(expanded) >= self.max_prefix_terms:
+                break
+            i += 1
+        return expanded
+
+    def matching(self, query, prefix=True):
+        """Ids of the documents containing every query word.
+
+        With ``prefix`` the last word also matches any indexed term it begins.
+        """
+        words = [w for w in _TOKEN_RE.findall(query.lower()) if w not in STOPWORDS]
+        if not words:
+            return set()
+
+        with self._lock:
+            alternatives = [{stem(word)} for word in words]
+            if prefix:
+                alternatives[-1].update(self._expand_prefix(words[-1]))
+            matched = None
+            for terms in alternatives:
+                docs = set()
+                for term in terms:
+                    docs.update(self._postings.get(term, ()))
+                matched = docs if matched is None else matched & docs
+                if not matched:
+                    break
+            return matched
+
+    def search(self, query, limit=50, prefix=True, predicate=None, boost=None):
+        """Return up to ``limit`` ``(score, doc_id, meta)`` tuples, best first.
+
+        With ``prefix`` the last query word also matches any indexed term it
+        begins (at a reduced weight), which suits search-as-you-type boxes.
+        ``predicate`` receives each candidate's metadata and may reject it;
+        ``boost`` receives it too and returns a factor for the BM25 score.
+        """
+        words = [w for w in _TOKEN_RE.findall(query.lower()) if w not in STOPWORDS]
+        if not words:
+            return []
+
+        weighted_terms = {stem(word): 1.0 for word in words}
+
+        with self._lock:
+            if prefix:
+                last = words[-1]
+                for term in self._expand_prefix(last):
+                    weighted_terms.setdefault(term, 0.7)
+
+            n_docs = len(self._doc_len)
+            if not n_docs:
+                return []
+            avg_len = self._total_len / n_docs or 1.0
+
+            scores = {}
+            for term, query_weight in weighted_terms.items():
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                df = len(postings)
+                idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+                for doc_id, tf in postings.items():
+                    norm = self.k1 * (1 - self.b + self.b * self._doc_len[doc_id] / avg_len)
+                    score = query_weight * idf * tf * (self.k1 + 1) / (tf + norm)
+                    scores[doc_id] = scores.get(doc_id, 0.0) + score
+
+            if predicate is not None:
+                scores = {d: s for d, s in scores.items() if predicate(self._meta[d])}
+            if boost is not None:
+                scores = {d: s * boost(self._meta[d]) for d, s in scores.items()}
+
+            best = heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+            return [(score, doc_id, self._meta[doc_id]) for doc_id, score in best]
+
+
+def query_terms(query):
+    """Stemmed query terms and the raw last word, for prefix-aware highlighting"""
+    words = [w for w in _TOKEN_RE.findall(query.lower()) if w not in STOPWORDS]
+    return {stem(word) for word in words}, (words[-1] if words else None)
+
+
+def highlight(text, query, max_words=30, prefix=True, mark=('<mark>', '</mark>')):
+    """HTML-escaped excerpt of ``text`` around its densest run of query matches.
+
+    Matching words are wrapped in ``mark``. Falls back to the start of the
+    text when nothing matches.
+    """
+    terms, last = query_terms(query)
+    tokens = list(_TOKEN_RE.finditer(text.lower()))
+    if not tokens:
+        return html.escape(text[:200])
+
+    def matches(word):
+        return stem(word) in terms or (prefix and last is not None and word.startswith(last))
+
+    hits = [i for i, token in enumerate(tokens) if matches(token.group())]
+
+    # Window of max_words tokens holding the most matches
+    start = 0
+    if hits:
+        best, lo = 0, 0
+        for hi in range(len(hits)):
+            while hits[hi] - hits[lo] >= max_words:
+                lo += 1
+            if hi - lo + 1 > best:
+                best, start = hi - lo + 1, hits[lo]
+        start = max(0, min(start - max_words // 4, len(tokens) - max_words))
+    end = min(len(tokens), start + max_words)
+
+    begin_char = tokens[start].start() if start else 0
+    end_char = tokens[end - 1].end() if end < len(tokens) else len(text)
+    hit_set = set(hits)
+    parts, pos = [], begin_char
+    for i in range(start, end):
+        token = tokens[i]
+        if i in hit_set:
+            parts.append(html.escape(text[pos:token.start()]))
+            parts.append(mark[0] + html.escape(text[token.start():token.end()]) + mark[1])
+            pos = token.end()
+    parts.append(html.escape(text[pos:end_char]))
+
+    snippet = ''.join(parts).strip()
+    if start > 0:
+        snippet = '...' + snippet
+    if end < len(tokens):
+        snippet += '...'
+    return snippet
@@ -0,0 +1,228 @@
+# lotusrpg/stats.py
+"""Row counts for the admin dashboard, kept in the ``stat_counter`` table.
+
+Counting users, posts and comments on every dashboard load scans tables
+that only grow. Instead, session listeners adjust a counter row in the same
+transaction as every insert or delete of a counted model, whether it goes
+through the unit of work or a bulk ``insert``/``delete`` statement, and as
+users are activated, deactivated, banned or unbanned. Reading the dashboard
+is then one query over a handful of counter rows plus an indexed count of
+current lockouts, which expire with the clock rather than with a write.
+Results are cached per process for ``STATS_CACHE_TTL`` seconds.
+
+Counter rows that are missing, on a new database or after a change the
+listeners could not size, are recomputed by a single aggregate query. A
+periodic job runs the same query to correct any drift.
+"""
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import and_, bindparam, case, delete, event, func, insert, inspect, literal, select, union_all, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from lotusrpg import tasks
+from lotusrpg.models import Comment, Content, Post, Section, StatCounter, User, db
+
+
+def _true(value):
+    return value is not None and bool(value)
+
+
+def _false(value):
+    return value is not None and not value
+
+
+# Counter key -> (model, predicate); the predicate reads a row's columns
+# through ``get(name, default)`` and says whether the row is counted
+COUNTERS = {
+    'total_users': (User, lambda get: True),
+    'total_sections': (Section, lambda get: True),
+    'total_contents': (Content, lambda get: True),
+    'total_posts': (Post, lambda get: True),
+    'total_comments': (Comment, lambda get: True),
+    'active_users': (User, lambda get: _true(get('active', True)) and _false(get('is_banned', False))),
+    'banned_users': (User, lambda get: _true(get('is_banned', False))),
+}
+USER_FLAGS = ('active', 'is_banned')
+
+_keys_by_model = {}
+for _key, (_model, _predicate) in COUNTERS.items():
+    _keys_by_model.setdefault(_model, []).append(_key)
+_models_by_table = {model.__table__: model for model in _keys_by_model}
+
+
+def _counted(model, get):
+    return {key: 1 for key in _keys_by_model[model] if COUNTERS[key][1](get)}
+
+
+def aggregate(session=None):
+    """Every counter, and ``locked_users``, from one query over the counted tables"""
+    session = session or db.session
+    users = select(
+        func.count().label('total_users'),
+        func.count(case((and_(User.active.is_(True), User.is_banned.is_(False)), 1))).label('active_users'),
+        func.count(case((User.is_banned.is_(True), 1))).label('banned_users'),
+        func.count(case((User.lockout_until > datetime.utcnow(), 1))).label('locked_users'),
+    ).subquery()
+    totals = [
+        select(func.count()).select_from(model).scalar_subquery().label(key)
+        for key, (model, _) in COUNTERS.items() if key.startswith('total_') and model is not User
+    ]
+    row = session.execute(select(users, *totals)).mappings().one()
+    return dict(row)
+
+
+class DashboardStats:
+    def __init__(self):
+        self.ttl = 10
+        self._cached = None  # (counts, monotonic time read)
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.ttl = app.config.get('STATS_CACHE_TTL', 10)
+
+    def get(self):
+        """``{counter: value}`` for the dashboard, at most ``STATS_CACHE_TTL`` seconds old"""
+        with self._lock:
+            if self._cached and time.monotonic() - self._cached[1] < self.ttl:
+                return dict(self._cached[0])
+
+        locked = (
+            select(literal('locked_users'), func.count())
+            .select_from(User)
+            .where(User.lockout_until > datetime.utcnow())
+        )
+        counts = dict(db.session.execute(union_all(select(StatCounter.key, StatCounter.value), locked)).all())
+        if any(key not in counts for key in COUNTERS):
+            counts = self._seed()
+
+        with self._lock:
+            self._cached = (counts, time.monotonic())
+        return dict(counts)
+
+    def _seed(self):
+        # A private session, so a read never commits the request's transaction
+        with Session(db.engine) as session:
+            counts = aggregate(session)
+            stored = set(session.execute(select(StatCounter.key)).scalars())
+            try:
+                session.execute(insert(StatCounter), [
+                    {'key': key, 'value': counts[key]} for key in COUNTERS if key not in stored
+                ])
+                session.commit()
+            except IntegrityError:
+                # Another worker seeded them first
+                session.rollback()
+        return counts
+
+    def clear(self):
+        with self._lock:
+            self._cached = None
+
+
+dashboard_stats = DashboardStats()
+
+
+@tasks.periodic('stats-reconcile', 'STATS_RECONCILE_INTERVAL', 3600)
+def reconcile():
+    """Reset drifted counters from the aggregate query. Returns the keys corrected."""
+    counts = aggregate()
+    stored = dict(db.session.execute(select(StatCounter.key, StatCounter.value)).all())
+    drifted = [key for key in COUNTERS if stored.get(key) != counts[key]]
+    for key in drifted:
+        db.session.merge(StatCounter(key=key, value=counts[key]))
+    db.session.commit()
+    if drifted:
+        dashboard_stats.clear()
+    return drifted
+
+
+# Write side
+
+def _apply(connection, deltas):
+    table = StatCounter.__table__
+    changes = [
+        {'b_key': key, 'b_delta': delta}
+        for key, delta in sorted(deltas.items()) if delta
+    ]
+    if changes:
+        connection.execute(
+            update(table)
+            .where(table.c.key == bindparam('b_key'))
+            .values(value=table.c.value + bindparam('b_delta')),
+            changes
+        )
+
+
+def _forget(connection, keys):
+    """Drop counters whose change cannot be sized; the next read recomputes them"""
+    table = StatCounter.__table__
+    connection.execute(delete(table).where(table.c.key.in_(keys)))
+
+
+def _previous(obj, name):
+    history = inspect(obj).attrs[name].history
+    if history.deleted:
+        return history.deleted[0]
+    if history.unchanged:
+        return history.unchanged[0]
+    return getattr(obj, name)
+
+
+@event.listens_for(Session, 'after_flush')
+def _count_flushed(session, flush_context):
+    deltas = {}
+
+    def add(model, get, sign):
+        for key, count in _counted(model, get).items():
+            deltas[key] = deltas.get(key, 0) + sign * count
+
+    for sign, objs in ((1, session.new), (-1, session.deleted)):
+        for obj in objs:
+            model = type(obj)
+            if model in _keys_by_model:
+                add(model, lambda name, default, obj=obj: getattr(obj, name), sign)
+
+    for obj in session.dirty:
+        if isinstance(obj, User) and any(inspect(obj).attrs[name].history.has_changes() for name in USER_FLAGS):
+            add(User, lambda name, default, obj=obj: _previous(obj, name), -1)
+            add(User, lambda name, default, obj=obj: getattr(obj, name), 1)
+
+    if any(deltas.values()):
+        _apply(session.connection(), deltas)
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _count_bulk(orm_execute_state):
+    if not (orm_execute_state.is_insert or orm_execute_state.is_delete):
+        return None
+    model = _models_by_table.get(getattr(orm_execute_state.statement, 'table', None))
+    if model is None:
+        return None
+    connection = orm_execute_state.session.connection()
+
+    if orm_execute_state.is_insert:
+        rows = orm_execute_state.parameters
+        if isinstance(rows, dict):
+            rows = [rows]
+        if not rows:
+            # INSERT ... VALUES or ... FROM SELECT: the rows are not known here
+            _forget(connection, _keys_by_model[model])
+            return None
+        deltas = {}
+        for row in rows:
+            for key, count in _counted(model, row.get).items():
+                deltas[key] = deltas.get(key, 0) + count
+        _apply(connection, deltas)
+        return None
+
+    result = orm_execute_state.invoke_statement()
+    removed = getattr(result, 'rowcount', -1)
+    if model is User or removed is None or removed < 0:
+        # Which flags the deleted users had is unknown
+        _forget(connection, _keys_by_model[model])
+    else:
+        _apply(connection, {key: -removed for key in _keys_by_model[model]})
+    return result
@@ -0,0 +1,107 @@
+# lotusrpg/tasks.py
+"""Periodic background jobs run by a daemon thread in each app process.
+
+Threads start with the first request a process serves, so CLI commands and
+pre-fork master processes never run them. Every run of a shared job first
+claims a lease row in the ``revision`` table, so with several workers each
+job still runs about once per interval. Per-process jobs (flushing state
+held in the worker) skip the lease and also run once more at exit.
+"""
+import atexit
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
+
+from lotusrpg.models import Revision, db
+
+logger = logging.getLogger(__name__)
+
+_jobs = {}  # name -> (function, interval config key, default interval, per process)
+
+
+def periodic(name, interval_key, default_interval, per_process=False):
+    """Register the decorated function as a periodic job"""
+    def decorator(fn):
+        _jobs[name] = (fn, interval_key, default_interval, per_process)
+        return fn
+    return decorator
+
+
+def claim(name, interval):
+    """Take the lease for one run of ``name``; False if another process ran it recently"""
+    key = f'task:{name}'
+    now = datetime.utcnow()
+    # Allow some timer jitter between workers
+    cutoff = now - timedelta(seconds=interval * 0.9)
+    claimed = db.session.execute(
+        update(Revision)
+        .where(Revision.key == key, Revision.updated_at <= cutoff)
+        .values(version=Revision.version + 1, updated_at=now)
+    ).rowcount
+    if not claimed and db.session.get(Revision, key) is None:
+        try:
+            with db.session.begin_nested():
+                db.session.add(Revision(key=key, version=1, updated_at=now))
+            claimed = True
+        except IntegrityError:
+            claimed = False
+    db.session.commit()
+    return bool(claimed)
+
+
+def run_job(name):
+    """Run a registered job once in the current app context"""
+    fn = _jobs[name][0]
+    return fn()
+
+
+def _run(app, name, fn, interval, per_process):
+    with app.app_context():
+        try:
+            if per_process or claim(name, interval):
+                fn()
+        except Exception:
+            logger.exception('Background job %s failed', name)
+            db.session.rollback()
+        finally:
+            db.session.remove()
+
+
+def _loop(app, name, fn, interval, per_process):
+    while True:
+        _run(app, name, fn, interval, per_process)
+        time.sleep(interval)
+
+
+def _run_at_exit(app):
+    for name, (fn, interval_key, default, per_process) in _jobs.items():
+        if per_process:
+            _run(app, name, fn, app.config.get(interval_key, default), per_process)
+
+
+def init_app(app):
+    """Start the registered jobs with the first request unless ``BACKGROUND_TASKS`` is off"""
+    if not app.config.get('BACKGROUND_TASKS', True):
+        return
+    started = []
+    lock = threading.Lock()
+
+    @app.before_request
+    def start_background_tasks():
+        if started:
+            return
+        with lock:
+            if started:
+                return
+            started.append(True)
+            for name, (fn, interval_key, default, per_process) in _jobs.items():
+                interval = app.config.get(interval_key, default)
+                threading.Thread(
+                    target=_loop, args=(app, name, fn, interval, per_process),
+                    name=f'lotusrpg-{name}', daemon=True
+                ).start()
+            atexit.register(_run_at_exit, app)
@@ -0,0 +1,212 @@
+# lotusrpg/tokens.py
+"""Stateless bearer tokens for API clients that do not want a session.
+
+Logging in with ``mode=token`` returns a short-lived access token and a
+longer-lived refresh token, both signed with ``SECRET_KEY``. Access tokens
+are checked on each request without touching the database: the signature
+and age are verified, the user comes from the identity cache, and the
+token id is looked up in a Bloom filter of revoked ids. Only a filter hit,
+which means a revoked token or a rare false positive, is confirmed against
+the ``revoked_token`` table.
+
+Revoking a token inserts a row and bumps the ``tokens`` revision. Every
+worker rebuilds its filter from the table when the revision moves.
+"""
+import hashlib
+import math
+import secrets
+import threading
+from datetime import datetime, timedelta
+
+from flask import current_app
+from flask_security.utils import get_request_attr, set_request_attr
+from itsdangerous import BadSignature, SignatureExpired, URLSafeTimedSerializer
+from sqlalchemy import delete, select
+from sqlalchemy.exc import IntegrityError
+
+from lotusrpg import revisions, tasks
+from lotusrpg.identity import identity_cache
+from lotusrpg.models import RevokedToken, db
+from lotusrpg.revisions import RevisionTracker
+
+TOKENS_KEY = 'tokens'
+ACCESS = 'access'
+REFRESH = 'refresh'
+
+
+class TokenError(ValueError):
+    """Raised for tokens that are malformed, expired, revoked or of the wrong kind"""
+
+
+class BloomFilter:
+    """Fixed-size set membership with false positives but no false negatives"""
+
+    def __init__(self, capacity, error_rate):
+        capacity = max(1, capacity)
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item):
+        digest = hashlib.blake2b(item.encode('utf-8'), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'big')
+        second = int.from_bytes(digest[8:], 'big') | 1
+        return [(first + i * second) % self.size for i in range(self.hashes)]
+
+    def add(self, item):
+        for position in self._positions(item):
+            self._bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item):
+        return all(self._bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+
+class RevocationFilter:
+    """Revoked token ids of this worker, rebuilt when another worker revokes one"""
+
+    def __init__(self):
+        self._tracker = RevisionTracker(TOKENS_KEY)
+        self._filter = None
+        self._lock = threading.Lock()
+
+    def _settings(self):
+        config = current_app.config
+        return config.get('TOKEN_FILTER_CAPACITY', 100000), config.get('TOKEN_FILTER_ERROR_RATE', 0.01)
+
+    def rebuild(self):
+        with self._lock:
+            versions = self._tracker.snapshot()
+            jtis = db.session.execute(
+                select(RevokedToken.jti).where(RevokedToken.expires_at > datetime.utcnow())
+            ).scalars().all()
+            capacity, error_rate = self._settings()
+            bloom = BloomFilter(max(capacity, 2 * len(jtis)), error_rate)
+            for jti in jtis:
+                bloom.add(jti)
+            self._filter = bloom
+            self._tracker.mark_built(versions)
+
+    def ensure_current(self):
+        if self._filter is None or not self._tracker.is_current():
+            self.rebuild()
+
+    def is_revoked(self, jti):
+        self.ensure_current()
+        if jti not in self._filter:
+            return False
+        return db.session.execute(
+            select(RevokedToken.id).where(RevokedToken.jti == jti)
+        ).first() is not None
+
+    def revoked(self, jti, version):
+        """Add a token revoked by this worker; call after commit with the version ``revoke`` returned"""
+        with self._lock:
+            if self._filter is not None:
+                self._filter.add(jti)
+            self._tracker.advance(TOKENS_KEY, version)
+
+
+revocations = RevocationFilter()
+
+
+def _serializer(kind):
+    return URLSafeTimedSerializer(current_app.config['SECRET_KEY'], salt=f'lotusrpg-{kind}-token')
+
+
+def ttl(kind):
+    if kind == ACCESS:
+        return current_app.config.get('TOKEN_ACCESS_TTL', 900)
+    return current_app.config.get('TOKEN_REFRESH_TTL', 14 * 86400)
+
+
+def issue(user, kind=ACCESS):
+    return _serializer(kind).dumps({'sub': user.fs_uniquifier, 'jti': secrets.token_hex(12)})
+
+
+def issue_pair(user):
+    """Token fields for a login or refresh response"""
+    return {
+        'access_token': issue(user, ACCESS),
+        'refresh_token': issue(user, REFRESH),
+        'token_type': 'Bearer',
+        'expires_in': ttl(ACCESS),
+    }
+
+
+def decode(token, kind=ACCESS):
+    """Return ``(claims, expires_at)`` of a valid, unrevoked token"""
+    try:
+        claims, issued_at = _serializer(kind).loads(token, max_age=ttl(kind), return_timestamp=True)
+    except SignatureExpired:
+        raise TokenError('Token expired')
+    except BadSignature:
+        raise TokenError('Invalid token')
+    if not isinstance(claims, dict) or 'sub' not in claims or 'jti' not in claims:
+        raise TokenError('Invalid token')
+    if revocations.is_revoked(claims['jti']):
+        raise TokenError('Token revoked')
+    expires_at = issued_at.replace(tzinfo=None) + timedelta(seconds=ttl(kind))
+    return claims, expires_at
+
+
+def load_user(claims):
+    """The active user a token was issued to, or None"""
+    user = identity_cache.load(claims['sub'])
+    if user is None or not user.active or user.is_banned:
+        return None
+    return user
+
+
+def revoke(jti, expires_at):
+    """Record a revoked token; the caller commits, then calls ``revocations.revoked``.
+
+    Returns the new ``tokens`` revision, or None if the token was already
+    revoked (e.g. a refresh token replayed concurrently).
+    """
+    try:
+        with db.session.begin_nested():
+            db.session.add(RevokedToken(jti=jti, expires_at=expires_at))
+    except IntegrityError:
+        return None
+    return revisions.bump(TOKENS_KEY)
+
+
+@tasks.periodic('token-purge', 'TOKEN_PURGE_INTERVAL', 3600)
+def purge():
+    """Drop revocations of tokens that have expired anyway. Returns the number removed."""
+    removed = db.session.execute(
+        delete(RevokedToken).where(RevokedToken.expires_at <= datetime.utcnow())
+    ).rowcount
+    db.session.commit()
+    return removed
+
+
+def _bearer(request):
+    header = request.headers.get('Authorization', '')
+    scheme, _, token = header.partition(' ')
+    return token.strip() if scheme.lower() == 'bearer' and token.strip() else None
+
+
+def init_app(app, security):
+    """Accept ``Authorization: Bearer`` access tokens ahead of Flask-Security's own token loader"""
+    login_manager = security.login_manager
+    fallback = login_manager.request_callback
+
+    def request_loader(request):
+        if get_request_attr('fs_bearer_user') is not None:
+            return get_request_attr('fs_bearer_user')
+        token = _bearer(request)
+        if token is None:
+            return fallback(request) if fallback else None
+        try:
+            claims, _expires_at = decode(token)
+        except TokenError:
+            return None
+        user = load_user(claims)
+        if user is not None:
+            set_request_attr('fs_authn_via', 'token')
+            set_request_attr('fs_bearer_user', user)
+            set_request_attr('fs_bearer_claims', claims)
+        return user
+
+    login_manager.request_loader(request_loader)
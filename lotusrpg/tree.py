@@ -0,0 +1,78 @@
+# lotusrpg/tree.py
+"""Materialized-path helpers shared by self-referencing models.
+
+A node's path is its ancestors' ids followed by its own, each zero-padded
+and terminated by '/', e.g. ``0000000003/0000000017/``. Paths sort in
+depth-first order, and a subtree is a contiguous range of an ordinary
+B-tree index.
+"""
+
+SEGMENT_WIDTH = 10
+
+
+def segment(node_id):
+    return f'{node_id:0{SEGMENT_WIDTH}d}/'
+
+
+def child_path(parent_path, node_id):
+    return (parent_path or '') + segment(node_id)
+
+
+def ancestor_ids(path):
+    """Ids along ``path``, root first, excluding the node itself"""
+    return [int(part) for part in path.split('/')[:-2]]
+
+
+def depth(path):
+    return path.count('/') - 1
+
+
+def subtree_range(path):
+    """``(low, high)`` bounds such that ``low <= p < high`` selects the subtree of ``path``"""
+    # '0' is the character right after '/', so it bounds every descendant path
+    return path, path[:-1] + '0'
+
+
+def within(column, path):
+    """SQL condition selecting ``path`` and all of its descendants"""
+    low, high = subtree_range(path)
+    return (column >= low) & (column < high)
+
+
+def parent_path(path):
+    return path[:-(SEGMENT_WIDTH + 1)]
+
+
+def resolve_paths(parents):
+    """Compute every node's path from a ``{node_id: parent_id}`` mapping.
+
+    Dangling or cyclic parents are treated as roots.
+    """
+    paths = {}
+
+    def resolve(node_id, seen=()):
+        if node_id in paths:
+            return paths[node_id]
+        parent_id = parents.get(node_id)
+        if parent_id not in parents or parent_id in seen or parent_id == node_id:
+            path = segment(node_id)
+        else:
+            path = child_path(resolve(parent_id, seen + (node_id,)), node_id)
+        paths[node_id] = path
+        return path
+
+    for node_id in parents:
+        resolve(node_id)
+    return paths
+
+
+def descendant_counts(paths):
+    """``{path: number of descendants}`` for an iterable of paths"""
+    counts = dict.fromkeys(paths, 0)
+    for path in counts:
+        ancestor = parent_path(path)
+        while ancestor:
+            if ancestor in counts:
+                counts[ancestor] += 1
+            ancestor = parent_path(ancestor)
+    return counts
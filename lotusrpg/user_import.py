@@ -0,0 +1,179 @@
+# lotusrpg/user_import.py
+"""Bulk import of user accounts from CSV or JSON Lines files.
+
+Registering users one by one costs two uniqueness queries, a bcrypt hash
+and a commit each. Here existing emails and usernames are read once into
+sets, records are validated and de-duplicated against them in memory, a
+whole batch of passwords is hashed across the password pool at once, and
+users and their role links go in as multi-row inserts with one commit per
+batch. An interrupted import can simply be run again: users already
+imported are skipped as duplicates.
+
+Each record has ``email``, ``username`` and either ``password`` or
+``password_hash``, a hash from a Flask-Security install with the same
+``SECURITY_PASSWORD_SALT``. ``roles`` (a list, or a ``;``-separated string
+in CSV) and ``active`` are optional.
+"""
+import csv
+import json
+import time
+import uuid
+
+from marshmallow import ValidationError
+from sqlalchemy import func, insert, select
+
+from lotusrpg.models import Role, User, db, roles_users
+from lotusrpg.passwords import hasher
+from lotusrpg.schemas import UserImportSchema
+
+BATCH_SIZE = 1000
+
+
+class UserImportError(ValueError):
+    """Raised for unreadable files and unknown default roles"""
+
+
+class ImportStats:
+    def __init__(self):
+        self.read = 0
+        self.imported = 0
+        self.duplicates = 0
+        self.invalid = 0
+        self.started = time.monotonic()
+
+    @property
+    def rate(self):
+        elapsed = time.monotonic() - self.started
+        return self.imported / elapsed if elapsed > 0 else 0.0
+
+
+def read_records(path):
+    """Yield ``(line number, record dict)`` from a ``.csv`` or ``.jsonl``/``.ndjson`` file"""
+    lower = path.lower()
+    if lower.endswith('.csv'):
+        with open(path, newline='', encoding='utf-8-sig') as f:
+            reader = csv.DictReader(f)
+            for row in reader:
+                record = {key.strip(): value.strip() for key, value in row.items() if key and value}
+                if 'roles' in record:
+                    record['roles'] = [name.strip() for name in record['roles'].split(';') if name.strip()]
+                yield reader.line_num, record
+    elif lower.endswith(('.jsonl', '.ndjson')):
+        with open(path, encoding='utf-8') as f:
+            for line_number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError as e:
+                    record = {'_error': f'invalid JSON: {e}'}
+                yield line_number, record if isinstance(record, dict) else {'_error': 'not an object'}
+    else:
+        raise UserImportError('Use a .csv, .jsonl or .ndjson file')
+
+
+class UserImporter:
+    """Validates, hashes and inserts records in batches.
+
+    ``on_error(line number, message)`` is called for every rejected record
+    and ``on_batch(stats)`` after every committed batch.
+    """
+
+    def __init__(self, batch_size=BATCH_SIZE, default_roles=(), dry_run=False, on_error=None, on_batch=None):
+        self.batch_size = batch_size
+        self.default_roles = list(default_roles)
+        self.dry_run = dry_run
+        self.on_error = on_error or (lambda line_number, message: None)
+        self.on_batch = on_batch or (lambda stats: None)
+        self.stats = ImportStats()
+        self._schema = UserImportSchema()
+        # Lowercased, so accounts differing only in case count as duplicates
+        self._emails = set(db.session.execute(select(func.lower(User.email))).scalars())
+        self._usernames = set(db.session.execute(select(func.lower(User.username))).scalars())
+        self._role_ids = dict(db.session.execute(select(Role.name, Role.id)).all())
+        missing = [name for name in self.default_roles if name not in self._role_ids]
+        if missing:
+            raise UserImportError(f"Unknown role {', '.join(missing)}")
+
+    def run(self, records):
+        batch = []
+        for line_number, record in records:
+            self.stats.read += 1
+            row = self._accept(line_number, record)
+            if row is None:
+                continue
+            batch.append(row)
+            if len(batch) >= self.batch_size:
+                self._flush(batch)
+                batch = []
+        if batch:
+            self._flush(batch)
+        return self.stats
+
+    def _reject(self, line_number, message, duplicate=False):
+        if duplicate:
+            self.stats.duplicates += 1
+        else:
+            self.stats.invalid += 1
+        self.on_error(line_number, message)
+
+    def _accept(self, line_number, record):
+        if '_error' in record:
+            return self._reject(line_number, record['_error'])
+        try:
+            data = self._schema.load(record)
+        except ValidationError as e:
+            return self._reject(line_number, '; '.join(
+                f"{key}: {' '.join(messages) if isinstance(messages, list) else messages}"
+                for key, messages in e.messages.items()
+            ))
+
+        if data.get('password_hash') is not None:
+            # plaintext identifies anything, so it never counts as a hash
+            if hasher.identify(data['password_hash']) in (None, 'plaintext'):
+                return self._reject(line_number, 'password_hash: not a supported hash')
+        unknown = [name for name in data.get('roles', []) if name not in self._role_ids]
+        if unknown:
+            return self._reject(line_number, f"roles: unknown role {', '.join(unknown)}")
+
+        email, username = data['email'].lower(), data['username'].lower()
+        if email in self._emails:
+            return self._reject(line_number, f"email {data['email']} already exists", duplicate=True)
+        if username in self._usernames:
+            return self._reject(line_number, f"username {data['username']} already exists", duplicate=True)
+        self._emails.add(email)
+        self._usernames.add(username)
+        return data
+
+    def _flush(self, batch):
+        if self.dry_run:
+            self.stats.imported += len(batch)
+            self.on_batch(self.stats)
+            return
+
+        to_hash = [row for row in batch if row.get('password_hash') is None]
+        for row, password_hash in zip(to_hash, hasher.hash_many([row['password'] for row in to_hash])):
+            row['password_hash'] = password_hash
+
+        user_ids = db.session.execute(
+            insert(User).returning(User.id, sort_by_parameter_order=True),
+            [{
+                'email': row['email'],
+                'username': row['username'],
+                'password': row['password_hash'],
+                'fs_uniquifier': uuid.uuid4().hex,
+                'active': row.get('active', True),
+            } for row in batch]
+        ).scalars().all()
+
+        links = [
+            {'user_id': user_id, 'role_id': self._role_ids[name]}
+            for user_id, row in zip(user_ids, batch)
+            for name in dict.fromkeys(self.default_roles + row.get('roles', []))
+        ]
+        if links:
+            db.session.execute(insert(roles_users), links)
+        db.session.commit()
+
+        self.stats.imported += len(batch)
+        self.on_batch(self.stats)
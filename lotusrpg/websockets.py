@@ -2,6 +2,7 @@
 from flask_socketio import SocketIO, emit, join_room, leave_room, rooms
 from flask_security import current_user
 from functools import wraps
+from lotusrpg.ratelimit import Limit, limit_socket
 
 socketio = SocketIO(cors_allowed_origins="*")
 
@@ -19,6 +20,8 @@ def authenticated_only(f):
 def on_connect():
     """Handle client connection"""
     if current_user.is_authenticated:
+        # Every connection of a user shares a room for personal notifications
+        join_room(f'user_{current_user.id}')
         emit('connected', {
             'message': 'Connected successfully',
             'user': {
@@ -79,9 +82,14 @@ def notify_comment_update(comment_data, post_id):
     """Notify users of comment updates"""
     socketio.emit('comment_updated', comment_data, room=f'post_{post_id}')
 
+def notify_user(user_id, event, data):
+    """Notify every connection of one user"""
+    socketio.emit(event, data, room=f'user_{user_id}')
+
 # Dice rolling real-time
 @socketio.on('roll_dice')
 @authenticated_only
+@limit_socket(Limit('30/minute', per='user', burst=10))
 def on_roll_dice(data):
     """Handle real-time dice rolling"""
     import random
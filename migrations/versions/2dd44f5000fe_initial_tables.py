@@ -0,0 +1,116 @@
+"""Initial tables
+
+The schema create_tables.py produced before migrations were added.
+
+Revision ID: 2dd44f5000fe
+Revises: 
+Create Date: 2026-10-17 00:46:31.704608
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2dd44f5000fe'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('role',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=80), nullable=True),
+    sa.Column('description', sa.String(length=255), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('name')
+    )
+    op.create_table('section',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('title', sa.String(length=255), nullable=False),
+    sa.Column('slug', sa.String(length=255), nullable=False),
+    sa.Column('parent_id', sa.Integer(), nullable=True),
+    sa.Column('chapter', sa.String(length=255), nullable=False),
+    sa.Column('rulebook', sa.String(length=50), nullable=False),
+    sa.ForeignKeyConstraint(['parent_id'], ['section.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('slug')
+    )
+    op.create_table('user',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('email', sa.String(length=120), nullable=False),
+    sa.Column('username', sa.String(length=20), nullable=False),
+    sa.Column('password', sa.String(length=255), nullable=False),
+    sa.Column('active', sa.Boolean(), nullable=True),
+    sa.Column('fs_uniquifier', sa.String(length=255), nullable=False),
+    sa.Column('confirmed_at', sa.DateTime(), nullable=True),
+    sa.Column('image_file', sa.String(length=20), nullable=False),
+    sa.Column('is_banned', sa.Boolean(), nullable=True),
+    sa.Column('last_login_at', sa.DateTime(), nullable=True),
+    sa.Column('current_login_at', sa.DateTime(), nullable=True),
+    sa.Column('last_login_ip', sa.String(length=100), nullable=True),
+    sa.Column('current_login_ip', sa.String(length=100), nullable=True),
+    sa.Column('login_count', sa.Integer(), nullable=True),
+    sa.Column('failed_login_attempts', sa.Integer(), nullable=True),
+    sa.Column('lockout_until', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('email'),
+    sa.UniqueConstraint('fs_uniquifier'),
+    sa.UniqueConstraint('username')
+    )
+    op.create_table('content',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('section_id', sa.Integer(), nullable=False),
+    sa.Column('content_type', sa.Enum('heading', 'subheading', 'paragraph', 'table', 'list', 'image', 'container', 'link', name='content_types'), nullable=False),
+    sa.Column('content_order', sa.Integer(), nullable=False),
+    sa.Column('content_data', sa.JSON(), nullable=False),
+    sa.Column('style_class', sa.String(length=255), nullable=True),
+    sa.ForeignKeyConstraint(['section_id'], ['section.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('image',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('file_path', sa.String(length=255), nullable=False),
+    sa.Column('alt_text', sa.String(length=255), nullable=True),
+    sa.Column('class_name', sa.String(length=255), nullable=True),
+    sa.Column('section_id', sa.Integer(), nullable=True),
+    sa.ForeignKeyConstraint(['section_id'], ['section.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('post',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('title', sa.String(length=100), nullable=False),
+    sa.Column('date_posted', sa.DateTime(), nullable=False),
+    sa.Column('content', sa.Text(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('roles_users',
+    sa.Column('user_id', sa.Integer(), nullable=True),
+    sa.Column('role_id', sa.Integer(), nullable=True),
+    sa.ForeignKeyConstraint(['role_id'], ['role.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], )
+    )
+    op.create_table('comment',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('content', sa.Text(), nullable=False),
+    sa.Column('date_posted', sa.DateTime(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('post_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['post_id'], ['post.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade():
+    op.drop_table('comment')
+    op.drop_table('roles_users')
+    op.drop_table('post')
+    op.drop_table('image')
+    op.drop_table('content')
+    op.drop_table('user')
+    op.drop_table('section')
+    op.drop_table('role')
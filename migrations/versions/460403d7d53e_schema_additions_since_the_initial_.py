@@ -0,0 +1,205 @@
+"""Schema additions since the initial tables
+
+Databases created by create_tables.py before migrations existed are at
+2dd44f5000fe: run ``flask db stamp 2dd44f5000fe`` once, then upgrade.
+
+New columns on existing rows are filled as follows:
+- Post.comment_count and Post.last_activity_at are backfilled here from the
+  comments.
+- Section and comment paths, reply counts, hot scores and image hashes are
+  filled in by the app or its maintenance commands (see the README).
+
+Revision ID: 460403d7d53e
+Revises: 2dd44f5000fe
+Create Date: 2026-10-17 00:46:18.973097
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '460403d7d53e'
+down_revision = '2dd44f5000fe'
+branch_labels = None
+depends_on = None
+
+
+def _binary_string(length):
+    # Compared bytewise for prefix ranges; see lotusrpg.models.binary_string
+    return (
+        sa.String(length=length)
+        .with_variant(sa.String(length=length, collation='C'), 'postgresql')
+        .with_variant(sa.String(length=length, collation='utf8mb4_bin'), 'mysql', 'mariadb')
+    )
+
+
+def _path_type():
+    return _binary_string(1024)
+
+
+def upgrade():
+    op.create_table('image_variant',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('source_hash', sa.String(length=64), nullable=False),
+    sa.Column('format', sa.String(length=10), nullable=False),
+    sa.Column('width', sa.Integer(), nullable=False),
+    sa.Column('height', sa.Integer(), nullable=False),
+    sa.Column('file_name', sa.String(length=255), nullable=False),
+    sa.Column('file_size', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('source_hash', 'format', 'width')
+    )
+    with op.batch_alter_table('image_variant', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_image_variant_source_hash'), ['source_hash'], unique=False)
+
+    op.create_table('revision',
+    sa.Column('key', _binary_string(100), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('key')
+    )
+    with op.batch_alter_table('revision', schema=None) as batch_op:
+        batch_op.create_index('ix_revision_key_updated_at', ['key', 'updated_at'], unique=False)
+
+    op.create_table('revoked_token',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('jti', sa.String(length=32), nullable=False),
+    sa.Column('expires_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('jti')
+    )
+    with op.batch_alter_table('revoked_token', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_revoked_token_expires_at'), ['expires_at'], unique=False)
+
+    op.create_table('section_snapshot',
+    sa.Column('section_id', sa.Integer(), nullable=False),
+    sa.Column('rulebook', sa.String(length=50), nullable=False),
+    sa.Column('slug', sa.String(length=255), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.Column('content_hash', sa.String(length=64), nullable=False),
+    sa.Column('payload', sa.Text(), nullable=False),
+    sa.Column('deleted', sa.Boolean(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('section_id', 'rulebook')
+    )
+    with op.batch_alter_table('section_snapshot', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_section_snapshot_slug'), ['slug'], unique=False)
+        batch_op.create_index(batch_op.f('ix_section_snapshot_version'), ['version'], unique=False)
+
+    op.create_table('stat_counter',
+    sa.Column('key', sa.String(length=50), nullable=False),
+    sa.Column('value', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('key')
+    )
+    op.create_table('post_read',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('post_id', sa.Integer(), nullable=False),
+    sa.Column('last_comment_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['post_id'], ['post.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('user_id', 'post_id')
+    )
+    with op.batch_alter_table('comment', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('parent_id', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('path', _path_type(), nullable=True))
+        batch_op.add_column(sa.Column('reply_count', sa.Integer(), server_default='0', nullable=False))
+        batch_op.create_index('ix_comment_post_id_path', ['post_id', 'path'], unique=False)
+        batch_op.create_foreign_key('fk_comment_parent_id_comment', 'comment', ['parent_id'], ['id'])
+
+    with op.batch_alter_table('image', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('content_hash', sa.String(length=64), nullable=True))
+        batch_op.add_column(sa.Column('width', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('height', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('variant_status', sa.String(length=10), nullable=True))
+        batch_op.create_index(batch_op.f('ix_image_content_hash'), ['content_hash'], unique=False)
+
+    with op.batch_alter_table('post', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('comment_count', sa.Integer(), server_default='0', nullable=False))
+        # Nullable until the existing rows are backfilled below
+        batch_op.add_column(sa.Column('last_activity_at', sa.DateTime(), nullable=True))
+        batch_op.add_column(sa.Column('hot_score', sa.Float(), server_default='0', nullable=False))
+        batch_op.create_index('ix_post_date_posted_id', ['date_posted', 'id'], unique=False)
+        batch_op.create_index('ix_post_hot_score_id', ['hot_score', 'id'], unique=False)
+        batch_op.create_index('ix_post_user_id_date_posted_id', ['user_id', 'date_posted', 'id'], unique=False)
+
+    op.execute(
+        'UPDATE post SET '
+        'comment_count = (SELECT COUNT(*) FROM comment WHERE comment.post_id = post.id), '
+        'last_activity_at = COALESCE('
+        '(SELECT MAX(comment.date_posted) FROM comment WHERE comment.post_id = post.id), post.date_posted)'
+    )
+    with op.batch_alter_table('post', schema=None) as batch_op:
+        batch_op.alter_column('last_activity_at', existing_type=sa.DateTime(), nullable=False)
+        batch_op.create_index('ix_post_last_activity_at_id', ['last_activity_at', 'id'], unique=False)
+
+    with op.batch_alter_table('section', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('path', _path_type(), nullable=True))
+        batch_op.create_index(batch_op.f('ix_section_path'), ['path'], unique=False)
+
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('avatar_hash', sa.String(length=64), nullable=True))
+        batch_op.add_column(sa.Column('avatar_status', sa.String(length=10), nullable=True))
+        batch_op.alter_column('image_file',
+               existing_type=sa.VARCHAR(length=20),
+               type_=sa.String(length=100),
+               existing_nullable=False)
+        batch_op.create_index(batch_op.f('ix_user_lockout_until'), ['lockout_until'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_user_lockout_until'))
+        batch_op.alter_column('image_file',
+               existing_type=sa.String(length=100),
+               type_=sa.VARCHAR(length=20),
+               existing_nullable=False)
+        batch_op.drop_column('avatar_status')
+        batch_op.drop_column('avatar_hash')
+
+    with op.batch_alter_table('section', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_section_path'))
+        batch_op.drop_column('path')
+
+    with op.batch_alter_table('post', schema=None) as batch_op:
+        batch_op.drop_index('ix_post_user_id_date_posted_id')
+        batch_op.drop_index('ix_post_last_activity_at_id')
+        batch_op.drop_index('ix_post_hot_score_id')
+        batch_op.drop_index('ix_post_date_posted_id')
+        batch_op.drop_column('hot_score')
+        batch_op.drop_column('last_activity_at')
+        batch_op.drop_column('comment_count')
+
+    with op.batch_alter_table('image', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_image_content_hash'))
+        batch_op.drop_column('variant_status')
+        batch_op.drop_column('height')
+        batch_op.drop_column('width')
+        batch_op.drop_column('content_hash')
+
+    with op.batch_alter_table('comment', schema=None) as batch_op:
+        batch_op.drop_constraint('fk_comment_parent_id_comment', type_='foreignkey')
+        batch_op.drop_index('ix_comment_post_id_path')
+        batch_op.drop_column('reply_count')
+        batch_op.drop_column('path')
+        batch_op.drop_column('parent_id')
+
+    op.drop_table('post_read')
+    op.drop_table('stat_counter')
+    with op.batch_alter_table('section_snapshot', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_section_snapshot_version'))
+        batch_op.drop_index(batch_op.f('ix_section_snapshot_slug'))
+
+    op.drop_table('section_snapshot')
+    with op.batch_alter_table('revoked_token', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_revoked_token_expires_at'))
+
+    op.drop_table('revoked_token')
+    with op.batch_alter_table('revision', schema=None) as batch_op:
+        batch_op.drop_index('ix_revision_key_updated_at')
+
+    op.drop_table('revision')
+    with op.batch_alter_table('image_variant', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_image_variant_source_hash'))
+
+    op.drop_table('image_variant')
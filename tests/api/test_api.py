@@ -77,6 +77,14 @@ class APITester:
         except Exception as e:
             print(f"❌ Core chapters failed: {e}")
         
+        # Test rulebook bundle
+        try:
+            response = self.session.get(f'{BASE_URL}/rules/core/bundle')
+            entries = len(response.text.splitlines()) - 1
+            print(f"✅ Core bundle: {response.status_code} - {entries} entries")
+        except Exception as e:
+            print(f"❌ Core bundle failed: {e}")
+        
         # Test sections list
         try:
             response = self.session.get(f'{BASE_URL}/rules/sections')
@@ -0,0 +1,48 @@
+# test_import_blocks.py - `flask rules import-blocks` keeps going past bad files
+import json
+
+from lotusrpg import create_app, db
+from lotusrpg.models import Content, Section
+
+
+class Config:
+    SECRET_KEY = 'test'
+    SECURITY_PASSWORD_SALT = 'test'
+    SQLALCHEMY_DATABASE_URI = 'sqlite://'
+    TESTING = True
+    BACKGROUND_TASKS = False
+    PASSWORD_WORKERS = 0
+    MEDIA_WORKERS = 0
+
+
+def test_bad_files_are_reported_and_skipped(tmp_path):
+    app = create_app(Config)
+    with app.app_context():
+        db.create_all()
+        for slug in ('alpha', 'beta', 'gamma', 'delta'):
+            db.session.add(Section(title=slug.title(), slug=slug, chapter='Basics', rulebook='core'))
+        db.session.commit()
+
+    good = tmp_path / 'alpha.json'
+    good.write_text(json.dumps([{'content_type': 'paragraph', 'content_data': {'text': 'Hello'}}]))
+    bad_json = tmp_path / 'beta.json'
+    bad_json.write_text('[{"content_type": "paragraph",')
+    markdown = tmp_path / 'gamma.md'
+    markdown.write_text('# Gamma\n\nSome text.\n')
+    bad_encoding = tmp_path / 'delta.md'
+    bad_encoding.write_bytes(b'# Delta\n\n\xff\xfe not UTF-8\n')
+
+    result = app.test_cli_runner().invoke(args=[
+        'rules', 'import-blocks', str(good), str(bad_json), str(markdown), str(bad_encoding),
+    ])
+
+    assert result.exit_code == 1
+    assert f'{bad_json}:' in result.output
+    assert f'{bad_encoding}:' in result.output
+    assert f'{markdown} -> gamma' in result.output
+    with app.app_context():
+        counts = {
+            slug: Content.query.join(Section).filter(Section.slug == slug).count()
+            for slug in ('alpha', 'beta', 'gamma', 'delta')
+        }
+    assert counts == {'alpha': 1, 'beta': 0, 'gamma': 2, 'delta': 0}
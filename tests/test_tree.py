@@ -0,0 +1,58 @@
+# test_tree.py - Materialized path ranges against sorted child paths
+from sqlalchemy import Column, Integer, MetaData, Table, create_engine, insert, select
+from sqlalchemy.dialects import mysql, postgresql
+from sqlalchemy.schema import CreateTable
+
+from lotusrpg import tree
+from lotusrpg.models import Comment, Section, path_type
+
+# node id -> parent id; ids chosen so decimal prefixes collide (1, 10, 11, 100)
+PARENTS = {1: None, 5: 1, 10: 1, 100: 10, 11: None, 2: 11, 3: None}
+
+
+def build_paths():
+    return tree.resolve_paths(PARENTS)
+
+
+def descendants(paths, node_id):
+    prefix = paths[node_id]
+    return {other for other, path in paths.items() if path.startswith(prefix)}
+
+
+def test_subtree_range_selects_exactly_the_subtree():
+    paths = build_paths()
+    ordered = sorted(paths.values())
+    for node_id, path in paths.items():
+        low, high = tree.subtree_range(path)
+        selected = {node for node, other in paths.items() if low <= other < high}
+        assert selected == descendants(paths, node_id)
+        # ...and the subtree is one contiguous run of the sorted paths
+        run = [other for other in ordered if low <= other < high]
+        start = ordered.index(run[0])
+        assert ordered[start:start + len(run)] == run
+
+
+def test_within_query_on_path_column():
+    paths = build_paths()
+    nodes = Table(
+        'nodes', MetaData(),
+        Column('id', Integer, primary_key=True),
+        Column('path', path_type()),
+    )
+    engine = create_engine('sqlite://')
+    nodes.metadata.create_all(engine)
+    with engine.begin() as connection:
+        connection.execute(insert(nodes), [{'id': node, 'path': path} for node, path in paths.items()])
+        for node_id, path in paths.items():
+            found = set(connection.execute(
+                select(nodes.c.id).where(tree.within(nodes.c.path, path))
+            ).scalars())
+            assert found == descendants(paths, node_id)
+
+
+def test_path_columns_are_binary_collated():
+    for model in (Section, Comment):
+        ddl = str(CreateTable(model.__table__).compile(dialect=postgresql.dialect()))
+        assert 'path VARCHAR(1024) COLLATE "C"' in ddl
+        ddl = str(CreateTable(model.__table__).compile(dialect=mysql.dialect()))
+        assert 'COLLATE utf8mb4_bin' in ddl